@@ -3,15 +3,23 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from werkzeug.utils import secure_filename
 import os
 import json
+import threading
+import time
+import uuid
 from datetime import datetime
 import google.generativeai as genai
 from PyPDF2 import PdfReader
 from docx import Document
 import io
 import base64
+from concurrent.futures import ThreadPoolExecutor
+
+from ingest import mapped
+from mapreduce import chunk_text, merge_field_results
 
 app = Flask(__name__)
 CORS(app)
@@ -28,6 +36,29 @@ os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'logos'), exist_ok=True)
 
 db = SQLAlchemy(app)
 
+# SQLite tuning, applied to every new connection (see init at the bottom)
+APP_SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('APP_SQLITE_BUSY_TIMEOUT_MS', '5000'))
+APP_SQLITE_CACHE_KB = int(os.getenv('APP_SQLITE_CACHE_KB', '20000'))
+# Record listing: default / largest page, and how long total counts are cached
+APP_RECORDS_PAGE_SIZE = int(os.getenv('APP_RECORDS_PAGE_SIZE', '50'))
+APP_RECORDS_MAX_PAGE_SIZE = int(os.getenv('APP_RECORDS_MAX_PAGE_SIZE', '500'))
+APP_RECORD_COUNT_TTL_SECONDS = float(os.getenv('APP_RECORD_COUNT_TTL_SECONDS', '30'))
+# Records written per transaction by the bulk import
+APP_IMPORT_BATCH_SIZE = int(os.getenv('APP_IMPORT_BATCH_SIZE', '500'))
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Tune each SQLite connection for concurrent reads during writes"""
+    cursor = dbapi_connection.cursor()
+    # WAL: readers keep working from the last commit while an upload writes
+    cursor.execute('PRAGMA journal_mode=WAL')
+    # With WAL, NORMAL only syncs at checkpoints and is still crash-safe
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    # Wait for a competing writer instead of failing with "database is locked"
+    cursor.execute(f'PRAGMA busy_timeout={APP_SQLITE_BUSY_TIMEOUT_MS}')
+    cursor.execute(f'PRAGMA cache_size=-{APP_SQLITE_CACHE_KB}')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.close()
+
 # Configure Gemini API
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', 'your-api-key-here')
 genai.configure(api_key=GEMINI_API_KEY)
@@ -42,7 +73,7 @@ class ProcurementRecord(db.Model):
     file_no = db.Column(db.String(100))
     ad_dates = db.Column(db.String(200))
     ship_to_address = db.Column(db.Text)
-    vendor_name = db.Column(db.String(300))
+    vendor_name = db.Column(db.String(300), index=True)
     remit_to_address = db.Column(db.Text)
     telephone_no = db.Column(db.String(50))
     federal_tax_id = db.Column(db.String(50))
@@ -53,10 +84,12 @@ class ProcurementRecord(db.Model):
     purchasing_phone = db.Column(db.String(50))
     purchasing_email = db.Column(db.String(200))
     bid_deadline = db.Column(db.String(200))
-    status = db.Column(db.String(20), default='draft')
+    status = db.Column(db.String(20), default='draft', index=True)
     document_path = db.Column(db.String(500))
     logo_path = db.Column(db.String(500))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # SQLite index entries end with the rowid (`id`), so this index also
+    # serves the (created_at, id) keyset ordering of /api/records
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     approved_at = db.Column(db.DateTime)
     
@@ -86,15 +119,85 @@ class ProcurementRecord(db.Model):
             'approvedAt': self.approved_at.isoformat() if self.approved_at else None
         }
 
+# Maps the API's camelCase fields to record columns
+RECORD_FIELD_COLUMNS = {
+    'title': 'title',
+    'fileNo': 'file_no',
+    'adDates': 'ad_dates',
+    'shipToAddress': 'ship_to_address',
+    'vendorName': 'vendor_name',
+    'remitToAddress': 'remit_to_address',
+    'telephoneNo': 'telephone_no',
+    'federalTaxId': 'federal_tax_id',
+    'authorizedSignature': 'authorized_signature',
+    'printedName': 'printed_name',
+    'purchasingAddress': 'purchasing_address',
+    'purchasingContactName': 'purchasing_contact_name',
+    'purchasingPhone': 'purchasing_phone',
+    'purchasingEmail': 'purchasing_email',
+    'bidDeadline': 'bid_deadline',
+}
+
+class RecordCountCache:
+    """
+    Total number of records (overall or per status) for paginated listings.
+
+    COUNT(*) scans the whole index, so counts are cached for
+    APP_RECORD_COUNT_TTL_SECONDS and dropped whenever this process writes
+    records; other processes' writes show up once the entry expires.
+    """
+
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def get(self, status=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._counts.get(status)
+            if entry is not None and now - entry[1] < self.ttl_seconds:
+                return entry[0]
+
+        query = db.session.query(db.func.count(ProcurementRecord.id))
+        if status:
+            query = query.filter(ProcurementRecord.status == status)
+        count = query.scalar()
+
+        with self._lock:
+            self._counts[status] = (count, now)
+        return count
+
+    def invalidate(self):
+        with self._lock:
+            self._counts.clear()
+
+record_counts = RecordCountCache(APP_RECORD_COUNT_TTL_SECONDS)
+
+def encode_cursor(record):
+    """Opaque cursor pointing just past `record` in (created_at, id) order"""
+    raw = json.dumps({'c': record.created_at.isoformat(), 'i': record.id})
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(raw['c']), int(raw['i'])
+    except Exception as e:
+        raise ValueError('Invalid cursor') from e
+
 # Helper Functions
 def extract_text_from_pdf(file_path):
     """Extract text from PDF file"""
     try:
-        reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        # Parse from a memory map of the saved upload rather than reading it into memory
+        with mapped(file_path) as view:
+            reader = PdfReader(view)
+            parts = []
+            for page in reader.pages:
+                parts.append(page.extract_text() + "\n")
+        return "".join(parts)
     except Exception as e:
         print(f"Error extracting PDF: {str(e)}")
         return None
@@ -109,12 +212,21 @@ def extract_text_from_docx(file_path):
         print(f"Error extracting DOCX: {str(e)}")
         return None
 
-def extract_with_gemini(text):
-    """Extract structured data using Gemini API"""
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        prompt = f"""
+APP_FIELD_KEYS = [
+    "title", "fileNo", "adDates", "shipToAddress", "vendorName",
+    "remitToAddress", "telephoneNo", "federalTaxId", "authorizedSignature",
+    "printedName", "purchasingAddress", "purchasingContactName",
+    "purchasingPhone", "purchasingEmail", "bidDeadline"
+]
+
+# Chunking for long documents (see mapreduce.py)
+APP_CHUNK_TOKENS = int(os.getenv('APP_CHUNK_TOKENS', '6000'))
+APP_CHUNK_OVERLAP_TOKENS = int(os.getenv('APP_CHUNK_OVERLAP_TOKENS', '200'))
+APP_MAP_CONCURRENCY = int(os.getenv('APP_MAP_CONCURRENCY', '4'))
+
+def extract_chunk_with_gemini(model, text):
+    """Extract structured data from one chunk of document text"""
+    prompt = f"""
         You are an AI assistant specialized in extracting procurement and contract information.
         Extract the following fields from the document text below. If a field is not found, return an empty string.
         
@@ -155,20 +267,41 @@ def extract_with_gemini(text):
         }}
         
         Document Text:
-        {text[:5000]}  # Limit text to avoid token limits
+        {text}
         """
+    
+    response = model.generate_content(prompt)
+    
+    # Extract JSON from response
+    response_text = response.text
+    # Remove markdown code blocks if present
+    if "```json" in response_text:
+        response_text = response_text.split("```json")[1].split("```")[0]
+    elif "```" in response_text:
+        response_text = response_text.split("```")[1].split("```")[0]
+    
+    return json.loads(response_text.strip())
+
+def extract_with_gemini(text):
+    """Extract structured data using Gemini API"""
+    try:
+        model = genai.GenerativeModel('gemini-1.5-flash')
+        
+        # Long documents are split into overlapping chunks that are
+        # extracted concurrently and merged, instead of being truncated
+        chunks = chunk_text(text, APP_CHUNK_TOKENS, APP_CHUNK_OVERLAP_TOKENS)
+        with ThreadPoolExecutor(max_workers=min(APP_MAP_CONCURRENCY, len(chunks))) as pool:
+            results = list(pool.map(lambda chunk: extract_chunk_with_gemini(model, chunk), chunks))
         
-        response = model.generate_content(prompt)
+        extracted_data, conflicts = merge_field_results(results, APP_FIELD_KEYS)
+        if conflicts:
+            print(f"Conflicting values across chunks for: {', '.join(conflicts)}")
         
-        # Extract JSON from response
-        response_text = response.text
-        # Remove markdown code blocks if present
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0]
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0]
+        # Record columns are strings
+        for key, value in extracted_data.items():
+            if isinstance(value, list):
+                extracted_data[key] = ", ".join(str(v) for v in value)
         
-        extracted_data = json.loads(response_text.strip())
         return extracted_data
         
     except Exception as e:
@@ -266,6 +399,7 @@ def upload_and_extract():
         
         db.session.add(record)
         db.session.commit()
+        record_counts.invalidate()
         
         return jsonify({
             'success': True,
@@ -279,16 +413,124 @@ def upload_and_extract():
 
 @app.route('/api/records', methods=['GET'])
 def get_all_records():
-    """Get all procurement records"""
+    """
+    Get procurement records, newest first, one page at a time.
+
+    Query parameters:
+    - `limit`: page size (default APP_RECORDS_PAGE_SIZE)
+    - `cursor`: `nextCursor` of the previous page (omit for the first page)
+    - `status`: only records with this status
+
+    Pages are addressed by (created_at, id) of the last record rather than
+    an offset, so every page is an index range scan however deep it is.
+    `nextCursor` is null on the last page; `total` comes from a short-lived
+    count cache.
+    """
     try:
-        records = ProcurementRecord.query.order_by(ProcurementRecord.created_at.desc()).all()
+        limit = request.args.get('limit', APP_RECORDS_PAGE_SIZE, type=int)
+        limit = max(1, min(limit, APP_RECORDS_MAX_PAGE_SIZE))
+        status = request.args.get('status') or None
+        cursor = request.args.get('cursor')
+        
+        query = ProcurementRecord.query
+        if status:
+            query = query.filter(ProcurementRecord.status == status)
+        if cursor:
+            try:
+                created_at, row_id = decode_cursor(cursor)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            # Written so SQLite can use created_at as an index range
+            query = query.filter(
+                ProcurementRecord.created_at <= created_at,
+                db.or_(
+                    ProcurementRecord.created_at < created_at,
+                    ProcurementRecord.id < row_id
+                )
+            )
+        
+        records = query.order_by(
+            ProcurementRecord.created_at.desc(), ProcurementRecord.id.desc()
+        ).limit(limit).all()
+        next_cursor = encode_cursor(records[-1]) if len(records) == limit else None
+        
         return jsonify({
             'success': True,
-            'records': [record.to_dict() for record in records]
+            'records': [record.to_dict() for record in records],
+            'nextCursor': next_cursor,
+            'total': record_counts.get(status)
         }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def record_row(item, now):
+    """Column values for one record of a bulk import"""
+    row = {column: item.get(key, '') for key, column in RECORD_FIELD_COLUMNS.items()}
+    row.update(
+        record_id=item.get('id') or f"PROC_{now.strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}",
+        status=item.get('status') if item.get('status') in ('draft', 'approved') else 'draft',
+        document_path=item.get('documentPath'),
+        logo_path=item.get('logoPath'),
+        created_at=now,
+        updated_at=now,
+        approved_at=now if item.get('status') == 'approved' else None
+    )
+    return row
+
+@app.route('/api/records/bulk-import', methods=['POST'])
+def bulk_import_records():
+    """
+    Import already-extracted records: {"records": [{...}, ...]} with the
+    same camelCase fields as the other endpoints.
+
+    Records are inserted APP_IMPORT_BATCH_SIZE at a time, one transaction
+    per batch instead of one per record. Records whose id already exists
+    (or repeats within the import) are skipped. A failing batch is rolled
+    back and reported; batches committed before it stay.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('records')
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return jsonify({'error': 'Expected {"records": [...]}'}), 400
+    
+    now = datetime.utcnow()
+    rows = [record_row(item, now) for item in items]
+    imported = 0
+    skipped = []
+    seen = set()
+    
+    try:
+        for start in range(0, len(rows), APP_IMPORT_BATCH_SIZE):
+            batch = rows[start:start + APP_IMPORT_BATCH_SIZE]
+            ids = [row['record_id'] for row in batch]
+            existing = {
+                record_id for (record_id,) in db.session.query(ProcurementRecord.record_id)
+                .filter(ProcurementRecord.record_id.in_(ids))
+            }
+            new_rows = []
+            for row in batch:
+                if row['record_id'] in existing or row['record_id'] in seen:
+                    skipped.append(row['record_id'])
+                    continue
+                seen.add(row['record_id'])
+                new_rows.append(row)
+            
+            db.session.bulk_insert_mappings(ProcurementRecord, new_rows)
+            db.session.commit()
+            imported += len(new_rows)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'imported': imported, 'skipped': skipped}), 500
+    finally:
+        if imported:
+            record_counts.invalidate()
+    
+    return jsonify({
+        'success': True,
+        'imported': imported,
+        'skipped': skipped
+    }), 200
+
 @app.route('/api/records/<record_id>', methods=['GET'])
 def get_record(record_id):
     """Get a specific record"""
@@ -357,6 +599,7 @@ def approve_record(record_id):
         record.updated_at = datetime.utcnow()
         
         db.session.commit()
+        record_counts.invalidate()
         
         return jsonify({
             'success': True,
@@ -384,6 +627,7 @@ def delete_record(record_id):
         
         db.session.delete(record)
         db.session.commit()
+        record_counts.invalidate()
         
         return jsonify({
             'success': True,
@@ -418,7 +662,11 @@ def search_records():
 
 # Initialize database
 with app.app_context():
+    event.listen(db.engine, 'connect', set_sqlite_pragmas)
     db.create_all()
+    # create_all() skips existing tables; add indexes introduced since
+    for index in ProcurementRecord.__table__.indexes:
+        index.create(bind=db.engine, checkfirst=True)
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import os
+import zipfile
+from typing import AsyncIterator, Callable, Iterator, List, Tuple
+
+from fastapi import UploadFile
+
+from extract import SUPPORTED_EXTENSIONS
+from ingest import MAX_UPLOAD_BYTES, SpooledUpload, UploadTooLargeError, spool
+from pipeline import process_document
+from scheduler import PRIORITY_BATCH
+
+# Documents of one batch processed at the same time
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# Largest single document accepted from a zip archive (uncompressed)
+BATCH_MAX_MEMBER_BYTES = int(os.getenv("BATCH_MAX_MEMBER_BYTES", str(100 * 1024 * 1024)))
+
+
+class BatchItemError(Exception):
+    pass
+
+
+Loader = Callable[[], SpooledUpload]
+
+
+def _iter_zip(upload: UploadFile) -> Iterator[Tuple[str, Loader]]:
+    """
+    Yield (name, loader) for every document inside a zip upload.
+    The archive is read from the spooled upload file member by member,
+    and each member is decompressed straight into its own spool file;
+    it is never loaded into memory as a whole.
+    """
+    archive = zipfile.ZipFile(upload.file)
+    for info in archive.infolist():
+        if info.is_dir() or os.path.basename(info.filename).startswith("."):
+            continue
+
+        def load(info=info) -> SpooledUpload:
+            if info.file_size > BATCH_MAX_MEMBER_BYTES:
+                raise BatchItemError("File too large")
+            # The declared size can lie; the spool enforces the limit too
+            with archive.open(info) as member:
+                return spool(member, BATCH_MAX_MEMBER_BYTES)
+
+        yield info.filename, load
+
+
+def iter_batch_items(files: List[UploadFile]) -> Iterator[Tuple[str, Loader]]:
+    """
+    Yield (filename, loader) for each document of a batch upload: either
+    the uploaded files themselves, or the contents of a single zip file.
+    """
+    if len(files) == 1 and files[0].filename.lower().endswith(".zip"):
+        yield from _iter_zip(files[0])
+        return
+
+    for upload in files:
+        yield upload.filename, lambda upload=upload: spool(upload.file, MAX_UPLOAD_BYTES)
+
+
+async def _load_item(filename: str, load: Loader) -> SpooledUpload:
+    if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
+        raise BatchItemError("Unsupported file type")
+    try:
+        return await asyncio.to_thread(load)
+    except UploadTooLargeError:
+        raise BatchItemError("File too large")
+
+
+async def _process_item(filename: str, load: Loader) -> dict:
+    upload = None
+    try:
+        upload = await _load_item(filename, load)
+        result = await process_document(upload, os.path.basename(filename), priority=PRIORITY_BATCH)
+        return {"filename": filename, **result}
+    except Exception as e:
+        return {"filename": filename, "status": "failed", "error": str(e)}
+    finally:
+        if upload is not None:
+            upload.remove()
+
+
+async def run_batch(files: List[UploadFile],
+                    concurrency: int = BATCH_CONCURRENCY) -> AsyncIterator[str]:
+    """
+    Process a batch with at most `concurrency` documents in flight and
+    yield one NDJSON line per document as soon as it finishes.
+
+    A document is only spooled to disk when a slot frees up for it, and
+    results are streamed out rather than collected, so memory stays
+    bounded whatever the batch size.
+    """
+    items = iter_batch_items(files)
+    pending = set()
+    try:
+        while True:
+            for filename, load in items:
+                pending.add(asyncio.ensure_future(_process_item(filename, load)))
+                if len(pending) >= concurrency:
+                    break
+
+            if not pending:
+                return
+
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield json.dumps(task.result(), default=str) + "\n"
+    finally:
+        # Client went away: stop the remaining documents
+        for task in pending:
+            task.cancel()
+
+
+async def queue_batch(files: List[UploadFile], queue) -> AsyncIterator[str]:
+    """
+    JOB_BACKEND=mongo: submit every document of a batch as a job of
+    `queue` and yield one NDJSON line per document, in upload order,
+    with its job_id (or the error that kept it out of the queue). Results
+    are followed through /jobs/{job_id}, like single uploads.
+    """
+    for filename, load in iter_batch_items(files):
+        try:
+            # submit() removes the spool file once it is stored
+            upload = await _load_item(filename, load)
+            job = await queue.submit(upload, os.path.basename(filename))
+            line = {"filename": filename, "job_id": job.id, "status": job.status}
+        except Exception as e:
+            line = {"filename": filename, "status": "failed", "error": str(e)}
+        yield json.dumps(line, default=str) + "\n"
@@ -0,0 +1,26 @@
+"""
+Benchmarks for the extraction pipeline. Run from the backend directory:
+
+    python -m benchmarks corpus --out bench-corpus --count 20 --pages 30
+    python -m benchmarks stages --count 10 --pages 20 --latency 0.5 --out results/stages.json
+    python -m benchmarks load --url http://localhost:8000 --requests 200 \\
+        --concurrency 16 --out results/load.json
+
+`stages` times parse / prompt build / model / JSON parse / DB write in
+isolation. `load` drives a running API; start it with the fake model so
+the numbers measure our code, not Gemini:
+
+    MODEL_BACKEND=fake FAKE_MODEL_DISTRIBUTION=lognormal \\
+        FAKE_MODEL_LATENCY_SECONDS=1.5 FAKE_MODEL_JITTER_SECONDS=0.5 \\
+        uvicorn main:app
+
+`importtime` imports the app module in fresh interpreters under
+`python -X importtime` and exits non-zero when it takes longer than
+--budget-ms or eagerly imports a module that should load lazily
+(Gemini SDK, pypdf, python-docx); usable as a CI gate:
+
+    python -m benchmarks importtime --budget-ms 1000
+
+Every run writes a self-describing JSON file (commit, machine, params),
+so two runs can be diffed to spot regressions.
+"""
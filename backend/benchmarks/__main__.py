@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import uuid
+from typing import List, Tuple
+
+from benchmarks.corpus import generate_corpus, write_corpus
+from benchmarks.report import write_results
+from scheduler import FakeBackend
+
+
+def _corpus_args(parser: argparse.ArgumentParser):
+    parser.add_argument("--count", type=int, default=10, help="number of documents")
+    parser.add_argument("--pages", type=int, default=10, help="pages per document")
+    parser.add_argument("--tables", type=int, default=2, help="pricing tables per document")
+    parser.add_argument("--fields", type=int, default=10, help="key facts stated per document")
+    parser.add_argument("--formats", default="pdf,docx", help="comma-separated: pdf,docx")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus", help="use the files in this directory instead of generating")
+
+
+def _load_corpus(args) -> List[Tuple[str, bytes]]:
+    if args.corpus:
+        files = []
+        for name in sorted(os.listdir(args.corpus)):
+            if name.lower().endswith((".pdf", ".docx")):
+                with open(os.path.join(args.corpus, name), "rb") as f:
+                    files.append((name, f.read()))
+        return files
+    return generate_corpus(args.count, tuple(args.formats.split(",")),
+                           args.pages, args.tables, args.fields, args.seed)
+
+
+def _corpus_params(args):
+    return {k: getattr(args, k) for k in ("count", "pages", "tables", "fields", "formats", "seed", "corpus")}
+
+
+def cmd_corpus(args) -> int:
+    write_corpus(args.out, _load_corpus(args))
+    print(f"Wrote {args.count} documents to {args.out}")
+    return 0
+
+
+def cmd_stages(args) -> int:
+    from benchmarks.stages import make_backend, run_stages
+
+    collection = None
+    if not args.skip_db:
+        from database import db
+        collection = db[f"benchmark_{uuid.uuid4().hex[:8]}"]
+
+    backend = make_backend(args.latency, args.jitter, args.distribution, args.error_rate)
+    try:
+        results = run_stages(_load_corpus(args), backend, collection, args.repeat)
+    finally:
+        if collection is not None:
+            collection.drop()
+
+    params = {**_corpus_params(args), "latency": args.latency, "jitter": args.jitter,
+              "distribution": args.distribution, "error_rate": args.error_rate,
+              "repeat": args.repeat, "db": not args.skip_db}
+    write_results(args.out, "stages", params, results)
+    print(json.dumps(results["stages"], indent=2))
+    return 0
+
+
+def cmd_load(args) -> int:
+    from benchmarks.load import run_load, scrape_server_stats
+
+    files = _load_corpus(args)
+    results = asyncio.run(run_load(args.url, files, args.requests, args.concurrency))
+    results["server_cache"] = asyncio.run(scrape_server_stats(args.url))
+
+    params = {**_corpus_params(args), "url": args.url, "requests": args.requests,
+              "concurrency": args.concurrency}
+    write_results(args.out, "load", params, results)
+    print(json.dumps({k: results[k] for k in ("throughput_docs_per_s", "outcomes", "end_to_end")}, indent=2))
+    return 0
+
+
+def cmd_importtime(args) -> int:
+    from benchmarks.importtime import run_importtime
+
+    results = run_importtime(args.module, args.runs, args.budget_ms)
+    write_results(args.out, "importtime", {"module": args.module, "runs": args.runs,
+                                           "budget_ms": args.budget_ms}, results)
+    print(json.dumps(results, indent=2))
+    if results["eager_lazy_modules"]:
+        print(f"Imported at startup, should be lazy: {', '.join(results['eager_lazy_modules'])}")
+    if results["total_ms"] > args.budget_ms:
+        print(f"Over budget: {results['total_ms']} ms > {args.budget_ms} ms")
+    return 0 if results["within_budget"] else 1
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    corpus = commands.add_parser("corpus", help="write a synthetic corpus to disk")
+    _corpus_args(corpus)
+    corpus.add_argument("--out", required=True, help="output directory")
+    corpus.set_defaults(run=cmd_corpus)
+
+    stages = commands.add_parser("stages", help="time each pipeline stage in isolation")
+    _corpus_args(stages)
+    stages.add_argument("--latency", type=float, default=0.2, help="fake model latency (s)")
+    stages.add_argument("--jitter", type=float, default=0.1, help="fake model jitter (s, or sigma)")
+    stages.add_argument("--distribution", default="lognormal",
+                        choices=FakeBackend.DISTRIBUTIONS)
+    stages.add_argument("--error-rate", type=float, default=0.0)
+    stages.add_argument("--repeat", type=int, default=1, help="passes over the corpus")
+    stages.add_argument("--skip-db", action="store_true", help="skip the Mongo write stage")
+    stages.add_argument("--out", default="benchmark-results/stages.json")
+    stages.set_defaults(run=cmd_stages)
+
+    load = commands.add_parser("load", help="drive /upload on a running API")
+    _corpus_args(load)
+    load.add_argument("--url", default="http://localhost:8000")
+    load.add_argument("--requests", type=int, default=100,
+                      help="uploads to send; files repeat (and hit the extraction cache) "
+                           "when this exceeds --count")
+    load.add_argument("--concurrency", type=int, default=8)
+    load.add_argument("--out", default="benchmark-results/load.json")
+    load.set_defaults(run=cmd_load)
+
+    importtime = commands.add_parser("importtime", help="check the app's import time budget")
+    importtime.add_argument("--module", default="main")
+    importtime.add_argument("--runs", type=int, default=3, help="best of this many fresh imports")
+    importtime.add_argument("--budget-ms", type=float, default=1000.0)
+    importtime.add_argument("--out", default="benchmark-results/importtime.json")
+    importtime.set_defaults(run=cmd_importtime)
+
+    args = parser.parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
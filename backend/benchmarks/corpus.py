@@ -0,0 +1,191 @@
+import io
+import os
+import random
+from typing import Any, Dict, List, Tuple
+
+from docx import Document
+
+AGENCIES = [
+    "Department of Veterans Affairs", "U.S. Army Corps of Engineers",
+    "General Services Administration", "Department of Energy",
+    "National Aeronautics and Space Administration", "Department of the Navy",
+    "City of Springfield Public Works", "State Department of Transportation",
+]
+TITLES = [
+    "Facility Maintenance and Repair Services", "Enterprise IT Help Desk Support",
+    "Janitorial Services for Regional Offices", "Bridge Inspection and Load Rating",
+    "Cloud Hosting and Managed Services", "Medical Equipment Preventive Maintenance",
+    "Fleet Vehicle Leasing", "Environmental Site Assessment Phase II",
+]
+SECTION_TITLES = [
+    "SCOPE OF WORK", "PERIOD OF PERFORMANCE", "DELIVERABLES", "SUBMISSION INSTRUCTIONS",
+    "EVALUATION CRITERIA", "SPECIAL CONTRACT REQUIREMENTS", "INSURANCE REQUIREMENTS",
+    "PRICING SCHEDULE", "CONTRACT CLAUSES", "INSPECTION AND ACCEPTANCE",
+]
+_WORDS = """
+contractor shall provide all labor materials equipment supervision necessary
+perform services accordance with terms conditions specified herein government
+reserves right award multiple contracts offerors must submit proposals prior
+closing date time late submissions will not be considered pricing shall include
+all costs associated with performance including travel overhead profit quality
+control plan required within days after award safety compliance applicable
+federal state local regulations subcontracting plan small business participation
+""".split()
+
+# Two-sentence paragraphs per synthetic page, and text lines per PDF page
+# (together roughly a dense single-spaced page)
+PARAGRAPHS_PER_PAGE = 20
+PDF_LINES_PER_PAGE = 60
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(10, 18))]
+    return " ".join(words).capitalize() + "."
+
+
+def make_solicitation(pages: int = 5, tables: int = 2, fields: int = 10,
+                      seed: int = 0) -> Dict[str, Any]:
+    """
+    Content of one synthetic solicitation, independent of file format:
+    {"fields": ground truth, "blocks": [("heading"|"paragraph", text) or
+    ("table", rows)]}. About `pages` pages of text, `tables` pricing
+    tables, and `fields` key facts (number, agency, dates, contact, ...)
+    stated in the text.
+    """
+    rng = random.Random(seed)
+    number = f"{rng.choice(['W912DY', '36C10X', '47QSWA', '89303'])}-26-R-{rng.randint(1, 9999):04d}"
+    truth = {
+        "solicitation_number": number,
+        "title": rng.choice(TITLES),
+        "agency": rng.choice(AGENCIES),
+        "due_date": f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "naics_codes": str(rng.choice([236220, 541512, 561720, 541330, 532112])),
+        "psc_commodity_codes": rng.choice(["Z1AA", "D399", "S201", "C211"]),
+        "primary_contact_name": rng.choice(["Jordan Lee", "Sam Patel", "Alex Kim", "Riley Chen"]),
+        "primary_contact_email": f"contracting{rng.randint(1, 99)}@example.gov",
+        "primary_contact_phone": f"({rng.randint(200, 999)}) 555-{rng.randint(0, 9999):04d}",
+        "estimated_value": f"${rng.randint(100, 9000) * 1000:,}",
+        "set_aside_type": rng.choice(["Total Small Business", "8(a)", "SDVOSB", "None"]),
+        "place_of_performance": rng.choice(["Denver, CO", "Norfolk, VA", "Remote", "Austin, TX"]),
+    }
+    truth = dict(list(truth.items())[:max(1, fields)])
+
+    blocks: List[Tuple[str, Any]] = [
+        ("heading", f"SOLICITATION {truth['solicitation_number']}"),
+    ]
+    blocks += [("paragraph", f"{key.replace('_', ' ').title()}: {value}") for key, value in truth.items()]
+
+    total = pages * PARAGRAPHS_PER_PAGE
+    table_every = max(1, total // (tables + 1)) if tables else 0
+    placed = 0
+    for i in range(total):
+        if i % 12 == 0:
+            blocks.append(("heading", f"SECTION {i // 12 + 1} - {rng.choice(SECTION_TITLES)}"))
+        blocks.append(("paragraph", " ".join(_sentence(rng) for _ in range(2))))
+        if table_every and i and i % table_every == 0 and placed < tables:
+            placed += 1
+            rows = [["CLIN", "Description", "Quantity", "Unit Price"]]
+            rows += [
+                [f"{placed:02d}{r:02d}", rng.choice(TITLES), str(rng.randint(1, 500)),
+                 f"${rng.randint(10, 5000):,}.00"]
+                for r in range(1, rng.randint(4, 12))
+            ]
+            blocks.append(("table", rows))
+
+    return {"fields": truth, "blocks": blocks}
+
+
+def to_docx(solicitation: Dict[str, Any]) -> bytes:
+    doc = Document()
+    for kind, content in solicitation["blocks"]:
+        if kind == "heading":
+            doc.add_heading(content, level=2)
+        elif kind == "paragraph":
+            doc.add_paragraph(content)
+        else:
+            table = doc.add_table(rows=len(content), cols=len(content[0]))
+            for r, row in enumerate(content):
+                for c, value in enumerate(row):
+                    table.cell(r, c).text = value
+    out = io.BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+def _pdf_escape(text: str) -> str:
+    text = text.encode("latin-1", "replace").decode("latin-1")
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _wrap(text: str, width: int = 95) -> List[str]:
+    lines, current = [], ""
+    for word in text.split():
+        if current and len(current) + len(word) + 1 > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}".strip()
+    return lines + ([current] if current else [])
+
+
+def to_pdf(solicitation: Dict[str, Any]) -> bytes:
+    """
+    Render as a plain text PDF (Helvetica, one text object per page).
+    Written by hand so generating a corpus needs no PDF library; pypdf
+    extracts the text back like it would from a real, born-digital RFP.
+    """
+    lines: List[str] = []
+    for kind, content in solicitation["blocks"]:
+        if kind == "table":
+            lines += [" | ".join(row) for row in content]
+        else:
+            lines += _wrap(content)
+
+    pages = [lines[i:i + PDF_LINES_PER_PAGE]
+             for i in range(0, len(lines), PDF_LINES_PER_PAGE)] or [[]]
+
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", "", "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in pages:
+        body = "\n".join(f"({_pdf_escape(line)}) '" for line in page)
+        content = f"BT /F1 9 Tf 11 TL 40 770 Td\n{body}\nET"
+        objects.append(f"<< /Length {len(content.encode('latin-1'))} >>\nstream\n{content}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(out))
+        out += f"{i + 1} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return bytes(out)
+
+
+def generate_corpus(count: int, formats=("pdf", "docx"), pages: int = 5, tables: int = 2,
+                    fields: int = 10, seed: int = 0) -> List[Tuple[str, bytes]]:
+    """
+    `count` synthetic solicitations as (filename, bytes), alternating formats.
+    """
+    files = []
+    for i in range(count):
+        fmt = formats[i % len(formats)]
+        solicitation = make_solicitation(pages, tables, fields, seed + i)
+        data = to_pdf(solicitation) if fmt == "pdf" else to_docx(solicitation)
+        files.append((f"synthetic-{seed + i:04d}.{fmt}", data))
+    return files
+
+
+def write_corpus(out_dir: str, files: List[Tuple[str, bytes]]):
+    os.makedirs(out_dir, exist_ok=True)
+    for name, data in files:
+        with open(os.path.join(out_dir, name), "wb") as f:
+            f.write(data)
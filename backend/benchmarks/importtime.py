@@ -0,0 +1,60 @@
+import os
+import re
+import subprocess
+import sys
+from typing import Any, Dict, List, Tuple
+
+# Imported on first use (or by /warmup), never when the app module loads
+LAZY_MODULES = ("google.generativeai", "pypdf", "docx")
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _parse(stderr: str) -> List[Tuple[str, int, int]]:
+    """
+    (module, self µs, cumulative µs) for each line of -X importtime output.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            rows.append((match.group(4), int(match.group(1)), int(match.group(2))))
+    return rows
+
+
+def measure(module: str = "main") -> Dict[str, Any]:
+    """
+    Import `module` in a fresh interpreter under `python -X importtime`.
+    Returns its cumulative import time, the slowest imports, and which of
+    LAZY_MODULES were imported anyway.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=_BACKEND_DIR, timeout=120,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    rows = _parse(result.stderr)
+    total = next((cumulative for name, _, cumulative in rows if name == module), 0)
+    imported = {name for name, _, _ in rows}
+    slowest = sorted(rows, key=lambda row: row[1], reverse=True)[:15]
+    return {
+        "total_ms": round(total / 1000, 1),
+        "slowest_self_ms": {name: round(own / 1000, 1) for name, own, _ in slowest},
+        "eager_lazy_modules": [m for m in LAZY_MODULES if m in imported],
+    }
+
+
+def run_importtime(module: str, runs: int, budget_ms: float) -> Dict[str, Any]:
+    """
+    Best of `runs` measurements (the first one is often slower while the
+    OS file cache warms up), checked against `budget_ms`.
+    """
+    measurements = [measure(module) for _ in range(runs)]
+    best = min(measurements, key=lambda m: m["total_ms"])
+    best["runs_ms"] = [m["total_ms"] for m in measurements]
+    best["budget_ms"] = budget_ms
+    best["within_budget"] = best["total_ms"] <= budget_ms and not best["eager_lazy_modules"]
+    return best
@@ -0,0 +1,86 @@
+import asyncio
+import itertools
+import json
+import time
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+from benchmarks.report import summarize
+
+
+async def _wait_for_job(client: httpx.AsyncClient, job_id: str) -> str:
+    # Follow the job's SSE stream until it finishes; returns the final event
+    async with client.stream("GET", f"/jobs/{job_id}/events") as response:
+        event = ""
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and event in ("done", "failed"):
+                return event
+    return "disconnected"
+
+
+async def _one_upload(client: httpx.AsyncClient, filename: str, data: bytes) -> Dict[str, Any]:
+    started = time.perf_counter()
+    response = await client.post("/upload", files={"file": (filename, data)})
+    accepted = time.perf_counter()
+    if response.status_code != 202:
+        return {"outcome": f"http_{response.status_code}", "accept": accepted - started}
+
+    outcome = await _wait_for_job(client, response.json()["job_id"])
+    return {
+        "outcome": outcome,
+        "accept": accepted - started,
+        "end_to_end": time.perf_counter() - started,
+    }
+
+
+async def run_load(base_url: str, files: List[Tuple[str, bytes]], requests: int,
+                   concurrency: int, timeout: float = 300.0) -> Dict[str, Any]:
+    """
+    Upload `requests` documents (cycling through `files`) with at most
+    `concurrency` in flight, each followed to completion over SSE.
+
+    Reports throughput (finished documents per second), latency of the
+    /upload call itself ("accept") and upload-to-done latency
+    ("end_to_end"), with p50/p95/p99.
+    """
+    queue = itertools.islice(itertools.cycle(files), requests)
+    results: List[Dict[str, Any]] = []
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout) as client:
+        async def worker():
+            for filename, data in queue:
+                try:
+                    results.append(await _one_upload(client, filename, data))
+                except httpx.HTTPError as e:
+                    results.append({"outcome": type(e).__name__})
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    outcomes: Dict[str, int] = {}
+    for r in results:
+        outcomes[r["outcome"]] = outcomes.get(r["outcome"], 0) + 1
+    done = outcomes.get("done", 0)
+
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "throughput_docs_per_s": round(done / elapsed, 3) if elapsed else 0.0,
+        "outcomes": outcomes,
+        "accept": summarize([r["accept"] for r in results if "accept" in r]),
+        "end_to_end": summarize([r["end_to_end"] for r in results if r["outcome"] == "done"]),
+    }
+
+
+async def scrape_server_stats(base_url: str) -> Dict[str, Any]:
+    """
+    Cache counters from the server under test, stored next to the results.
+    """
+    async with httpx.AsyncClient(base_url=base_url, timeout=10) as client:
+        try:
+            return (await client.get("/cache/stats")).json()
+        except (httpx.HTTPError, json.JSONDecodeError):
+            return {}
@@ -0,0 +1,81 @@
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks.report import summarize
+from extract import extract_text_from_bytes
+from gemini_client import JSON_TEMPLATE, _extract_json_block, build_prompt, fake_response
+from mapreduce import estimate_tokens
+from scheduler import FakeBackend, ModelScheduler
+
+STAGES = ("parse", "prompt_build", "model", "json_parse", "db_write")
+
+
+def run_stages(files: List[Tuple[str, bytes]], backend: FakeBackend,
+               collection=None, repeat: int = 1) -> Dict[str, Any]:
+    """
+    Time each pipeline stage separately, in one thread, for every file.
+    Build `backend` with make_backend() for realistic response payloads.
+
+    The model stage goes through a ModelScheduler wrapping `backend`, so
+    it includes the scheduler's own overhead on top of the simulated
+    latency. `collection` is where the db_write stage inserts (and then
+    deletes) a document shaped like the real one; None skips the stage.
+    """
+    scheduler = ModelScheduler(backend)
+
+    samples: Dict[str, List[float]] = defaultdict(list)
+    totals = {"files": 0, "characters": 0, "prompt_tokens": 0}
+
+    for _ in range(repeat):
+        for filename, data in files:
+            t0 = time.perf_counter()
+            text = extract_text_from_bytes(data, filename)
+            t1 = time.perf_counter()
+            prompt = build_prompt(JSON_TEMPLATE, text)
+            t2 = time.perf_counter()
+            raw = scheduler.generate(prompt)
+            t3 = time.perf_counter()
+            fields = _extract_json_block(raw)
+            t4 = time.perf_counter()
+
+            samples["parse"].append(t1 - t0)
+            samples["prompt_build"].append(t2 - t1)
+            samples["model"].append(t3 - t2)
+            samples["json_parse"].append(t4 - t3)
+
+            if collection is not None:
+                doc_id = str(uuid.uuid4())
+                collection.insert_one({
+                    "_id": doc_id,
+                    "filename": filename,
+                    "fields": fields,
+                    "status": "pending",
+                    "created_at": datetime.utcnow(),
+                })
+                samples["db_write"].append(time.perf_counter() - t4)
+                collection.delete_one({"_id": doc_id})
+
+            totals["files"] += 1
+            totals["characters"] += len(text)
+            totals["prompt_tokens"] += estimate_tokens(prompt)
+
+    return {
+        "stages": {stage: summarize(samples[stage]) for stage in STAGES if samples[stage]},
+        "totals": totals,
+        "scheduler": scheduler.stats(),
+    }
+
+
+def make_backend(latency: float, jitter: float, distribution: str,
+                 error_rate: float = 0.0, seed: Optional[int] = 0) -> FakeBackend:
+    return FakeBackend(
+        latency_seconds=latency,
+        jitter_seconds=jitter,
+        distribution=distribution,
+        error_rate=error_rate,
+        respond=lambda prompt: fake_response(),
+        seed=seed,
+    )
@@ -0,0 +1,131 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+from bson.binary import Binary
+from pymongo import ASCENDING
+
+from database import db
+from gemini_client import extractor_fingerprint
+
+# Size / age limits for cached extractions (override via environment)
+CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "5000"))
+CACHE_TTL_SECONDS = int(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+
+class ExtractionCache:
+    """
+    Persistent, content-addressed cache of extracted fields.
+
+    Entries are keyed by the file hash plus the extractor fingerprint
+    (model name + template + prompt), so changing any of those makes old
+    entries unreachable instead of returning stale fields.
+
+    Eviction:
+      - TTL: entries expire `ttl_seconds` after they were written
+        (enforced on read, and by a Mongo TTL index in the background,
+        see indexes.py).
+      - LRU: once the collection exceeds `max_entries`, the least recently
+        used entries are deleted.
+    """
+
+    def __init__(self, collection, max_entries: int = CACHE_MAX_ENTRIES,
+                 ttl_seconds: int = CACHE_TTL_SECONDS):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def key_for(self, file_hash: str, previous_id: Optional[str] = None) -> str:
+        # `file_hash` is the upload's SHA-256, computed while spooling (ingest.py).
+        # An explicit previous version changes the result, so it is part of the key
+        key = f"{file_hash}:{extractor_fingerprint()}"
+        return f"{key}:{previous_id}" if previous_id else key
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached {"fields", "report", "sections", "signature"}
+        for `key`, or None on a miss. "signature" (the text's MinHash) is
+        None when it wasn't computed, or the entry predates it.
+        A hit refreshes the entry's LRU timestamp.
+        """
+        now = datetime.utcnow()
+        entry = self.collection.find_one_and_update(
+            {"_id": key, "expires_at": {"$gt": now}},
+            {"$set": {"last_used_at": now}, "$inc": {"hit_count": 1}},
+        )
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        signature = entry.get("signature")
+        return {
+            "fields": entry["fields"],
+            "report": entry.get("report", {}),
+            "sections": entry.get("sections"),
+            "signature": np.frombuffer(signature, dtype="<u4") if signature is not None else None,
+        }
+
+    def put(self, key: str, fields: Dict[str, Any],
+            report: Optional[Dict[str, Any]] = None,
+            sections: Optional[List[Dict[str, Any]]] = None,
+            signature: Optional[np.ndarray] = None):
+        now = datetime.utcnow()
+        self.collection.replace_one(
+            {"_id": key},
+            {
+                "_id": key,
+                "fields": fields,
+                "report": report or {},
+                "sections": sections,
+                "signature": Binary(signature.astype("<u4").tobytes()) if signature is not None else None,
+                "created_at": now,
+                "last_used_at": now,
+                "expires_at": now + timedelta(seconds=self.ttl_seconds),
+                "hit_count": 0,
+            },
+            upsert=True,
+        )
+        self._evict()
+
+    def _evict(self):
+        excess = self.collection.estimated_document_count() - self.max_entries
+        if excess <= 0:
+            return
+
+        stale = self.collection.find({}, {"_id": 1}) \
+            .sort("last_used_at", ASCENDING).limit(excess)
+        ids = [e["_id"] for e in stale]
+        if ids:
+            result = self.collection.delete_many({"_id": {"$in": ids}})
+            with self._lock:
+                self.evictions += result.deleted_count
+
+    def clear(self):
+        self.collection.delete_many({})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "entries": self.collection.estimated_document_count(),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "fingerprint": extractor_fingerprint(),
+            }
+
+
+extraction_cache = ExtractionCache(db["extraction_cache"])
@@ -0,0 +1,167 @@
+"""
+Storage format of extracted fields in the documents collection.
+
+The model fills every key of JSON_TEMPLATE, but most values come back
+empty and a few (scope_text, terms_and_conditions, ...) are very long.
+Stored as-is, every document carries ~160 empty keys and its longest
+texts uncompressed, which inflates Mongo's working set and every read.
+
+On write (encode_fields):
+  - empty strings (the template default) are dropped; None and empty
+    lists / objects are kept, so they come back with their type,
+  - values whose JSON is at least CODEC_COMPRESS_MIN_BYTES long are
+    stored compressed, as BSON Binary with a user-defined subtype naming
+    the compressor (zlib, or zstd when CODEC_COMPRESSION=zstd and the
+    zstandard package is installed).
+
+On read (decode_fields) compressed values are expanded and the dropped
+keys come back as "", so the API still returns the full template.
+DocumentRepository does both, so nothing above it sees the stored form.
+
+Documents written before this format are read unchanged. Rewrite them
+in batches, with a report of the space saved:
+
+    python codec.py migrate [--batch-size 500] [--dry-run]
+"""
+import argparse
+import json
+import os
+import sys
+import zlib
+from typing import Any, Dict, Iterable, List, Optional
+
+import bson
+from bson.binary import Binary
+from pymongo import UpdateOne
+
+try:
+    import zstandard
+except ImportError:  # optional: zlib is always available
+    zstandard = None
+
+from database import documents_collection
+from gemini_client import JSON_TEMPLATE
+
+# Values whose JSON encoding is at least this long are compressed
+CODEC_COMPRESS_MIN_BYTES = int(os.getenv("CODEC_COMPRESS_MIN_BYTES", "2048"))
+# "zlib" or "zstd" (falls back to zlib if zstandard isn't installed)
+CODEC_COMPRESSION = os.getenv("CODEC_COMPRESSION", "zlib")
+CODEC_ZLIB_LEVEL = int(os.getenv("CODEC_ZLIB_LEVEL", "6"))
+CODEC_ZSTD_LEVEL = int(os.getenv("CODEC_ZSTD_LEVEL", "3"))
+# Stored next to the fields of documents written in this format
+CODEC_VERSION = 1
+
+# BSON Binary subtypes 0x80-0xFF are user-defined
+_ZLIB_SUBTYPE = 0x80
+_ZSTD_SUBTYPE = 0x81
+
+
+def _compress(raw: bytes) -> Binary:
+    if CODEC_COMPRESSION == "zstd" and zstandard is not None:
+        return Binary(zstandard.ZstdCompressor(level=CODEC_ZSTD_LEVEL).compress(raw), _ZSTD_SUBTYPE)
+    return Binary(zlib.compress(raw, CODEC_ZLIB_LEVEL), _ZLIB_SUBTYPE)
+
+
+def _decompress(value: Binary) -> Any:
+    if value.subtype == _ZLIB_SUBTYPE:
+        raw = zlib.decompress(value)
+    elif value.subtype == _ZSTD_SUBTYPE:
+        if zstandard is None:
+            raise RuntimeError("A stored field is zstd-compressed; install zstandard to read it")
+        raw = zstandard.ZstdDecompressor().decompress(value)
+    else:
+        raise ValueError(f"Unknown field encoding (Binary subtype {value.subtype})")
+    return json.loads(raw)
+
+
+def encode_fields(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Stored form of an extracted fields dict.
+    """
+    stored = {}
+    for key, value in fields.items():
+        # Only "" can be restored from the template; anything else keeps its type
+        if isinstance(value, str) and value == "":
+            continue
+        raw = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        # Only worth it when compression actually wins
+        if len(raw) >= CODEC_COMPRESS_MIN_BYTES:
+            packed = _compress(raw)
+            if len(packed) < len(raw):
+                stored[key] = packed
+                continue
+        stored[key] = value
+    return stored
+
+
+def decode_fields(stored: Dict[str, Any], keys: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """
+    Full fields dict from its stored form: every template key (or only
+    `keys`, when the read projected a subset), then any extra keys.
+    Documents in the old format pass through unchanged.
+    """
+    fields = {key: "" for key in (JSON_TEMPLATE if keys is None else keys)}
+    for key, value in stored.items():
+        fields[key] = _decompress(value) if isinstance(value, Binary) else value
+    return fields
+
+
+# ---------- migration ----------
+
+def migrate(collection=documents_collection, batch_size: int = 500,
+            dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Rewrite documents still in the old format, batch by batch (one bulk
+    write per batch). A document edited in the meantime is already in the
+    new format and is skipped by the update filter.
+
+    Returns counts and BSON sizes of the fields before and after.
+    """
+    report = {"documents": 0, "bytes_before": 0, "bytes_after": 0, "batches": 0}
+    last_id = None
+    while True:
+        query: Dict[str, Any] = {"fields_codec": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(collection.find(query, {"fields": 1}).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        updates: List[UpdateOne] = []
+        for doc in batch:
+            fields = doc.get("fields") or {}
+            stored = encode_fields(fields)
+            report["bytes_before"] += len(bson.encode({"fields": fields}))
+            report["bytes_after"] += len(bson.encode({"fields": stored}))
+            updates.append(UpdateOne(
+                {"_id": doc["_id"], "fields_codec": {"$exists": False}},
+                {"$set": {"fields": stored, "fields_codec": CODEC_VERSION}},
+            ))
+
+        if not dry_run:
+            collection.bulk_write(updates, ordered=False)
+        report["documents"] += len(batch)
+        report["batches"] += 1
+
+    saved = report["bytes_before"] - report["bytes_after"]
+    report["bytes_saved"] = saved
+    report["saved_ratio"] = round(saved / report["bytes_before"], 3) if report["bytes_before"] else 0.0
+    return report
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python codec.py")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("migrate", help="rewrite documents in the compact field format")
+    run.add_argument("--batch-size", type=int, default=500)
+    run.add_argument("--dry-run", action="store_true", help="only report the savings")
+    args = parser.parse_args(argv)
+
+    report = migrate(batch_size=args.batch_size, dry_run=args.dry_run)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,7 +1,59 @@
-from pymongo import MongoClient
+import os
+
+from pymongo import MongoClient, monitoring
+
+import metrics
 
 # Adjust if your Mongo runs elsewhere
-client = MongoClient("mongodb://localhost:27017/")
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "doc_extract_db")
+# Connection pool sizing
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+# Default limit for a single database operation
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", "5000"))
+
+class CommandTimer(monitoring.CommandListener):
+    """
+    Times every Mongo command (find, insert, update, ...) for /metrics.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        metrics.MONGO_COMMAND_SECONDS.observe(
+            event.duration_micros / 1e6, command=event.command_name
+        )
+
+    def failed(self, event):
+        metrics.MONGO_COMMAND_SECONDS.observe(
+            event.duration_micros / 1e6, command=event.command_name
+        )
+        metrics.MONGO_COMMAND_FAILURES.inc(command=event.command_name)
 
-db = client["doc_extract_db"]
+
+# connect=False: no connection is opened until the first operation
+# (or connect() at app startup)
+client = MongoClient(
+    MONGO_URI,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    timeoutMS=MONGO_TIMEOUT_MS,
+    connect=False,
+    event_listeners=[CommandTimer()],
+)
+
+db = client[MONGO_DB_NAME]
 documents_collection = db["documents"]
+
+
+def connect():
+    """
+    Open the pool and fail fast if Mongo is unreachable.
+    """
+    client.admin.command("ping")
+
+
+def close():
+    client.close()
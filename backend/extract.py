@@ -1,25 +1,131 @@
-from pypdf import PdfReader
-from docx import Document
-from typing import IO
+import io
+from contextlib import contextmanager
+from typing import IO, TYPE_CHECKING, Iterator, List, Optional, Union
 
-def extract_text_from_file(file: IO, filename: str) -> str:
+from ingest import mapped
+
+if TYPE_CHECKING:
+    from pypdf import PdfReader
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx")
+
+# pypdf and python-docx are imported where they are used: the API process
+# only needs them when parsing in-process (PARSER_WORKERS=0), and parser
+# processes import them once, in preload()
+
+
+def preload():
+    """
+    Import the parsing libraries now. Parser processes run this when they
+    start, so the import isn't paid by the first document they get.
+    """
+    import docx  # noqa: F401
+    import pypdf  # noqa: F401
+
+
+def extract_text_from_file(file: Union[IO, str], filename: str) -> str:
     """
     Extract text from PDF or DOCX file (no OCR).
     """
-    text = ""
+    parts = []
 
     if filename.lower().endswith(".pdf"):
+        from pypdf import PdfReader
+
         reader = PdfReader(file)
         for page in reader.pages:
             t = page.extract_text() or ""
-            text += t + "\n"
+            parts.append(t + "\n")
 
     elif filename.lower().endswith(".docx"):
+        from docx import Document
+
         doc = Document(file)
         for para in doc.paragraphs:
-            text += para.text + "\n"
+            parts.append(para.text + "\n")
 
     else:
         raise ValueError("Unsupported file type")
 
-    return text
+    return "".join(parts)
+
+
+def extract_text_from_bytes(data: bytes, filename: str) -> str:
+    """
+    Same as extract_text_from_file, for raw bytes.
+    """
+    return extract_text_from_file(io.BytesIO(data), filename)
+
+
+def extract_text_from_path(path: str, filename: str) -> str:
+    """
+    Same as extract_text_from_file, for a file on disk (a spooled upload).
+    PDFs are parsed from a memory map (pypdf would read a path into
+    memory); DOCX is a zip, which python-docx reads member by member.
+    """
+    if filename.lower().endswith(".pdf"):
+        with mapped(path) as view:
+            return extract_text_from_file(view, filename)
+    return extract_text_from_file(path, filename)
+
+
+@contextmanager
+def _open_pdf(source: Union[bytes, str]) -> Iterator["PdfReader"]:
+    from pypdf import PdfReader
+
+    # `source` is either the raw file or a path to it
+    if isinstance(source, bytes):
+        yield PdfReader(io.BytesIO(source))
+        return
+    with mapped(source) as view:
+        yield PdfReader(view)
+
+
+def count_pdf_pages(source: Union[bytes, str]) -> int:
+    """
+    Number of pages of a PDF. Only the page tree is read, no page content,
+    so this is cheap enough to run outside the parser pool.
+    """
+    with _open_pdf(source) as reader:
+        return len(reader.pages)
+
+
+def extract_pdf_page_range(source: Union[bytes, str], start: int, stop: int) -> List[str]:
+    """
+    Extract the text of pages [start, stop) of a PDF.
+    One shard of a page-sharded extraction; runs in a parser process.
+    """
+    with _open_pdf(source) as reader:
+        return [
+            reader.pages[i].extract_text() or ""
+            for i in range(start, min(stop, len(reader.pages)))
+        ]
+
+
+class PageBuffer:
+    """
+    Collects page texts as they arrive (in any order) and assembles the
+    document text once, in page order, keeping the offset of each page.
+    """
+
+    def __init__(self, page_count: int):
+        self.pages: List[Optional[str]] = [None] * page_count
+
+    def add(self, index: int, text: str):
+        self.pages[index] = text
+
+    def offsets(self) -> List[int]:
+        """
+        Start offset of each page within text(), to map a character
+        position back to its page (bisect_right(offsets, pos) - 1).
+        """
+        offsets = []
+        pos = 0
+        for t in self.pages:
+            offsets.append(pos)
+            pos += len(t or "") + 1
+        return offsets
+
+    def text(self) -> str:
+        # Same layout as extract_text_from_file: every page ends with "\n"
+        return "".join((t or "") + "\n" for t in self.pages)
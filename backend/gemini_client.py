@@ -1,12 +1,438 @@
-import google.generativeai as genai
+import hashlib
 import json
-from typing import Dict, Any
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Any, Iterable, List, Optional, Tuple
+
+import metrics
+import preextract
+from jsonstream import IncrementalObjectParser
+from mapreduce import chunk_text, estimate_tokens, merge_field_results
+from retrieval import BM25Index
+from scheduler import (
+    FakeBackend,
+    GeminiBackend,
+    ModelScheduler,
+    PRIORITY_INTERACTIVE,
+)
+from sections import split_sections
 
 # 🔐 Replace with your actual Gemini API Key
 GEMINI_API_KEY = ""
 
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel("gemini-2.5-flash")
+MODEL_NAME = "gemini-2.5-flash"
+
+# "gemini", or "fake" to run offline against a local stand-in model
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "gemini")
+# Fake backend only: latency distribution and error rate (see FakeBackend)
+FAKE_MODEL_LATENCY_SECONDS = float(os.getenv("FAKE_MODEL_LATENCY_SECONDS", "0.2"))
+FAKE_MODEL_JITTER_SECONDS = float(os.getenv("FAKE_MODEL_JITTER_SECONDS", "0.1"))
+FAKE_MODEL_DISTRIBUTION = os.getenv("FAKE_MODEL_DISTRIBUTION", "normal")
+FAKE_MODEL_ERROR_RATE = float(os.getenv("FAKE_MODEL_ERROR_RATE", "0"))
+
+
+def _make_backend():
+    if MODEL_BACKEND != "fake":
+        return GeminiBackend(MODEL_NAME, GEMINI_API_KEY)
+    return FakeBackend(
+        latency_seconds=FAKE_MODEL_LATENCY_SECONDS,
+        jitter_seconds=FAKE_MODEL_JITTER_SECONDS,
+        distribution=FAKE_MODEL_DISTRIBUTION,
+        error_rate=FAKE_MODEL_ERROR_RATE,
+        respond=lambda prompt: fake_response(),
+    )
+
+
+# All model calls go through the scheduler (quota, concurrency, retries)
+scheduler = ModelScheduler(_make_backend())
+
+# "single" sends the whole document in one prompt, "map_reduce" splits it
+# into chunks, "auto" picks map_reduce for documents over the threshold,
+# "retrieval" sends each field group only its most relevant passages,
+# "sections" extracts per section so amended versions only re-send the
+# sections that changed
+EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "auto")
+MAP_REDUCE_THRESHOLD_TOKENS = int(os.getenv("MAP_REDUCE_THRESHOLD_TOKENS", "30000"))
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "12000"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "300"))
+# Maximum number of chunk extractions running at the same time
+MAP_CONCURRENCY = int(os.getenv("MAP_CONCURRENCY", "8"))
+# Retrieval mode: passage size and how many passages each field group gets
+RETRIEVAL_PASSAGE_TOKENS = int(os.getenv("RETRIEVAL_PASSAGE_TOKENS", "250"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "12"))
+# Sections mode: small sections are merged up to this size
+SECTION_MIN_TOKENS = int(os.getenv("SECTION_MIN_TOKENS", "1500"))
+# Fill pattern-shaped fields (codes, dates, amounts, contacts) locally and
+# leave them out of the model's template; "0" sends every field to the model
+PREEXTRACT_ENABLED = os.getenv("PREEXTRACT_ENABLED", "1") == "1"
+# Pre-extracted values below this confidence are left to the model
+PREEXTRACT_MIN_CONFIDENCE = float(os.getenv("PREEXTRACT_MIN_CONFIDENCE", "0.9"))
+
+# Called with (key, value) as soon as a field is known
+FieldCallback = Callable[[str, Any], None]
+
+
+# This JSON template describes ALL the fields we want.
+# The model is instructed to fill this exact structure.
+JSON_TEMPLATE = {
+    # =========================
+    # 1. Basic Solicitation Metadata (Doc 1 + solicitations table)
+    # =========================
+    "solicitation_id": "",
+    "solicitation_number": "",
+    "title": "",
+    "agency": "",
+    "procurement_type": "",           # RFP / RFI / RFQ / Bid / ITB
+    "category": "",                  # IT, Healthcare, HR, Construction, etc.
+    "publish_date": "",
+    "due_date": "",
+    "pre_bid_meeting": "",
+    "document_url": "",
+    "reference_numbers": "",         # could be multiple
+    "funding_source": "",            # Federal/State/Grant/CMS/ARPA etc.
+    "procurement_vehicle": "",       # Open, GSA, IDIQ, BPA, etc.
+    "notice_type": "",               # Solicitation, Amendment, Addendum, etc.
+    "contracting_method": "",        # Best value, LPTA, etc.
+    "naics_codes": "",
+    "psc_commodity_codes": "",
+    "geographic_preference_requirements": "",
+    "submission_timezone": "",
+    "contract_ceiling_value": "",
+    "budget_range_or_estimate": "",
+    "amendment_numbers_and_versions": "",
+
+    # =========================
+    # 2. Contacts & Submission Details (Doc 1 + contacts table)
+    # =========================
+    "primary_contact_name": "",
+    "primary_contact_title": "",
+    "primary_contact_email": "",
+    "primary_contact_phone": "",
+    "backup_contacts": "",                   # free text or JSON-like string
+    "submission_instructions": "",
+    "clarification_period_deadline": "",
+    "deadline_for_questions": "",
+    "pre_bid_meeting_requirement": "",       # mandatory / optional / none
+    "pre_bid_meeting_location": "",
+    "pre_bid_meeting_datetime": "",
+    "physical_delivery_instructions": "",
+    "packaging_instructions": "",
+    "signatory_authority_requirements": "",
+    "notary_seal_requirements": "",
+    "submission_checklist": "",
+
+    # =========================
+    # 3. Scope of Work / Requirements (scope_requirements table)
+    # =========================
+    "scope_text": "",
+    "deliverables": "",
+    "mandatory_requirements": "",
+    "technical_specs": "",
+    "staffing_ratios": "",
+    "performance_locations": "",
+    "emergency_response_requirements": "",
+    "report_delivery_cadence": "",
+    "deliverable_dependencies": "",
+    "tools_software_required": "",
+    "technology_stack_requirements": "",
+    "governing_policies": "",
+    "travel_and_expense_rules": "",
+    "subcontracting_rules": "",
+    "sla_escalation_workflows": "",
+
+    # =========================
+    # 4. Questionnaire / Forms / Q&A Sections
+    # =========================
+    "questionnaire_sections": "",
+    "table_form_field_requirements": "",
+    "signature_fields_required": "",
+    "compliance_certifications": "",    # E-Verify, SAM.gov, OFAC, etc.
+    "tabs_section_numbering": "",
+    "multi_part_question_patterns": "",
+    "word_page_limits": "",
+    "font_formatting_requirements": "",
+    "excel_table_extraction_notes": "",
+    "mandatory_narrative_sections": "",
+    "disqualifying_questions": "",
+
+    # =========================
+    # 5. Pricing Information (pricing table + Doc 1)
+    # =========================
+    "pricing_tables": "",
+    "pricing_templates": "",
+    "payment_terms": "",
+    "price_escalation_clauses": "",
+    "discounts_or_rebate_structures": "",
+    "travel_reimbursement_policy": "",
+    "multi_year_pricing_requirements": "",
+    "labor_category_mappings": "",
+    "units_of_measure": "",
+    "cost_realism_requirements": "",
+    "pricing_uploadable_formats": "",
+    "pricing_template_constraints": "",
+
+    # =========================
+    # 6. Evaluation & Scoring (evaluation table + Doc 1)
+    # =========================
+    "evaluation_criteria": "",
+    "scoring_matrix": "",
+    "evaluation_committee_roles": "",
+    "tie_breaking_rules": "",
+    "weighted_vs_non_weighted_scoring": "",
+    "pass_fail_criteria": "",
+    "ranking_methodology": "",
+    "presentation_interview_requirements": "",
+    "bafo_requirements": "",
+    "oral_presentation_scoring": "",
+
+    # =========================
+    # 7. Legal / Contractual Requirements (legal_compliance table + Doc 1)
+    # =========================
+    "terms_and_conditions": "",
+    "governing_law_jurisdiction": "",
+    "insurance_requirements": "",
+    "compliance_certifications_list": "",
+    "contract_start_date": "",
+    "contract_duration": "",
+    "risk_sharing_clauses": "",
+    "background_check_rules": "",
+    "termination_clauses": "",
+    "subcontractor_usage_rules": "",
+    "non_performance_penalties": "",
+    "liquidated_damages": "",
+    "security_privacy_requirements": "",
+    "audit_rights_requirements": "",
+    "data_retention_policies": "",
+    "ip_ownership_rules": "",
+
+    # =========================
+    # 8. Attachments & Appendices (attachments table + Doc 1)
+    # =========================
+    "required_attachments": "",
+    "optional_attachments": "",
+    "forms_requiring_signatures": "",
+    "mandatory_returnable_documents": "",
+    "templates_requiring_inputs": "",
+    "compliance_checklists": "",
+    "exhibit_mapping": "",
+    "amendment_files_and_versions": "",
+
+    # =========================
+    # 9. AI-Powered Learning / Company Content Library (Doc 1 – B Section)
+    # These will often be blank for a single RFP doc, but we keep keys.
+    # =========================
+    "company_vision_mission_mentions": "",
+    "technology_stack_descriptions": "",
+    "case_studies_referenced": "",
+    "contract_performance_metrics": "",
+    "staffing_methodologies": "",
+    "sops_and_workflows": "",
+    "success_benchmarks": "",
+    "diversity_inclusion_requirements": "",
+    "iso_soc_hipaa_policies": "",
+    "transition_exit_strategy_requirements": "",
+    "security_compliance_statements": "",
+
+    "reusable_answer_style_preferences": "",
+    "multipart_answer_expectations": "",
+    "agency_specific_preferred_wording": "",
+    "historical_reviewer_comments_clues": "",
+
+    "pricing_history_signals": "",
+    "regional_pricing_variance_notes": "",
+    "margin_or_cost_sensitivity": "",
+    "competitor_pricing_signals": "",
+
+    "historical_awardees_if_mentioned": "",
+    "agency_critical_priorities": "",
+    "evaluation_tendencies": "",
+    "incumbency_indicators": "",
+    "political_or_funding_context": "",
+
+    # =========================
+    # 10. Opportunity Classification & Risk Detection (Doc 1 – 14, 15)
+    # =========================
+    "opportunity_alignment_indicators": "",
+    "resource_capacity_signals": "",
+    "compliance_risk_signals": "",
+    "required_certifications_list": "",
+    "competitive_landscape_indicators": "",
+    "risk_detection_staffing_penalties": "",
+    "risk_detection_performance_bonds": "",
+    "risk_detection_unrealistic_slas": "",
+    "risk_detection_unlimited_liability": "",
+    "risk_detection_247_operations": "",
+    "risk_detection_high_complexity_pricing": "",
+    "risk_detection_exclusivity_restrictions": "",
+
+    # =========================
+    # 11. Workflow / To-Do / Compliance Gaps / Intelligence (Doc 1 – 16, 19, 20)
+    # =========================
+    "required_approvals_or_signoffs": "",
+    "deadline_related_tasks": "",
+    "checklist_of_required_sections": "",
+    "missing_signature_warnings": "",
+    "required_attachments_list": "",
+    "compliance_gaps_summary": "",
+    "qa_checkpoints": "",
+    "document_hierarchy_summary": "",
+    "section_level_grouping_notes": "",
+    "table_detection_notes": "",
+    "cross_reference_mappings": "",
+    "version_alignment_notes": "",
+
+    "compliance_can_meet": "",
+    "compliance_cannot_meet": "",
+    "compliance_needs_review": "",
+    "compliance_mitigation_recommendations": "",
+
+    "proposal_recommended_structure": "",
+    "proposal_auto_win_themes": "",
+    "proposal_auto_graphics_ideas": "",
+    "proposal_formatting_constraints": ""
+}
+
+
+# Field groups (the numbered sections of JSON_TEMPLATE), keyed by the first
+# field of each section, with extra search words for retrieval mode.
+_GROUP_STARTS = {
+    "solicitation_id": ("metadata", "solicitation rfp rfq bid number agency issued date due closing naics psc funding amendment"),
+    "primary_contact_name": ("contacts", "contact officer email phone submit submission deliver questions deadline meeting proposal"),
+    "scope_text": ("scope", "scope work services deliverables requirements tasks technical specifications staff location"),
+    "questionnaire_sections": ("forms", "questionnaire form section tab page limit font format certification narrative question"),
+    "pricing_tables": ("pricing", "price pricing cost fee rate payment invoice discount escalation budget schedule labor"),
+    "evaluation_criteria": ("evaluation", "evaluation criteria score scoring points weight award committee ranking presentation"),
+    "terms_and_conditions": ("legal", "terms conditions contract law insurance liability termination indemnify audit security privacy"),
+    "required_attachments": ("attachments", "attachment appendix exhibit form signature template addendum amendment enclosed"),
+    "company_vision_mission_mentions": ("content_library", "experience case references past performance methodology approach diversity policy"),
+    "opportunity_alignment_indicators": ("risk", "risk penalty bond liability certification required 24 7 exclusive incumbent"),
+    "required_approvals_or_signoffs": ("workflow", "approval sign checklist required sections compliance deadline version proposal structure"),
+}
+
+
+def _build_field_groups() -> Dict[str, Dict[str, Any]]:
+    groups: Dict[str, Dict[str, Any]] = {}
+    current = None
+    for key in JSON_TEMPLATE:
+        if key in _GROUP_STARTS:
+            name, words = _GROUP_STARTS[key]
+            current = groups.setdefault(name, {"keys": [], "query": words})
+        current["keys"].append(key)
+    for group in groups.values():
+        # Field names are descriptive too ("insurance_requirements", ...)
+        group["query"] += " " + " ".join(k.replace("_", " ") for k in group["keys"])
+    return groups
+
+
+FIELD_GROUPS = _build_field_groups()
+
+
+PROMPT_INSTRUCTIONS = """
+You are an RFP / Solicitation document intelligence engine.
+
+Using the following document text, extract ALL relevant information and
+populate the following JSON template.
+
+IMPORTANT RULES:
+- Return ONLY a single JSON object.
+- Use the SAME KEYS and structure as in the template below.
+- For any value that is not present in the document, use an empty string "".
+- Values can be short text, lists serialized as strings, or brief summaries.
+- Do NOT add extra keys.
+"""
+
+DELTA_INSTRUCTIONS = """
+You are an RFP / Solicitation document intelligence engine.
+
+The document below is a near-duplicate of a solicitation whose fields were
+already extracted and verified by a reviewer; those fields are given as the
+JSON below. Compare them with the document text.
+
+IMPORTANT RULES:
+- Return ONLY a single JSON object.
+- Include ONLY the keys whose value is different in this document
+  (dates, amounts, numbers, contacts, scope changes, ...), with the new value.
+- Use "" for a value that no longer appears in the document.
+- Return {} if nothing changed. Do NOT repeat unchanged fields.
+- Do NOT add keys that are not in the JSON below.
+"""
+
+
+def build_prompt(template: Dict[str, Any], doc_text: str,
+                 part: Optional[Tuple[int, int]] = None) -> str:
+    """
+    Build the extraction prompt for the given template and document text.
+    `part` is (index, total) when doc_text is one chunk of a longer document.
+    """
+    part_note = ""
+    if part:
+        part_note = (
+            f"- The text below is part {part[0]} of {part[1]} of a longer document.\n"
+            f"  Fill only what appears in this part; leave everything else \"\".\n"
+        )
+
+    return f"""{PROMPT_INSTRUCTIONS}{part_note}
+JSON TEMPLATE (with example keys, but empty string values):
+
+{json.dumps(template, indent=2)}
+
+Document Text:
+\"\"\"{doc_text}\"\"\"
+"""
+
+
+def build_delta_prompt(seed: Dict[str, Any], doc_text: str,
+                       part: Optional[Tuple[int, int]] = None) -> str:
+    """
+    Prompt for a delta extraction against the verified `seed` fields.
+    """
+    part_note = ""
+    if part:
+        part_note = (
+            f"- The text below is part {part[0]} of {part[1]} of a longer document.\n"
+            f"  Only report changes whose new value appears in this part.\n"
+        )
+
+    return f"""{DELTA_INSTRUCTIONS}{part_note}
+VERIFIED FIELDS:
+
+{json.dumps(seed, indent=2, default=str)}
+
+Document Text:
+\"\"\"{doc_text}\"\"\"
+"""
+
+
+def fake_response() -> str:
+    """
+    A plausible, fully populated model answer for the fake backend, so
+    benchmarks parse and store payloads of realistic size.
+    """
+    return "```json\n" + json.dumps(
+        {key: f"Synthetic value for {key.replace('_', ' ')}" for key in JSON_TEMPLATE}
+    ) + "\n```"
+
+
+def extractor_fingerprint() -> str:
+    """
+    Identify the current extraction setup (model + template + prompt).
+
+    Anything that can change the extracted fields for the same input file
+    must be part of this fingerprint, so cached results are never reused
+    across template or model changes.
+    """
+    h = hashlib.sha256()
+    h.update(MODEL_NAME.encode("utf-8"))
+    h.update(json.dumps(JSON_TEMPLATE, sort_keys=True).encode("utf-8"))
+    h.update(PROMPT_INSTRUCTIONS.encode("utf-8"))
+    h.update(DELTA_INSTRUCTIONS.encode("utf-8"))
+    h.update(f"{EXTRACTION_MODE}:{MAP_REDUCE_THRESHOLD_TOKENS}:"
+             f"{CHUNK_TOKENS}:{CHUNK_OVERLAP_TOKENS}:"
+             f"{RETRIEVAL_PASSAGE_TOKENS}:{RETRIEVAL_TOP_K}:"
+             f"{SECTION_MIN_TOKENS}".encode("utf-8"))
+    h.update(f"{PREEXTRACT_ENABLED}:{PREEXTRACT_MIN_CONFIDENCE}:"
+             f"{preextract.PREEXTRACT_VERSION}".encode("utf-8"))
+    return h.hexdigest()[:16]
 
 
 def _extract_json_block(text: str) -> Dict[str, Any]:
@@ -22,268 +448,385 @@ def _extract_json_block(text: str) -> Dict[str, Any]:
     return json.loads(json_str)
 
 
-def extract_fields_from_text(doc_text: str) -> Dict[str, Any]:
+def _count_model_io(prompt: str, response: str):
+    metrics.MODEL_CHARACTERS.inc(len(prompt), direction="prompt")
+    metrics.MODEL_CHARACTERS.inc(len(response), direction="response")
+    metrics.MODEL_TOKENS.inc(estimate_tokens(prompt), direction="prompt")
+    metrics.MODEL_TOKENS.inc(estimate_tokens(response), direction="response")
+
+
+def _call_model(prompt: str, priority: int) -> Dict[str, Any]:
     """
-    Call Gemini to extract ALL required RFP / solicitation fields
-    based on:
-      - Expanded Information to Extract From Each New Solicitation
-      - SYSTEM DATA SCHEMA (Database-Level Structure) for RFP Automation
+    Send a prompt through the scheduler and parse the JSON answer,
+    timing the model and parse stages separately.
+    """
+    with metrics.stage("model"):
+        raw_text = scheduler.generate(prompt, priority=priority)
+    _count_model_io(prompt, raw_text)
 
-    Returns a Python dict with a flat JSON structure of fields.
-    Keys are snake_case and grouped logically.
+    # Parse out the JSON from the model response
+    with metrics.stage("json_parse"):
+        return _extract_json_block(raw_text)
+
+
+def _generate_fields(template: Dict[str, Any], doc_text: str,
+                     part: Optional[Tuple[int, int]] = None,
+                     priority: int = PRIORITY_INTERACTIVE) -> Dict[str, Any]:
+    with metrics.stage("prompt_build"):
+        prompt = build_prompt(template, doc_text, part)
+    return _call_model(prompt, priority)
+
+
+def _stream_fields(template: Dict[str, Any], doc_text: str, priority: int,
+                   on_field: FieldCallback) -> Dict[str, Any]:
+    """
+    Like _generate_fields, but streams the response and reports each
+    field through `on_field` as soon as its value is complete. Keys that
+    are not in `template` (pre-extracted or excluded fields the model
+    wrote anyway) are neither reported nor returned.
+    """
+    with metrics.stage("prompt_build"):
+        prompt = build_prompt(template, doc_text)
+    parser = IncrementalObjectParser()
+    chunks: List[str] = []
+
+    # Parsing is interleaved with the stream, so it is part of "model" here
+    with metrics.stage("model"):
+        for chunk in scheduler.stream(prompt, priority=priority):
+            chunks.append(chunk)
+            for key, value in parser.feed(chunk):
+                if key in template:
+                    on_field(key, value)
+    _count_model_io(prompt, "".join(chunks))
+
+    if parser.done:
+        fields = parser.result
+    else:
+        # Truncated or unusual response: fall back to the lenient block parser
+        with metrics.stage("json_parse"):
+            fields = _extract_json_block("".join(chunks))
+        for key, value in fields.items():
+            if key in template and key not in parser.result:
+                on_field(key, value)
+    return {key: value for key, value in fields.items() if key in template}
+
+
+def _preextract(doc_text: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Fields filled locally (see preextract.py), and a report of the
+    coverage per field and the model tokens it saves per call.
+    """
+    if not PREEXTRACT_ENABLED:
+        return {}, {"enabled": False}
+    with metrics.stage("preextract"):
+        hits = preextract.find_fields(doc_text)
+
+    filled = {key: value for key, (value, confidence) in hits.items()
+              if confidence >= PREEXTRACT_MIN_CONFIDENCE}
+    coverage = {}
+    for key in preextract.FIELDS:
+        outcome = "filled" if key in filled else "low_confidence" if key in hits else "missed"
+        coverage[key] = outcome
+        metrics.PREEXTRACT_FIELDS.inc(field=key, outcome=outcome)
+
+    removed = {key: "" for key in filled}
+    return filled, {
+        "enabled": True,
+        "fields": coverage,
+        "filled": len(filled),
+        "coverage": round(len(filled) / len(preextract.FIELDS), 3),
+        # Template lines left out of every prompt, and answers the model doesn't write
+        "prompt_tokens_saved_per_call": estimate_tokens(json.dumps(removed, indent=2)) if removed else 0,
+        "response_tokens_saved_per_call": estimate_tokens(json.dumps(filled)) if filled else 0,
+    }
+
+
+def _without(template: Dict[str, Any], keys: Iterable[str]) -> Dict[str, Any]:
+    skip = set(keys)
+    return {key: value for key, value in template.items() if key not in skip}
+
+
+def _use_map_reduce(doc_text: str) -> bool:
+    if EXTRACTION_MODE == "map_reduce":
+        return True
+    if EXTRACTION_MODE == "single":
+        return False
+    return estimate_tokens(doc_text) > MAP_REDUCE_THRESHOLD_TOKENS
+
+
+def _extract_map_reduce(doc_text: str, priority: int,
+                        template: Dict[str, Any] = JSON_TEMPLATE) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Run extraction of `template` on overlapping chunks concurrently and
+    merge the results.
     """
+    chunks = chunk_text(doc_text, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS)
+    total = len(chunks)
 
-    # This JSON template describes ALL the fields we want.
-    # The model is instructed to fill this exact structure.
-    json_template = {
-        # =========================
-        # 1. Basic Solicitation Metadata (Doc 1 + solicitations table)
-        # =========================
-        "solicitation_id": "",
-        "solicitation_number": "",
-        "title": "",
-        "agency": "",
-        "procurement_type": "",           # RFP / RFI / RFQ / Bid / ITB
-        "category": "",                  # IT, Healthcare, HR, Construction, etc.
-        "publish_date": "",
-        "due_date": "",
-        "pre_bid_meeting": "",
-        "document_url": "",
-        "reference_numbers": "",         # could be multiple
-        "funding_source": "",            # Federal/State/Grant/CMS/ARPA etc.
-        "procurement_vehicle": "",       # Open, GSA, IDIQ, BPA, etc.
-        "notice_type": "",               # Solicitation, Amendment, Addendum, etc.
-        "contracting_method": "",        # Best value, LPTA, etc.
-        "naics_codes": "",
-        "psc_commodity_codes": "",
-        "geographic_preference_requirements": "",
-        "submission_timezone": "",
-        "contract_ceiling_value": "",
-        "budget_range_or_estimate": "",
-        "amendment_numbers_and_versions": "",
-
-        # =========================
-        # 2. Contacts & Submission Details (Doc 1 + contacts table)
-        # =========================
-        "primary_contact_name": "",
-        "primary_contact_title": "",
-        "primary_contact_email": "",
-        "primary_contact_phone": "",
-        "backup_contacts": "",                   # free text or JSON-like string
-        "submission_instructions": "",
-        "clarification_period_deadline": "",
-        "deadline_for_questions": "",
-        "pre_bid_meeting_requirement": "",       # mandatory / optional / none
-        "pre_bid_meeting_location": "",
-        "pre_bid_meeting_datetime": "",
-        "physical_delivery_instructions": "",
-        "packaging_instructions": "",
-        "signatory_authority_requirements": "",
-        "notary_seal_requirements": "",
-        "submission_checklist": "",
-
-        # =========================
-        # 3. Scope of Work / Requirements (scope_requirements table)
-        # =========================
-        "scope_text": "",
-        "deliverables": "",
-        "mandatory_requirements": "",
-        "technical_specs": "",
-        "staffing_ratios": "",
-        "performance_locations": "",
-        "emergency_response_requirements": "",
-        "report_delivery_cadence": "",
-        "deliverable_dependencies": "",
-        "tools_software_required": "",
-        "technology_stack_requirements": "",
-        "governing_policies": "",
-        "travel_and_expense_rules": "",
-        "subcontracting_rules": "",
-        "sla_escalation_workflows": "",
-
-        # =========================
-        # 4. Questionnaire / Forms / Q&A Sections
-        # =========================
-        "questionnaire_sections": "",
-        "table_form_field_requirements": "",
-        "signature_fields_required": "",
-        "compliance_certifications": "",    # E-Verify, SAM.gov, OFAC, etc.
-        "tabs_section_numbering": "",
-        "multi_part_question_patterns": "",
-        "word_page_limits": "",
-        "font_formatting_requirements": "",
-        "excel_table_extraction_notes": "",
-        "mandatory_narrative_sections": "",
-        "disqualifying_questions": "",
-
-        # =========================
-        # 5. Pricing Information (pricing table + Doc 1)
-        # =========================
-        "pricing_tables": "",
-        "pricing_templates": "",
-        "payment_terms": "",
-        "price_escalation_clauses": "",
-        "discounts_or_rebate_structures": "",
-        "travel_reimbursement_policy": "",
-        "multi_year_pricing_requirements": "",
-        "labor_category_mappings": "",
-        "units_of_measure": "",
-        "cost_realism_requirements": "",
-        "pricing_uploadable_formats": "",
-        "pricing_template_constraints": "",
-
-        # =========================
-        # 6. Evaluation & Scoring (evaluation table + Doc 1)
-        # =========================
-        "evaluation_criteria": "",
-        "scoring_matrix": "",
-        "evaluation_committee_roles": "",
-        "tie_breaking_rules": "",
-        "weighted_vs_non_weighted_scoring": "",
-        "pass_fail_criteria": "",
-        "ranking_methodology": "",
-        "presentation_interview_requirements": "",
-        "bafo_requirements": "",
-        "oral_presentation_scoring": "",
-
-        # =========================
-        # 7. Legal / Contractual Requirements (legal_compliance table + Doc 1)
-        # =========================
-        "terms_and_conditions": "",
-        "governing_law_jurisdiction": "",
-        "insurance_requirements": "",
-        "compliance_certifications_list": "",
-        "contract_start_date": "",
-        "contract_duration": "",
-        "risk_sharing_clauses": "",
-        "background_check_rules": "",
-        "termination_clauses": "",
-        "subcontractor_usage_rules": "",
-        "non_performance_penalties": "",
-        "liquidated_damages": "",
-        "security_privacy_requirements": "",
-        "audit_rights_requirements": "",
-        "data_retention_policies": "",
-        "ip_ownership_rules": "",
-
-        # =========================
-        # 8. Attachments & Appendices (attachments table + Doc 1)
-        # =========================
-        "required_attachments": "",
-        "optional_attachments": "",
-        "forms_requiring_signatures": "",
-        "mandatory_returnable_documents": "",
-        "templates_requiring_inputs": "",
-        "compliance_checklists": "",
-        "exhibit_mapping": "",
-        "amendment_files_and_versions": "",
-
-        # =========================
-        # 9. AI-Powered Learning / Company Content Library (Doc 1 – B Section)
-        # These will often be blank for a single RFP doc, but we keep keys.
-        # =========================
-        "company_vision_mission_mentions": "",
-        "technology_stack_descriptions": "",
-        "case_studies_referenced": "",
-        "contract_performance_metrics": "",
-        "staffing_methodologies": "",
-        "sops_and_workflows": "",
-        "success_benchmarks": "",
-        "diversity_inclusion_requirements": "",
-        "iso_soc_hipaa_policies": "",
-        "transition_exit_strategy_requirements": "",
-        "security_compliance_statements": "",
-
-        "reusable_answer_style_preferences": "",
-        "multipart_answer_expectations": "",
-        "agency_specific_preferred_wording": "",
-        "historical_reviewer_comments_clues": "",
-
-        "pricing_history_signals": "",
-        "regional_pricing_variance_notes": "",
-        "margin_or_cost_sensitivity": "",
-        "competitor_pricing_signals": "",
-
-        "historical_awardees_if_mentioned": "",
-        "agency_critical_priorities": "",
-        "evaluation_tendencies": "",
-        "incumbency_indicators": "",
-        "political_or_funding_context": "",
-
-        # =========================
-        # 10. Opportunity Classification & Risk Detection (Doc 1 – 14, 15)
-        # =========================
-        "opportunity_alignment_indicators": "",
-        "resource_capacity_signals": "",
-        "compliance_risk_signals": "",
-        "required_certifications_list": "",
-        "competitive_landscape_indicators": "",
-        "risk_detection_staffing_penalties": "",
-        "risk_detection_performance_bonds": "",
-        "risk_detection_unrealistic_slas": "",
-        "risk_detection_unlimited_liability": "",
-        "risk_detection_247_operations": "",
-        "risk_detection_high_complexity_pricing": "",
-        "risk_detection_exclusivity_restrictions": "",
-
-        # =========================
-        # 11. Workflow / To-Do / Compliance Gaps / Intelligence (Doc 1 – 16, 19, 20)
-        # =========================
-        "required_approvals_or_signoffs": "",
-        "deadline_related_tasks": "",
-        "checklist_of_required_sections": "",
-        "missing_signature_warnings": "",
-        "required_attachments_list": "",
-        "compliance_gaps_summary": "",
-        "qa_checkpoints": "",
-        "document_hierarchy_summary": "",
-        "section_level_grouping_notes": "",
-        "table_detection_notes": "",
-        "cross_reference_mappings": "",
-        "version_alignment_notes": "",
-
-        "compliance_can_meet": "",
-        "compliance_cannot_meet": "",
-        "compliance_needs_review": "",
-        "compliance_mitigation_recommendations": "",
-
-        "proposal_recommended_structure": "",
-        "proposal_auto_win_themes": "",
-        "proposal_auto_graphics_ideas": "",
-        "proposal_formatting_constraints": ""
+    with ThreadPoolExecutor(max_workers=min(MAP_CONCURRENCY, total)) as pool:
+        results: List[Dict[str, Any]] = list(pool.map(
+            lambda i: _generate_fields(template, chunks[i], (i + 1, total), priority),
+            range(total),
+        ))
+
+    fields, conflicts = merge_field_results(results, template.keys())
+    return fields, {"mode": "map_reduce", "chunks": total, "conflicts": conflicts}
+
+
+def _extract_retrieval(doc_text: str, priority: int,
+                       on_field: Optional[FieldCallback] = None,
+                       skip: Iterable[str] = ()) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Index the document's passages locally (BM25) and run one smaller call
+    per field group, each with only the top-k passages for that group.
+    Fields in `skip` are not asked for; groups left empty are not called.
+    """
+    passages = chunk_text(doc_text, RETRIEVAL_PASSAGE_TOKENS)
+    index = BM25Index(passages)
+
+    def run_group(group: Dict[str, Any]) -> Dict[str, Any]:
+        ids = index.top_k(group["query"], RETRIEVAL_TOP_K)
+        if not ids:
+            return {}
+        template = {key: "" for key in group["keys"]}
+        context = "\n...\n".join(passages[i] for i in ids)
+        return _generate_fields(template, context, priority=priority)
+
+    skip = set(skip)
+    groups = [{**group, "keys": [key for key in group["keys"] if key not in skip]}
+              for group in FIELD_GROUPS.values()]
+    groups = [group for group in groups if group["keys"]]
+    with ThreadPoolExecutor(max_workers=min(MAP_CONCURRENCY, len(groups))) as pool:
+        futures = [pool.submit(run_group, group) for group in groups]
+        if on_field is not None:
+            # Report each group as soon as its call returns
+            pending = dict(zip(futures, groups))
+            for future in as_completed(pending):
+                result = future.result()
+                for key in pending[future]["keys"]:
+                    on_field(key, result.get(key, ""))
+        results = [future.result() for future in futures]
+
+    fields: Dict[str, Any] = {}
+    for group, result in zip(groups, results):
+        for key in group["keys"]:
+            fields[key] = result.get(key, "")
+
+    return fields, {
+        "mode": "retrieval",
+        "passages": len(passages),
+        "groups": len(groups),
+        "conflicts": {},
     }
 
-    # Build the prompt for the model
-    prompt = f"""
-You are an RFP / Solicitation document intelligence engine.
 
-Using the following document text, extract ALL relevant information and
-populate the following JSON template.
+def _as_list(value: Any) -> List[Any]:
+    if isinstance(value, list):
+        return value
+    return [] if value in ("", None) else [value]
 
-IMPORTANT RULES:
-- Return ONLY a single JSON object.
-- Use the SAME KEYS and structure as in the template below.
-- For any value that is not present in the document, use an empty string "".
-- Values can be short text, lists serialized as strings, or brief summaries.
-- Do NOT add extra keys.
 
-JSON TEMPLATE (with example keys, but empty string values):
+def split_document_sections(doc_text: str) -> List[Dict[str, Any]]:
+    """
+    Sections of `doc_text` as used by sections mode: [{"title", "text", "hash"}].
+    Hashes are salted with the extractor fingerprint, so sections are only
+    reused across documents extracted with the same setup.
+    """
+    return split_sections(doc_text, SECTION_MIN_TOKENS, CHUNK_TOKENS,
+                          salt=extractor_fingerprint())
 
-{json.dumps(json_template, indent=2)}
 
-Document Text:
-\"\"\"{doc_text}\"\"\"
-"""
+def extract_sections_with_report(
+    sections: List[Dict[str, Any]],
+    previous: Optional[Dict[str, Any]] = None,
+    priority: int = PRIORITY_INTERACTIVE,
+    on_field: Optional[FieldCallback] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Extract per section and merge, reusing the fields of every section
+    whose hash already appears in `previous` (the prior version of the
+    same solicitation, with its "sections"). Only new or changed sections
+    are sent to the model.
 
-    response = model.generate_content(prompt)
-    raw_text = response.text
+    Changed sections are merged first, so where the amended text and an
+    unchanged section disagree, the amendment wins. The prior version's
+    amendment_numbers_and_versions is kept alongside the new one, so the
+    field accumulates the amendment history.
 
-    # Parse out the JSON from the model response
-    fields = _extract_json_block(raw_text)
-    # Ensure all template keys exist (fill missing with "")
-    for key in json_template.keys():
-        if key not in fields:
-            fields[key] = ""
+    Fields found by pre-extraction (over the whole text) are not asked
+    for and override the merged values.
 
-    return fields
+    Returns (fields, report, sections to store: [{"hash", "title", "fields"}]).
+    """
+    prefilled, preextract_report = _preextract("\n".join(s["text"] for s in sections))
+    template = _without(JSON_TEMPLATE, prefilled)
+    known = {s["hash"]: s.get("fields", {}) for s in (previous or {}).get("sections", [])}
+    total = len(sections)
+    results: List[Dict[str, Any]] = [known.get(s["hash"], {}) for s in sections]
+    changed = [i for i, s in enumerate(sections) if s["hash"] not in known]
+
+    if changed:
+        with ThreadPoolExecutor(max_workers=min(MAP_CONCURRENCY, len(changed))) as pool:
+            extracted = pool.map(
+                lambda i: _generate_fields(template, sections[i]["text"], (i + 1, total), priority),
+                changed,
+            )
+            for i, result in zip(changed, extracted):
+                results[i] = result
+
+    unchanged = [i for i in range(total) if sections[i]["hash"] in known]
+    fields, conflicts = merge_field_results(
+        [results[i] for i in changed + unchanged], JSON_TEMPLATE.keys()
+    )
+    fields.update(prefilled)
+
+    if previous:
+        # Union (as lists) of the prior history and this version's value
+        key = "amendment_numbers_and_versions"
+        history, _ = merge_field_results(
+            [{key: _as_list((previous.get("fields") or {}).get(key))},
+             {key: _as_list(fields[key])}],
+            [key],
+        )
+        value = history[key]
+        fields[key] = value[0] if isinstance(value, list) and len(value) == 1 else value
+
+    if on_field is not None:
+        for key, value in fields.items():
+            on_field(key, value)
+
+    stored = [
+        {
+            "hash": section["hash"],
+            "title": section["title"],
+            # Only non-empty values: most fields are empty in most sections
+            "fields": {k: v for k, v in result.items() if k in JSON_TEMPLATE and v not in ("", None, [], {})},
+        }
+        for section, result in zip(sections, results)
+    ]
+    report = {
+        "mode": "sections",
+        "sections": total,
+        "reused": total - len(changed),
+        "previous_id": (previous or {}).get("_id"),
+        "conflicts": {k: v for k, v in conflicts.items() if k not in prefilled},
+        "preextract": preextract_report,
+    }
+    return fields, report, stored
+
+
+def extract_delta_with_report(
+    doc_text: str,
+    seed: Dict[str, Any],
+    priority: int = PRIORITY_INTERACTIVE,
+    on_field: Optional[FieldCallback] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Reduced extraction for a near-duplicate of an approved document: the
+    model gets the approved `seed` fields and returns only what changed,
+    which is a fraction of the output tokens of a full extraction.
+    Long documents are split like in map_reduce mode and the per-chunk
+    changes merged.
+    """
+    seed = {key: seed.get(key, "") for key in JSON_TEMPLATE}
+    if estimate_tokens(doc_text) > MAP_REDUCE_THRESHOLD_TOKENS:
+        chunks = chunk_text(doc_text, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS)
+    else:
+        chunks = [doc_text]
+    total = len(chunks)
+
+    def run_chunk(i: int) -> Dict[str, Any]:
+        with metrics.stage("prompt_build"):
+            prompt = build_delta_prompt(seed, chunks[i], (i + 1, total) if total > 1 else None)
+        changes = _call_model(prompt, priority)
+        return {k: v for k, v in changes.items() if k in JSON_TEMPLATE}
+
+    with ThreadPoolExecutor(max_workers=min(MAP_CONCURRENCY, total)) as pool:
+        results = list(pool.map(run_chunk, range(total)))
+
+    changed_keys = [key for key in JSON_TEMPLATE if any(key in r for r in results)]
+    changes, conflicts = merge_field_results(results, changed_keys)
+    fields = {**seed, **changes}
+
+    if on_field is not None:
+        for key, value in fields.items():
+            on_field(key, value)
+
+    return fields, {
+        "mode": "delta",
+        "chunks": total,
+        "changed": changed_keys,
+        "conflicts": conflicts,
+    }
 
+
+def extract_fields_with_report(
+    doc_text: str,
+    priority: int = PRIORITY_INTERACTIVE,
+    on_field: Optional[FieldCallback] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Same as extract_fields_from_text, but also returns a small report about
+    how the fields were produced (mode, number of chunks, and fields whose
+    chunks disagreed, with all candidate values).
+
+    `priority` is the scheduler lane (interactive uploads before batch work).
+    `on_field(key, value)` is called from this thread as fields become
+    known: pre-extracted fields first, then per field while the model
+    streams in single mode, per field group in retrieval mode, and after
+    the merge in map_reduce mode.
+    """
+    if EXTRACTION_MODE == "sections":
+        fields, report, _ = extract_sections_with_report(
+            split_document_sections(doc_text), None, priority, on_field
+        )
+        return fields, report
+
+    # Pattern-shaped fields are known before any model call
+    prefilled, preextract_report = _preextract(doc_text)
+    if on_field is not None:
+        for key, value in prefilled.items():
+            on_field(key, value)
+    template = _without(JSON_TEMPLATE, prefilled)
+
+    # Documents shorter than top-k passages gain nothing from retrieval
+    retrieval_budget = RETRIEVAL_PASSAGE_TOKENS * RETRIEVAL_TOP_K
+    if EXTRACTION_MODE == "retrieval" and estimate_tokens(doc_text) > retrieval_budget:
+        fields, report = _extract_retrieval(doc_text, priority, on_field, prefilled)
+    elif _use_map_reduce(doc_text):
+        fields, report = _extract_map_reduce(doc_text, priority, template)
+        if on_field is not None:
+            for key, value in fields.items():
+                on_field(key, value)
+    else:
+        if on_field is not None:
+            fields = _stream_fields(template, doc_text, priority, on_field)
+        else:
+            fields = _generate_fields(template, doc_text, priority=priority)
+        # Ensure all template keys exist (fill missing with "")
+        for key in template.keys():
+            if key not in fields:
+                fields[key] = ""
+        report = {"mode": "single", "chunks": 1, "conflicts": {}}
+
+    # Whatever the model said about them, the matched values stand
+    fields.update(prefilled)
+    report["preextract"] = preextract_report
+    return fields, report
+
+
+def extract_fields_from_text(doc_text: str, priority: int = PRIORITY_INTERACTIVE) -> Dict[str, Any]:
+    """
+    Call Gemini to extract ALL required RFP / solicitation fields
+    based on:
+      - Expanded Information to Extract From Each New Solicitation
+      - SYSTEM DATA SCHEMA (Database-Level Structure) for RFP Automation
+
+    Returns a Python dict with a flat JSON structure of fields.
+    Keys are snake_case and grouped logically.
+
+    Long documents are split into chunks that are extracted concurrently
+    and merged (see EXTRACTION_MODE).
+    """
+    fields, _ = extract_fields_with_report(doc_text, priority)
+    return fields
@@ -0,0 +1,141 @@
+"""
+Index management for the Mongo collections.
+
+Indexes are declared once in INDEXES and created idempotently at app
+startup. Run this module directly to verify that every hot query in
+main.py is served by an index:
+
+    python indexes.py            # create missing indexes
+    python indexes.py --explain  # create, then fail on any COLLSCAN
+"""
+import sys
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+
+from database import db
+from jobqueue import JOB_RETENTION_SECONDS
+
+# collection -> [(keys, options)]
+INDEXES: Dict[str, List[Tuple[List[Tuple[str, int]], Dict[str, Any]]]] = {
+    "documents": [
+        # /documents/approved: filter on status, keyset order on (created_at, _id)
+        ([("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+         {"name": "status_created_at_id"}),
+        # /documents/latest
+        ([("created_at", DESCENDING)], {"name": "created_at"}),
+        # Finding the previous version of an amended solicitation (multikey)
+        ([("sections.hash", ASCENDING)], {"name": "sections_hash", "sparse": True}),
+    ],
+    "minhash_lsh": [
+        # Near-duplicate lookup: any shared band key, approved documents only
+        ([("bands", ASCENDING), ("approved", ASCENDING)], {"name": "bands_approved"}),
+    ],
+    "extraction_cache": [
+        ([("expires_at", ASCENDING)], {"name": "expires_at_ttl", "expireAfterSeconds": 0}),
+        ([("last_used_at", ASCENDING)], {"name": "last_used_at"}),
+    ],
+    "jobs": [
+        # Claiming: visible queued jobs, oldest first
+        ([("status", ASCENDING), ("visible_at", ASCENDING)], {"name": "status_visible_at"}),
+        # Claiming: running jobs whose lease expired
+        ([("status", ASCENDING), ("lease_expires_at", ASCENDING)], {"name": "status_lease_expires_at"}),
+        # Following completed jobs (search index of the API processes),
+        # keyset on (finished_at, _id)
+        ([("status", ASCENDING), ("finished_at", ASCENDING), ("_id", ASCENDING)],
+         {"name": "status_finished_at_id"}),
+        # Only finished jobs have finished_at; they are deleted after the retention period
+        ([("finished_at", ASCENDING)],
+         {"name": "finished_at_ttl", "expireAfterSeconds": JOB_RETENTION_SECONDS}),
+    ],
+}
+
+
+def ensure_indexes(database=db):
+    """
+    Create every declared index. Existing indexes with the same
+    definition are left alone, so this is safe to run on every startup.
+    """
+    for collection, indexes in INDEXES.items():
+        for keys, options in indexes:
+            database[collection].create_index(keys, **options)
+
+
+# Queries issued by the API on every request, by name. Each returns a
+# cursor that is explain()ed by check_query_plans().
+HOT_QUERIES: Dict[str, Callable[[Any], Any]] = {
+    "get_document": lambda d: d["documents"].find({"_id": "x"}).limit(1),
+    "latest_document": lambda d: d["documents"].find().sort([("created_at", -1)]).limit(1),
+    "approved_first_page": lambda d: d["documents"].find({"status": "approved"})
+        .sort([("created_at", -1), ("_id", -1)]).limit(50),
+    "approved_next_page": lambda d: d["documents"].find({
+        "status": "approved",
+        "$or": [
+            {"created_at": {"$lt": datetime.utcnow()}},
+            {"created_at": datetime.utcnow(), "_id": {"$lt": "x"}},
+        ],
+    }).sort([("created_at", -1), ("_id", -1)]).limit(50),
+    "previous_version": lambda d: d["documents"].find({"sections.hash": {"$in": ["x", "y"]}})
+        .sort([("created_at", -1)]).limit(5),
+    "near_duplicate_lookup": lambda d: d["minhash_lsh"].find(
+        {"bands": {"$in": ["0:x", "1:y"]}, "approved": True}, {"signature": 1}),
+    "cache_lookup": lambda d: d["extraction_cache"].find({"_id": "x"}).limit(1),
+    "dashboard_stats": lambda d: d["stats"].find({"_id": "documents"}).limit(1),
+    "job_status": lambda d: d["jobs"].find({"_id": "x"}).limit(1),
+    # The $match stage of the job counts aggregation (/metrics)
+    "job_counts": lambda d: d["jobs"].find(
+        {"status": {"$in": ["queued", "running", "dead"]}}, {"status": 1, "_id": 0}),
+    "job_claim": lambda d: d["jobs"].find({"$or": [
+        {"status": "queued", "visible_at": {"$lte": datetime.utcnow()}},
+        {"status": "running", "lease_expires_at": {"$lt": datetime.utcnow()}},
+    ]}).sort([("visible_at", 1)]).limit(1),
+    "finished_jobs": lambda d: d["jobs"].find({
+        "status": "done",
+        "$or": [
+            {"finished_at": {"$gt": datetime.utcnow()}},
+            {"finished_at": datetime.utcnow(), "_id": {"$gt": "x"}},
+        ],
+    }).sort([("finished_at", 1), ("_id", 1)]).limit(500),
+}
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = [plan["stage"]] if "stage" in plan else []
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+
+def check_query_plans(database=db) -> Dict[str, List[str]]:
+    """
+    Explain every hot query and return {query name: winning plan stages}.
+    """
+    plans = {}
+    for name, query in HOT_QUERIES.items():
+        explain = query(database).explain()
+        plans[name] = _plan_stages(explain["queryPlanner"]["winningPlan"])
+    return plans
+
+
+def main(argv: List[str]) -> int:
+    ensure_indexes()
+    print("Indexes are in place")
+
+    if "--explain" not in argv:
+        return 0
+
+    failed = False
+    for name, stages in check_query_plans().items():
+        status = "COLLSCAN" if "COLLSCAN" in stages else "ok"
+        failed = failed or status != "ok"
+        print(f"{status:9} {name}: {' <- '.join(stages)}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,170 @@
+"""
+Upload ingestion.
+
+Uploads are copied to a spool file in UPLOAD_CHUNK_BYTES chunks and
+hashed along the way, so an upload is never held in memory as a whole:
+the job queue keeps a path, the cache key comes from the streaming hash,
+and the parser processes open the spool file themselves (see
+extract.extract_text_from_path). Peak memory per upload is one chunk,
+whatever the file size.
+
+Size limits are enforced twice: UploadLimitMiddleware rejects request
+bodies that declare (or turn out) too large before they are buffered,
+and spool() stops copying a file once it exceeds its own limit.
+"""
+import hashlib
+import io
+import json
+import mmap
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import IO, Dict, Iterator, Optional, Tuple
+
+# Where spooled uploads are written (default: the system temp directory)
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+# Size of each read/write while spooling
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+# Largest single document accepted by /upload
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+# Largest request body accepted by /upload/batch (all files, or the zip)
+MAX_BATCH_UPLOAD_BYTES = int(os.getenv("MAX_BATCH_UPLOAD_BYTES", str(2 * 1024 * 1024 * 1024)))
+# Room for multipart boundaries, part headers and form fields
+_MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLargeError(Exception):
+    pass
+
+
+class SpooledUpload:
+    """
+    An upload written to disk: its path, size and SHA-256.
+    """
+
+    def __init__(self, path: str, size: int, sha256: str):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def copy_hashed(src: IO[bytes], dst: IO[bytes], max_bytes: Optional[int] = None,
+                chunk_bytes: int = UPLOAD_CHUNK_BYTES) -> Tuple[int, str]:
+    """
+    Copy `src` to `dst` chunk by chunk, hashing on the way; returns
+    (size, sha256). Raises UploadTooLargeError as soon as more than
+    `max_bytes` were read.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = src.read(chunk_bytes)
+        if not chunk:
+            break
+        size += len(chunk)
+        if max_bytes is not None and size > max_bytes:
+            raise UploadTooLargeError(f"File exceeds {max_bytes} bytes")
+        digest.update(chunk)
+        dst.write(chunk)
+    return size, digest.hexdigest()
+
+
+def spool(src: IO[bytes], max_bytes: Optional[int] = MAX_UPLOAD_BYTES) -> SpooledUpload:
+    """
+    Write `src` to a new spool file. The caller owns the file and must
+    remove() it once done; it is removed here if the copy fails.
+    """
+    fd, path = tempfile.mkstemp(prefix="upload-", dir=UPLOAD_SPOOL_DIR)
+    try:
+        with os.fdopen(fd, "wb") as dst:
+            size, sha256 = copy_hashed(src, dst, max_bytes)
+    except BaseException:
+        os.remove(path)
+        raise
+    return SpooledUpload(path, size, sha256)
+
+
+@contextmanager
+def mapped(path: str) -> Iterator[IO]:
+    """
+    Read-only memory map of a file. Pages are loaded on demand and backed
+    by the file, so they don't count against the process like a copy in
+    a bytes object would.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # Empty files can't be mapped; let the parser report the error
+            yield io.BytesIO()
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            yield view
+
+
+async def _reject(send, limit: int):
+    body = json.dumps({"detail": f"Upload exceeds {limit} bytes"}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [(b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware answering 413 for upload bodies over their path's
+    limit, before they are parsed. Bodies declaring a Content-Length are
+    rejected up front; chunked bodies are counted as they arrive and cut
+    off once over the limit.
+    """
+
+    def __init__(self, app, limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.limits = limits if limits is not None else {
+            "/upload": MAX_UPLOAD_BYTES + _MULTIPART_OVERHEAD,
+            "/upload/batch": MAX_BATCH_UPLOAD_BYTES + _MULTIPART_OVERHEAD,
+        }
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path", "")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            await _reject(send, limit)
+            return
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise UploadTooLargeError(f"Upload exceeds {limit} bytes")
+            return message
+
+        async def guarded_send(message):
+            # Whatever the app makes of the aborted body, the client gets the 413
+            if not exceeded:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded:
+            await _reject(send, limit)
@@ -0,0 +1,382 @@
+"""
+Durable extraction job queue in Mongo (JOB_BACKEND=mongo).
+
+The in-process JobManager (jobs.py) keeps its queue and job states in
+memory: they die with the process, and one process does all the
+extraction. With JOB_BACKEND=mongo the API only stores the upload and a
+job document; any number of worker processes, on any host that reaches
+Mongo, claim and run the jobs (see worker.py).
+
+Uploads go to GridFS (bucket "uploads"), so workers don't need to share
+a filesystem with the API. A job document moves through
+
+    queued -> running -> done
+                      -> queued (retry, after a back-off)
+                      -> dead   (dead-lettered after JOB_MAX_ATTEMPTS)
+
+  - claim() atomically takes the oldest visible queued job, or a running
+    job whose lease expired (its worker died), and leases it to the
+    caller for JOB_LEASE_SECONDS.
+  - heartbeat() extends the lease while the job runs; a worker that
+    can't renew it has lost the job and must stop.
+  - complete() / fail() / publish() only apply while the caller still
+    holds the lease, so a stale worker can't overwrite a newer attempt.
+  - The document created by a job has the job's id as its _id, so
+    completion is idempotent: a retried job whose document already
+    exists finishes its persist (pipeline.finish_persist) and is marked
+    done.
+
+Progress events are written to the job document; the API streams them
+from there, whichever worker runs the job. Stage and outcome events are
+appended to `events`; field events only keep the latest one per field
+(`field_events`, like the in-process queue), so a job document stays
+bounded by the template size however many times fields are re-sent.
+"""
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import gridfs
+from pymongo import ReturnDocument
+
+from database import db
+from ingest import SpooledUpload
+from jobs import JOB_QUEUE_SIZE, QueueFullError
+
+# "memory": in-process queue and workers (jobs.py); "mongo": this module
+JOB_BACKEND = os.getenv("JOB_BACKEND", "memory")
+# How long a claimed job belongs to its worker without a heartbeat
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# Attempts (claims) before a job is dead-lettered
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Back-off before a failed job is retried: base * 2^(attempt - 1), capped
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "300"))
+# How often job event streams (and idle workers) look for changes
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.5"))
+# Finished and dead-lettered jobs are deleted after this long
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(7 * 86400)))
+
+FINISHED = ("done", "dead")
+_MAX_EVENTS_READ = 10000
+_FINISHED_PAGE = 500
+
+
+class JobRecord:
+    """
+    A job document, with the same read surface as jobs.Job.
+    """
+
+    def __init__(self, doc: Dict[str, Any]):
+        self.doc = doc
+        self.id = doc["_id"]
+        self.status = doc["status"]
+        self.events: List[Dict[str, Any]] = doc.get("events", [])
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def to_dict(self) -> Dict[str, Any]:
+        doc = self.doc
+        return {
+            "id": self.id,
+            "filename": doc["filename"],
+            # Dead-lettered jobs read as failed, like in-process ones
+            "status": "failed" if self.status == "dead" else self.status,
+            "stage": doc.get("stage"),
+            "document_id": doc.get("document_id"),
+            "error": doc.get("error"),
+            "attempts": doc.get("attempts", 0),
+            "dead_letter": self.status == "dead",
+            "created_at": doc["created_at"].isoformat(),
+            "updated_at": doc["updated_at"].isoformat(),
+        }
+
+
+def _field_path(key: str) -> str:
+    # Field names become keys of a subdocument: no dots, no leading "$"
+    return key.replace(".", "_").lstrip("$") or "_"
+
+
+def _event(event: str, status: str, stage: Optional[str] = None, **extra) -> Dict[str, Any]:
+    return {"event": event, "status": status, "stage": stage,
+            "at": datetime.utcnow().isoformat(), **extra}
+
+
+class MongoJobQueue:
+    """
+    The jobs collection and its upload bucket. Every method is
+    synchronous (pymongo) except the ones the API awaits: submit() and
+    events().
+    """
+
+    def __init__(self, collection, bucket: gridfs.GridFSBucket,
+                 queue_size: int = JOB_QUEUE_SIZE,
+                 lease_seconds: float = JOB_LEASE_SECONDS,
+                 max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.collection = collection
+        self.bucket = bucket
+        self.queue_size = queue_size
+        self.lease = timedelta(seconds=lease_seconds)
+        self.max_attempts = max_attempts
+
+    # ---------- API side ----------
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def _enqueue(self, upload: SpooledUpload, filename: str,
+                 previous_id: Optional[str]) -> JobRecord:
+        if self.collection.count_documents({"status": "queued"}) >= self.queue_size:
+            raise QueueFullError("Too many documents waiting to be processed")
+
+        job_id = str(uuid.uuid4())
+        with open(upload.path, "rb") as f:
+            file_id = self.bucket.upload_from_stream(
+                filename, f, metadata={"job_id": job_id, "sha256": upload.sha256},
+            )
+        now = datetime.utcnow()
+        doc = {
+            "_id": job_id,
+            "filename": filename,
+            "previous_id": previous_id,
+            "file_id": file_id,
+            "sha256": upload.sha256,
+            "size": upload.size,
+            "status": "queued",
+            "attempts": 0,
+            "visible_at": now,
+            "created_at": now,
+            "updated_at": now,
+            "events": [_event("queued", "queued")],
+        }
+        try:
+            self.collection.insert_one(doc)
+        except BaseException:
+            self.bucket.delete(file_id)
+            raise
+        return JobRecord(doc)
+
+    async def submit(self, upload: SpooledUpload, filename: str,
+                     previous_id: Optional[str] = None) -> JobRecord:
+        """
+        Store a spooled upload in GridFS and queue a job for it. The spool
+        file is removed either way; workers read the GridFS copy.
+        """
+        try:
+            return await asyncio.to_thread(self._enqueue, upload, filename, previous_id)
+        finally:
+            upload.remove()
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        doc = self.collection.find_one({"_id": job_id})
+        return JobRecord(doc) if doc is not None else None
+
+    def stats(self) -> Dict[str, int]:
+        # One aggregation per /metrics scrape, matched on the status index
+        counts = {"queued": 0, "running": 0, "dead": 0}
+        for row in self.collection.aggregate([
+            {"$match": {"status": {"$in": list(counts)}}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+        ]):
+            counts[row["_id"]] = row["count"]
+        return counts
+
+    def finished_after(self, after: Tuple[datetime, str],
+                       limit: int = _FINISHED_PAGE) -> List[Dict[str, Any]]:
+        """
+        Up to `limit` jobs completed after the (finished_at, _id) position
+        `after`, in that order (document_id, finished_at). Keyset on both,
+        so jobs finished in the same millisecond are not skipped.
+        """
+        finished_at, last_id = after
+        return list(self.collection.find(
+            {"status": "done", "$or": [
+                {"finished_at": {"$gt": finished_at}},
+                {"finished_at": finished_at, "_id": {"$gt": last_id}},
+            ]},
+            {"document_id": 1, "finished_at": 1},
+        ).sort([("finished_at", 1), ("_id", 1)]).limit(limit))
+
+    async def events(self, job: JobRecord) -> AsyncIterator[str]:
+        """
+        Server-Sent Events stream of the job's events, replayed from the
+        start and followed (by polling the job document) until it finishes.
+        Field events are sent once per new value, in time order with the
+        others.
+        """
+        doc = job.doc
+        status, new_events = job.status, job.events
+        fields = doc.get("field_events") or {}
+        fields_version = doc.get("fields_version", 0)
+        sent = 0
+        sent_fields: Dict[str, str] = {}
+        while True:
+            changed = [e for path, e in fields.items() if sent_fields.get(path) != e["at"]]
+            sent_fields.update((path, e["at"]) for path, e in fields.items())
+            for event in sorted(new_events + changed, key=lambda e: e["at"]):
+                yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+            sent += len(new_events)
+            if status in FINISHED:
+                return
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            # Only the events not sent yet are read back, and the field
+            # events only when one of them changed
+            doc = await asyncio.to_thread(
+                self.collection.find_one, {"_id": job.id},
+                {"status": 1, "fields_version": 1,
+                 "events": {"$slice": [sent, _MAX_EVENTS_READ]}},
+            )
+            if doc is None:
+                return
+            status, new_events = doc["status"], doc.get("events", [])
+            fields = {}
+            if doc.get("fields_version", 0) != fields_version:
+                fields_version = doc["fields_version"]
+                fields = (await asyncio.to_thread(
+                    self.collection.find_one, {"_id": job.id}, {"field_events": 1},
+                ) or {}).get("field_events") or {}
+
+    # ---------- worker side ----------
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Lease the next runnable job to `worker_id`; None when there is none.
+        Jobs whose lease expired more than max_attempts times (their
+        worker keeps dying on them) are dead-lettered on the way.
+        """
+        while True:
+            now = datetime.utcnow()
+            job = self.collection.find_one_and_update(
+                {"$or": [
+                    {"status": "queued", "visible_at": {"$lte": now}},
+                    {"status": "running", "lease_expires_at": {"$lt": now}},
+                ]},
+                {
+                    "$set": {"status": "running", "worker_id": worker_id,
+                             "lease_expires_at": now + self.lease,
+                             "started_at": now, "updated_at": now},
+                    "$inc": {"attempts": 1},
+                },
+                sort=[("visible_at", 1)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if job is None or job["attempts"] <= self.max_attempts:
+                return job
+            self._finish(job, worker_id, "dead", "failed",
+                         error=job.get("error") or "Lease expired on every attempt")
+
+    def heartbeat(self, job: Dict[str, Any], worker_id: str) -> bool:
+        """
+        Extend the lease; False when the job is no longer ours.
+        """
+        now = datetime.utcnow()
+        result = self.collection.update_one(
+            self._owned(job, worker_id),
+            {"$set": {"lease_expires_at": now + self.lease, "updated_at": now}},
+        )
+        return result.matched_count == 1
+
+    def publish(self, job: Dict[str, Any], worker_id: str, events: List[Dict[str, Any]],
+                stage: Optional[str] = None) -> bool:
+        """
+        Write progress events (see progress_event()) to a job we hold:
+        field events replace the field's previous one, the others are
+        appended.
+        """
+        now = datetime.utcnow()
+        update: Dict[str, Any] = {"$set": {"updated_at": now}}
+        appended = [e for e in events if e["event"] != "field"]
+        if appended:
+            update["$push"] = {"events": {"$each": appended}}
+        for event in events:
+            if event["event"] == "field":
+                update["$set"][f"field_events.{_field_path(event['key'])}"] = event
+                update["$inc"] = {"fields_version": 1}
+        if stage is not None:
+            update["$set"]["stage"] = stage
+        return self.collection.update_one(self._owned(job, worker_id), update).matched_count == 1
+
+    def complete(self, job: Dict[str, Any], worker_id: str, document_id: str) -> bool:
+        """
+        Mark a job done. A no-op (returning False) if it already finished
+        or was taken over by another worker.
+        """
+        return self._finish(job, worker_id, "done", "done", document_id=document_id)
+
+    def fail(self, job: Dict[str, Any], worker_id: str, error: str) -> str:
+        """
+        Record a failed attempt: the job is queued again after a back-off,
+        or dead-lettered once it has used up its attempts. Returns the
+        job's new status ("" if it was no longer ours).
+        """
+        attempts = job["attempts"]
+        if attempts >= self.max_attempts:
+            return "dead" if self._finish(job, worker_id, "dead", "failed", error=error) else ""
+
+        delay = min(JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), JOB_RETRY_MAX_SECONDS)
+        now = datetime.utcnow()
+        result = self.collection.update_one(self._owned(job, worker_id), {
+            "$set": {"status": "queued", "error": error, "stage": None,
+                     "visible_at": now + timedelta(seconds=delay), "updated_at": now},
+            "$unset": {"worker_id": "", "lease_expires_at": ""},
+            "$push": {"events": _event("retrying", "queued", error=error,
+                                       attempt=attempts, retry_in_seconds=delay)},
+        })
+        return "queued" if result.matched_count == 1 else ""
+
+    def open_upload(self, job: Dict[str, Any]):
+        """
+        Readable stream of the job's upload.
+        """
+        return self.bucket.open_download_stream(job["file_id"])
+
+    @staticmethod
+    def _owned(job: Dict[str, Any], worker_id: str) -> Dict[str, Any]:
+        return {"_id": job["_id"], "status": "running", "worker_id": worker_id}
+
+    def _finish(self, job: Dict[str, Any], worker_id: str, status: str, event: str,
+                **extra) -> bool:
+        now = datetime.utcnow()
+        result = self.collection.update_one(self._owned(job, worker_id), {
+            "$set": {"status": status, "finished_at": now, "updated_at": now, **extra},
+            "$unset": {"lease_expires_at": ""},
+            "$push": {"events": _event(event, status, job.get("stage"), **extra)},
+        })
+        if result.matched_count != 1:
+            return False
+        # The upload is not needed anymore once the job has finished
+        try:
+            self.bucket.delete(job["file_id"])
+        except gridfs.errors.NoFile:
+            pass
+        return True
+
+
+def progress_event(event: str, stage: Optional[str] = None, **extra) -> Dict[str, Any]:
+    """
+    A progress event of a running job, as stored by publish().
+    """
+    return _event(event, "running", stage, **extra)
+
+
+_job_queue: Optional[MongoJobQueue] = None
+
+
+def get_job_queue() -> MongoJobQueue:
+    """
+    The queue on the "jobs" collection, created on first use: only the
+    API and workers of a JOB_BACKEND=mongo deployment need one, and GridFS
+    can't be set up against anything but a real pymongo database.
+    """
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = MongoJobQueue(db["jobs"], gridfs.GridFSBucket(db, bucket_name="uploads"))
+    return _job_queue
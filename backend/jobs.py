@@ -0,0 +1,226 @@
+import asyncio
+import json
+import os
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from ingest import SpooledUpload
+from pipeline import process_document
+from profiler import profiler
+
+# How many documents are processed at the same time
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))
+# How many uploads may wait in the queue before /upload starts refusing
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+# How many finished jobs are kept around for status lookups
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", "1000"))
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+    """
+    One queued upload and its progress through the pipeline.
+    """
+
+    def __init__(self, filename: str, upload: SpooledUpload, previous_id: Optional[str] = None):
+        self.id = str(uuid.uuid4())
+        self.filename = filename
+        self.previous_id = previous_id
+        self.status = "queued"      # queued / running / done / failed
+        self.stage: Optional[str] = None
+        self.document_id: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.updated_at = self.created_at
+        # Stage and terminal events, replayed to every subscriber
+        self.events: List[Tuple[int, Dict[str, Any]]] = []
+        # Latest event per extracted field; dropped once the job finishes
+        # (the document has the values), so a finished job holds no field data
+        self.fields: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        self._seq = 0
+
+        self._upload: Optional[SpooledUpload] = upload
+        self._changed = asyncio.Event()
+        self.publish("queued")
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def publish(self, event: str, **extra):
+        self.updated_at = datetime.utcnow()
+        self._seq += 1
+        entry = (self._seq, {
+            "event": event,
+            "status": self.status,
+            "stage": self.stage,
+            "at": self.updated_at.isoformat(),
+            **extra,
+        })
+        if event == "field":
+            self.fields[extra["key"]] = entry
+        else:
+            self.events.append(entry)
+        if self.finished:
+            # Subscribers still streaming keep their reference to the old dict
+            self.fields = {}
+        # Wake up every subscriber, then arm a fresh event for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def set_stage(self, stage: str):
+        self.stage = stage
+        self.publish("stage")
+
+    def set_field(self, key: str, value: Any):
+        self.publish("field", key=key, value=value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "stage": self.stage,
+            "document_id": self.document_id,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+        }
+
+
+class JobManager:
+    """
+    In-process job queue with a fixed pool of asyncio workers.
+
+    `/upload` only enqueues; the workers run parse -> extract -> persist,
+    so request latency no longer depends on model latency.
+    """
+
+    def __init__(self, concurrency: int = JOB_CONCURRENCY,
+                 queue_size: int = JOB_QUEUE_SIZE,
+                 retention: int = JOB_RETENTION):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.retention = retention
+
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.running = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [
+            asyncio.create_task(self._worker())
+            for _ in range(self.concurrency)
+        ]
+
+    async def stop(self):
+        for w in self._workers:
+            w.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # Uploads still waiting are lost with the process; don't leave their spool files
+        while not self._queue.empty():
+            self._queue.get_nowait()._upload.remove()
+
+    async def submit(self, upload: SpooledUpload, filename: str,
+                     previous_id: Optional[str] = None) -> Job:
+        """
+        Queue a spooled upload. The job owns the spool file from then on
+        and removes it when it finishes (or here, if the queue is full).
+        """
+        job = Job(filename, upload, previous_id)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            upload.remove()
+            raise QueueFullError("Too many documents waiting to be processed")
+
+        self.jobs[job.id] = job
+        self._prune()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def _prune(self):
+        # Drop the oldest finished jobs once we keep more than `retention`
+        excess = len(self.jobs) - self.retention
+        for job_id in list(self.jobs):
+            if excess <= 0:
+                break
+            if self.jobs[job_id].finished:
+                del self.jobs[job_id]
+                excess -= 1
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self.running += 1
+            try:
+                await self._run(job)
+            finally:
+                self.running -= 1
+                self._queue.task_done()
+
+    async def _run(self, job: Job):
+        job.status = "running"
+        job.publish("started")
+        try:
+            with profiler.profile(f"job {job.filename}"):
+                result = await process_document(
+                    job._upload, job.filename,
+                    on_stage=job.set_stage, on_field=job.set_field,
+                    previous_id=job.previous_id,
+                )
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            job.publish("failed", error=job.error)
+        else:
+            job.status = "done"
+            job.document_id = result["id"]
+            job.publish("done", document_id=job.document_id)
+        finally:
+            # The upload is not needed anymore once the job has finished
+            job._upload.remove()
+            job._upload = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": self.running,
+            "workers": self.concurrency,
+        }
+
+    async def events(self, job: Job) -> AsyncIterator[str]:
+        """
+        Server-Sent Events stream of the job's events, replayed from the
+        start and followed until the job finishes. Field events are only
+        replayed while the job runs, latest value per field.
+        """
+        sent = last_seq = 0
+        # Captured once: a finished job drops its field events, but this
+        # subscriber still gets every one published while it was connected
+        fields = job.fields
+        while True:
+            changed = job._changed
+            new = job.events[sent:]
+            sent += len(new)
+            new += [entry for entry in fields.values() if entry[0] > last_seq]
+            for seq, event in sorted(new, key=lambda entry: entry[0]):
+                last_seq = max(last_seq, seq)
+                yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+            if job.finished:
+                return
+            await changed.wait()
+
+
+job_manager = JobManager()
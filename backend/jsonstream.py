@@ -0,0 +1,124 @@
+import json
+from typing import Any, Dict, List, Tuple
+
+
+class IncrementalObjectParser:
+    """
+    Incremental parser for the single JSON object the model streams back.
+
+    Feed it text chunks as they arrive; feed() returns the top-level
+    (key, value) pairs that were completed by that chunk, so a field can
+    be shown as soon as its value closes instead of after the whole
+    response.
+
+    It is deliberately forgiving, like _extract_json_block:
+      - anything before the first "{" (e.g. a ```json fence) is skipped,
+        and anything after the closing "}" is ignored,
+      - trailing commas are accepted,
+      - a value that is not valid JSON (e.g. unquoted text) is returned as
+        the raw, stripped text instead of failing the whole response.
+    """
+
+    def __init__(self):
+        self.result: Dict[str, Any] = {}
+        self.done = False
+
+        self._state = "start"   # start / key / key_str / colon / value / after_value
+        self._buf: List[str] = []
+        self._key = ""
+        self._depth = 0         # nesting depth inside the current value
+        self._in_string = False
+        self._escape = False
+
+    def _emit(self, out: List[Tuple[str, Any]]):
+        raw = "".join(self._buf).strip()
+        self._buf = []
+        if not raw:
+            return
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = raw.strip('"')
+        self.result[self._key] = value
+        out.append((self._key, value))
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        out: List[Tuple[str, Any]] = []
+
+        for ch in text:
+            if self.done:
+                break
+            state = self._state
+
+            if state == "start":
+                if ch == "{":
+                    self._state = "key"
+
+            elif state == "key":
+                if ch == '"':
+                    self._buf = [ch]
+                    self._state = "key_str"
+                elif ch == "}":
+                    self.done = True
+
+            elif state == "key_str":
+                self._buf.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    raw = "".join(self._buf)
+                    try:
+                        self._key = json.loads(raw)
+                    except ValueError:
+                        # Malformed escape: keep the key as written, like values
+                        self._key = raw[1:-1]
+                    self._buf = []
+                    self._state = "colon"
+
+            elif state == "colon":
+                if ch == ":":
+                    self._state = "value"
+
+            elif state == "value":
+                if self._in_string:
+                    self._buf.append(ch)
+                    if self._escape:
+                        self._escape = False
+                    elif ch == "\\":
+                        self._escape = True
+                    elif ch == '"':
+                        self._in_string = False
+                        if self._depth == 0:
+                            self._emit(out)
+                            self._state = "after_value"
+                elif ch == '"':
+                    self._in_string = True
+                    self._buf.append(ch)
+                elif ch in "{[":
+                    self._depth += 1
+                    self._buf.append(ch)
+                elif ch in "}]" and self._depth > 0:
+                    self._depth -= 1
+                    self._buf.append(ch)
+                    if self._depth == 0:
+                        self._emit(out)
+                        self._state = "after_value"
+                elif ch == "," and self._depth == 0:
+                    # End of a bare value (number, true, null, ...)
+                    self._emit(out)
+                    self._state = "key"
+                elif ch == "}" and self._depth == 0:
+                    self._emit(out)
+                    self.done = True
+                else:
+                    self._buf.append(ch)
+
+            elif state == "after_value":
+                if ch == ",":
+                    self._state = "key"
+                elif ch == "}":
+                    self.done = True
+
+        return out
@@ -1,15 +1,47 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime
-import uuid
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import asyncio
+import json
+import os
+import time
+import zipfile
 
-from database import documents_collection
-from extract import extract_text_from_file
-from gemini_client import extract_fields_from_text
+import database
+import metrics
+from batch import queue_batch, run_batch
+from cache import extraction_cache
+from extract import SUPPORTED_EXTENSIONS
+from gemini_client import scheduler
+from indexes import ensure_indexes
+from ingest import UploadLimitMiddleware, UploadTooLargeError, spool
+from jobqueue import JOB_BACKEND, JOB_POLL_SECONDS, get_job_queue
+from jobs import job_manager, QueueFullError
+from minhash import near_duplicate_index
 from models import UpdateDocument
+from parser_pool import parser_pool
+from profiler import ProfilerMiddleware, profiler
+from repository import documents, decode_cursor, encode_cursor
+from search import search_index, rebuild_from
+from stats import STATS_PROJECTION, dashboard_stats
+
+# Required in the X-Admin-Token header of /admin endpoints when set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# Start warming up (see /warmup) as soon as the app has started
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "1") == "1"
+# JOB_BACKEND=mongo: how late a finished job may show up (worker clock
+# skew, slow writes) and still be added to the search index
+JOB_INDEX_SETTLE_SECONDS = float(os.getenv("JOB_INDEX_SETTLE_SECONDS", "30"))
 
 app = FastAPI(title="Smart Document Extraction System")
 
+if profiler.enabled:
+    app.add_middleware(ProfilerMiddleware, profiler=profiler)
+app.add_middleware(UploadLimitMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -18,71 +50,379 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _runtime_metrics():
+    """
+    Counters kept by the scheduler, cache and job queue, read at scrape time.
+    """
+    model = scheduler.stats()
+    cache = extraction_cache.stats()
+    jobs = job_manager.stats()
+    return [
+        ("smartextract_model_calls_total", "counter", "Model calls attempted",
+         [({}, model["calls"])]),
+        ("smartextract_model_retries_total", "counter", "Model calls retried after a failure",
+         [({}, model["retries"])]),
+        ("smartextract_model_errors_total", "counter", "Failed model calls by kind",
+         [({"kind": "rate_limited"}, model["rate_limited"]), ({"kind": "error"}, model["errors"])]),
+        ("smartextract_model_in_flight", "gauge", "Model calls in flight",
+         [({}, model["in_flight"])]),
+        ("smartextract_model_waiting", "gauge", "Model calls waiting for a slot",
+         [({}, model["waiting"])]),
+        ("smartextract_model_concurrency_limit", "gauge", "Current adaptive model concurrency limit",
+         [({}, model["concurrency_limit"])]),
+        ("smartextract_cache_lookups_total", "counter", "Extraction cache lookups",
+         [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])]),
+        ("smartextract_cache_hit_ratio", "gauge", "Extraction cache hit ratio since start",
+         [({}, cache["hit_ratio"])]),
+        ("smartextract_cache_evictions_total", "counter", "Extraction cache LRU evictions",
+         [({}, cache["evictions"])]),
+        ("smartextract_jobs", "gauge", "Extraction jobs by state",
+         [({"state": "queued"}, jobs["queued"]), ({"state": "running"}, jobs["running"])]),
+    ]
+
+
+metrics.register_collector(_runtime_metrics)
+
+
+@app.on_event("startup")
+async def start_workers():
+    global job_manager
+    if JOB_BACKEND == "mongo":
+        # Jobs are stored in Mongo and processed by worker.py processes
+        job_manager = get_job_queue()
+    await asyncio.to_thread(database.connect)
+    await asyncio.to_thread(ensure_indexes)
+    # Worker documents are followed from before the rebuild starts, so
+    # none falls between the two (see _index_worker_documents)
+    indexed_until = datetime.utcnow() - timedelta(seconds=JOB_INDEX_SETTLE_SECONDS)
+    # The search index fills in the background; startup doesn't wait for it
+    asyncio.create_task(asyncio.to_thread(rebuild_from, documents.collection))
+    documents.start()
+    parser_pool.start()
+    await job_manager.start()
+    if JOB_BACKEND == "mongo":
+        asyncio.create_task(_index_worker_documents(indexed_until))
+    if WARM_UP_ON_STARTUP:
+        _start_warm_up()
+
+
+async def _index_worker_documents(since: datetime):
+    """
+    Documents created by worker.py processes are added to this process's
+    search index as their jobs finish, from `since` on.
+
+    The position is a (finished_at, _id) keyset. Workers' clocks differ
+    and a finish can be written after a later one, so the position only
+    moves past jobs finished more than JOB_INDEX_SETTLE_SECONDS ago;
+    newer ones are read again on every poll (and indexed once).
+    """
+    after = (since, "")
+    recent: Dict[str, datetime] = {}
+    while True:
+        try:
+            settled = datetime.utcnow() - timedelta(seconds=JOB_INDEX_SETTLE_SECONDS)
+            finished = await asyncio.to_thread(job_manager.finished_after, after)
+            for job in finished:
+                if job["_id"] not in recent:
+                    doc = await documents.get(job["document_id"])
+                    if doc is not None:
+                        search_index.index_document(doc)
+                if job["finished_at"] <= settled:
+                    after = (job["finished_at"], job["_id"])
+                    recent.pop(job["_id"], None)
+                else:
+                    recent[job["_id"]] = job["finished_at"]
+        except Exception as e:
+            # Mongo unreachable for a moment; pick up where we left off
+            print(f"Indexing finished jobs failed, retrying: {e!r}", flush=True)
+        await asyncio.sleep(JOB_POLL_SECONDS)
+
+
+@app.on_event("shutdown")
+async def stop_workers():
+    await job_manager.stop()
+    parser_pool.shutdown()
+    documents.shutdown()
+    database.close()
+
+
 @app.get("/")
 def home():
     return {"message": "Backend is running"}
 
-@app.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
-    text = extract_text_from_file(file.file, file.filename)
-    fields = extract_fields_from_text(text)
-    doc_id = str(uuid.uuid4())
-
-    documents_collection.insert_one({
-        "_id": doc_id,
-        "filename": file.filename,
-        "fields": fields,
-        "status": "pending",
-        "created_at": datetime.utcnow()
+
+_warm_up: Optional[asyncio.Task] = None
+
+
+async def _warm_up_components() -> Dict[str, float]:
+    """
+    Initialize what the first requests would otherwise pay for: the Mongo
+    connection, the model client (its SDK import is the slowest part of a
+    cold start) and the parser processes. Returns seconds per component.
+    """
+    timings: Dict[str, float] = {}
+
+    async def timed(name: str, awaitable):
+        started = time.perf_counter()
+        await awaitable
+        timings[name] = round(time.perf_counter() - started, 3)
+
+    await asyncio.gather(
+        timed("mongo", asyncio.to_thread(database.connect)),
+        timed("model", asyncio.to_thread(scheduler.backend.warm)),
+        timed("parser", parser_pool.warm()),
+    )
+    return timings
+
+
+def _start_warm_up() -> asyncio.Task:
+    # One warm-up at a time; a failed one is retried by the next call
+    global _warm_up
+    if _warm_up is None or (_warm_up.done() and (_warm_up.cancelled() or _warm_up.exception())):
+        _warm_up = asyncio.create_task(_warm_up_components())
+    return _warm_up
+
+
+@app.get("/warmup")
+async def warm_up():
+    """
+    Readiness check: responds once clients and parser processes are
+    initialized (503 if that failed), so traffic only reaches a worker
+    that is warm. Cheap after the first success.
+    """
+    try:
+        # Shielded: a probe that gives up doesn't cancel the warm-up
+        timings = await asyncio.shield(_start_warm_up())
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Warm-up failed: {e}")
+    return {"ready": True, "seconds": timings}
+
+@app.post("/upload", status_code=202)
+async def upload_document(file: UploadFile = File(...),
+                          previous_id: Optional[str] = Form(None)):
+    """
+    Queue a document for extraction. `previous_id` optionally names the
+    prior version of an amended solicitation (see EXTRACTION_MODE=sections).
+    """
+    if not file.filename.lower().endswith(SUPPORTED_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Unsupported file type")
+    if previous_id and await documents.get(previous_id) is None:
+        raise HTTPException(status_code=404, detail="Previous version not found")
+
+    # Copied to our own spool file (it outlives the request) and hashed
+    # in fixed-size chunks, off the event loop
+    try:
+        upload = await asyncio.to_thread(spool, file.file)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    try:
+        job = await job_manager.submit(upload, file.filename, previous_id)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {"job_id": job.id, "status": job.status}
+
+
+@app.post("/upload/batch")
+async def upload_batch(files: List[UploadFile] = File(...)):
+    """
+    Upload many PDF/DOCX files (or one .zip of them). Responds with
+    NDJSON, one line per document, in completion order. With
+    JOB_BACKEND=mongo the documents are queued for the workers instead,
+    and each line carries the job_id to follow.
+    """
+    if len(files) == 1 and files[0].filename.lower().endswith(".zip"):
+        if not zipfile.is_zipfile(files[0].file):
+            raise HTTPException(status_code=400, detail="Invalid zip archive")
+
+    if JOB_BACKEND == "mongo":
+        return StreamingResponse(queue_batch(files, job_manager), media_type="application/x-ndjson")
+    return StreamingResponse(run_batch(files), media_type="application/x-ndjson")
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}/events")
+def job_events(job_id: str):
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(
+        job_manager.events(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """
+    Prometheus text exposition format.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def _check_admin(token: Optional[str]):
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="Profiler is disabled (PROFILER_ENABLED=1)")
+    if ADMIN_TOKEN and token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.get("/admin/profiles")
+def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """
+    Kept profiles of slow (or sampled) requests and jobs, slowest first.
+    """
+    _check_admin(x_admin_token)
+    return {"profiles": profiler.profiles()}
+
+
+@app.get("/admin/profiles/{profile_id}")
+def download_profile(profile_id: int,
+                     format: str = Query("speedscope", pattern="^(speedscope|collapsed)$"),
+                     x_admin_token: Optional[str] = Header(None)):
+    """
+    One profile as a speedscope JSON file or collapsed stacks
+    (flamegraph.pl / speedscope both read the latter too).
+    """
+    _check_admin(x_admin_token)
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    body, media_type = profiler.export(profile, format)
+    extension = "speedscope.json" if format == "speedscope" else "collapsed.txt"
+    return Response(body, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="profile-{profile_id}.{extension}"',
     })
 
-    return {"id": doc_id, "fields": fields, "status": "pending"}
+
+@app.delete("/admin/profiles")
+def clear_profiles(x_admin_token: Optional[str] = Header(None)):
+    _check_admin(x_admin_token)
+    profiler.clear()
+    return {"cleared": True}
+
+
+@app.get("/stats")
+async def get_stats(top: int = Query(20, ge=0, le=1000)):
+    """
+    Dashboard statistics, read from the pre-aggregated stats document
+    (see stats.py): one lookup whatever the number of documents.
+    `top` limits the agency / procurement type / category breakdowns.
+    """
+    return await asyncio.to_thread(dashboard_stats.get, top)
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return extraction_cache.stats()
 
 
 # ---------- FIXED ORDER: approved first ----------
 @app.get("/documents/approved")
-def approved_documents():
-    docs = list(documents_collection.find({"status": "approved"}))
-    for d in docs:
-        d["_id"] = str(d["_id"])
-    return docs
+async def approved_documents(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """
+    Approved documents, newest first, one page at a time.
+
+    - `cursor`: `next_cursor` from the previous page (omit for the first page)
+    - `fields`: comma-separated extracted fields to include; omit for all
+      fields, or pass an empty value for none (listing views)
+
+    The response is streamed as {"items": [...], "next_cursor": ...};
+    `next_cursor` is null on the last page.
+    """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Per-section extraction data is internal; listings never need it
+    projection = {"sections": 0}
+    if fields is not None:
+        projection = {"filename": 1, "status": 1, "created_at": 1}
+        for name in filter(None, (f.strip() for f in fields.split(","))):
+            projection[f"fields.{name}"] = 1
+
+    docs = await documents.page_by_status("approved", limit, after, projection)
+    next_cursor = encode_cursor(docs[-1]) if len(docs) == limit else None
+
+    async def body():
+        yield '{"items":['
+        for i, doc in enumerate(docs):
+            yield ("," if i else "") + json.dumps(jsonable_encoder(doc))
+        yield '],"next_cursor":' + json.dumps(next_cursor) + "}"
+
+    return StreamingResponse(body(), media_type="application/json")
+
+
+@app.get("/documents/search")
+async def search_documents(
+    q: str = "",
+    status: Optional[str] = None,
+    agency: Optional[str] = None,
+    procurement_type: Optional[str] = None,
+    category: Optional[str] = None,
+    prefix: bool = True,
+    limit: int = Query(20, ge=1, le=200),
+):
+    """
+    Ranked full-text search over the extracted fields (title, agency,
+    solicitation number, NAICS/PSC codes, scope, ...). The last word of
+    `q` also matches as a prefix unless `prefix=false`; agency,
+    procurement_type and category are exact filters.
+    """
+    filters = {"agency": agency, "procurement_type": procurement_type, "category": category}
+    return search_index.search(q, status=status, filters=filters, prefix=prefix, limit=limit)
 
 
 @app.get("/documents/latest")
-def latest_document():
-    doc = documents_collection.find_one(sort=[("created_at", -1)])
+async def latest_document():
+    doc = await documents.latest()
     if not doc:
         raise HTTPException(status_code=404, detail="No documents found")
-    doc["_id"] = str(doc["_id"])
     return doc
 
 
 @app.get("/documents/{doc_id}")
-def get_document(doc_id: str):
-    doc = documents_collection.find_one({"_id": doc_id})
+async def get_document(doc_id: str):
+    doc = await documents.get(doc_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
-    doc["_id"] = str(doc["_id"])
     return doc
 
 
 @app.put("/documents/{doc_id}")
-def update_document(doc_id: str, body: UpdateDocument):
-    documents_collection.update_one(
-        {"_id": doc_id},
-        {"$set": {"fields": body.fields}}
-    )
+async def update_document(doc_id: str, body: UpdateDocument):
+    before = await documents.update_fields(doc_id, body.fields, STATS_PROJECTION)
+    if before is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    search_index.update_fields(doc_id, body.fields)
+    await asyncio.to_thread(dashboard_stats.apply_change, before, {**before, "fields": body.fields})
     return {"updated": True}
 
 
 @app.put("/documents/{doc_id}/approve")
-def approve_document(doc_id: str):
-    result = documents_collection.update_one(
-        {"_id": doc_id},
-        {"$set": {"status": "approved"}}
-    )
-
-    if result.matched_count == 0:
+async def approve_document(doc_id: str):
+    approved_at = datetime.utcnow()
+    before = await documents.set_status(doc_id, "approved", STATS_PROJECTION, approved_at)
+    if before is None:
         raise HTTPException(status_code=404, detail="Document not found")
+    search_index.set_status(doc_id, "approved")
+    after = {**before, "status": "approved", "approved_at": approved_at}
+    await asyncio.to_thread(dashboard_stats.apply_change, before, after)
+    # From now on, near-duplicate uploads can be matched (and seeded) with it
+    await asyncio.to_thread(near_duplicate_index.set_approved, doc_id)
 
     return {"approved": True}
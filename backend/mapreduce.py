@@ -0,0 +1,117 @@
+import json
+import re
+from typing import Any, Dict, Iterable, List, Tuple
+
+# Rough token estimate used for chunk budgets (no tokenizer dependency)
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def chunk_text(text: str, chunk_tokens: int, overlap_tokens: int = 0) -> List[str]:
+    """
+    Split text into overlapping chunks of about `chunk_tokens` tokens.
+
+    Chunks are cut at a line break near the end of the window when there is
+    one, so sentences and table rows are rarely split. Consecutive chunks
+    share `overlap_tokens` tokens, so a field that straddles a boundary is
+    fully contained in at least one chunk.
+    """
+    size = max(chunk_tokens * CHARS_PER_TOKEN, 1)
+    overlap = min(overlap_tokens * CHARS_PER_TOKEN, size // 2)
+
+    if len(text) <= size:
+        return [text]
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            cut = text.rfind("\n", start + size * 4 // 5, end)
+            if cut > start:
+                end = cut + 1
+
+        chunks.append(text[start:end])
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+
+    return chunks
+
+
+def _is_empty(value: Any) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return not value.strip()
+    if isinstance(value, (list, dict)):
+        return len(value) == 0
+    return False
+
+
+def _normalize(value: Any) -> str:
+    if isinstance(value, str):
+        return re.sub(r"\s+", " ", value).strip().casefold()
+    return json.dumps(value, sort_keys=True)
+
+
+def _union(values: Iterable[Any]) -> List[Any]:
+    merged = []
+    seen = set()
+    for value in values:
+        items = value if isinstance(value, list) else [value]
+        for item in items:
+            key = _normalize(item)
+            if key not in seen:
+                seen.add(key)
+                merged.append(item)
+    return merged
+
+
+def merge_field_results(
+    results: List[Dict[str, Any]],
+    keys: Iterable[str],
+) -> Tuple[Dict[str, Any], Dict[str, List[Any]]]:
+    """
+    Deterministically merge per-chunk extraction results.
+
+    For every key, in chunk order:
+      - empty values are ignored; if all are empty the field is "",
+      - if any value is a list, all values are unioned into one list,
+      - identical values (ignoring case/whitespace) collapse into one,
+      - if one value contains all the others, the longest one wins,
+      - otherwise the first value wins and the key is reported as a
+        conflict together with all distinct candidates.
+
+    Returns (fields, conflicts).
+    """
+    fields: Dict[str, Any] = {}
+    conflicts: Dict[str, List[Any]] = {}
+
+    for key in keys:
+        values = [r.get(key) for r in results if not _is_empty(r.get(key))]
+
+        if not values:
+            fields[key] = ""
+            continue
+
+        if any(isinstance(v, list) for v in values):
+            fields[key] = _union(values)
+            continue
+
+        distinct = _union(values)
+        if len(distinct) == 1:
+            fields[key] = distinct[0]
+            continue
+
+        longest = max(distinct, key=lambda v: len(_normalize(v)))
+        if all(_normalize(v) in _normalize(longest) for v in distinct):
+            fields[key] = longest
+        else:
+            fields[key] = distinct[0]
+            conflicts[key] = distinct
+
+    return fields, conflicts
@@ -0,0 +1,231 @@
+"""
+In-process metrics, exposed at /metrics in the Prometheus text format.
+
+Counters and histograms are updated inline by the code they measure;
+values that already live elsewhere (scheduler counters, cache hits, job
+queue depth) are read at scrape time through collectors registered with
+register_collector().
+
+stage(name) both observes the stage duration histogram and, when called
+while serving a request, adds the stage to that response's Server-Timing
+header (see MetricsMiddleware).
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+# (name, type, help, [(labels, value)])
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+# Latency buckets in seconds: sub-millisecond Mongo calls up to slow model calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _key(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in items]
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count], sum
+        self._counts: Dict[Labels, List[int]] = {}
+        self._sums: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(c), self._sums[k]) for k, c in self._counts.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+# ---------- the metrics ----------
+
+STAGE_SECONDS = Histogram("smartextract_stage_seconds", "Duration of each processing stage")
+HTTP_REQUEST_SECONDS = Histogram("smartextract_http_request_seconds", "HTTP request duration until response start")
+HTTP_IN_FLIGHT = Gauge("smartextract_http_requests_in_flight", "HTTP requests being served")
+MODEL_CHARACTERS = Counter("smartextract_model_characters_total", "Characters sent to / received from the model")
+MODEL_TOKENS = Counter("smartextract_model_tokens_total", "Estimated tokens sent to / received from the model")
+PARSED_CHARACTERS = Counter("smartextract_parsed_characters_total", "Characters of text extracted from uploads")
+MONGO_COMMAND_SECONDS = Histogram("smartextract_mongo_command_seconds", "Duration of Mongo commands")
+MONGO_COMMAND_FAILURES = Counter("smartextract_mongo_command_failures_total", "Failed Mongo commands")
+PREEXTRACT_FIELDS = Counter("smartextract_preextract_fields_total", "Pattern-matchable fields by pre-extraction outcome")
+
+_METRICS = [
+    STAGE_SECONDS, HTTP_REQUEST_SECONDS, HTTP_IN_FLIGHT, MODEL_CHARACTERS, MODEL_TOKENS,
+    PARSED_CHARACTERS, MONGO_COMMAND_SECONDS, MONGO_COMMAND_FAILURES, PREEXTRACT_FIELDS,
+]
+_collectors: List[Callable[[], List[Family]]] = []
+
+
+def register_collector(collector: Callable[[], List[Family]]):
+    """
+    Add a function returning metric families read at scrape time.
+    """
+    _collectors.append(collector)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines += metric.render()
+    for collector in _collectors:
+        for name, kind, help, samples in collector():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_format_labels(_key(labels))} {_format_value(value)}" for labels, value in samples]
+    return "\n".join(lines) + "\n"
+
+
+# ---------- stage timing + Server-Timing ----------
+
+# (stage, seconds) entries for the response being served, if any
+_server_timing: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = \
+    contextvars.ContextVar("server_timing", default=None)
+
+
+def record(stage_name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage_name)
+    timings = _server_timing.get()
+    if timings is not None:
+        timings.append((stage_name, seconds))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def _server_timing_header(timings: List[Tuple[str, float]], total: float) -> bytes:
+    # Repeated stages (e.g. several db calls) are summed into one entry
+    merged: Dict[str, List[float]] = {}
+    for name, seconds in timings:
+        merged.setdefault(name, [0.0, 0])
+        merged[name][0] += seconds
+        merged[name][1] += 1
+    parts = [
+        f'{name};dur={seconds * 1000:.1f}' + (f';desc="x{count}"' if count > 1 else "")
+        for name, (seconds, count) in merged.items()
+    ]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts).encode("latin-1")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: request duration histogram, in-flight gauge, and a
+    Server-Timing header listing the stages that ran for the request.
+
+    Timing is taken at response start, so for streamed responses it
+    covers the work done before the first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        timings: List[Tuple[str, float]] = []
+        token = _server_timing.set(timings)
+        HTTP_IN_FLIGHT.inc()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - started
+                route = scope.get("route")
+                HTTP_REQUEST_SECONDS.observe(
+                    elapsed,
+                    method=scope["method"],
+                    route=getattr(route, "path", "unmatched"),
+                    status=message["status"],
+                )
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", _server_timing_header(timings, elapsed)))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            _server_timing.reset(token)
@@ -0,0 +1,165 @@
+import hashlib
+import os
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from bson.binary import Binary
+
+from database import db
+
+# Signature length, and how it is cut into LSH bands (bands * rows == length)
+MINHASH_SIZE = int(os.getenv("MINHASH_SIZE", "128"))
+LSH_BANDS = int(os.getenv("LSH_BANDS", "16"))
+# Shingles are overlapping runs of this many characters of normalized text
+SHINGLE_CHARS = int(os.getenv("SHINGLE_CHARS", "9"))
+# Estimated Jaccard similarity from which a document counts as a near-duplicate
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))
+
+_SPACE_RE = re.compile(r"\s+")
+# Spreads densified values apart (see _densify)
+_ROTATION = np.uint32(0x9E3779B1)
+
+
+def _mix(h: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer: turns the rolling hash into well-spread bits
+    h = h ^ (h >> np.uint64(30))
+    h = h * np.uint64(0xBF58476D1CE4E5B9)
+    h = h ^ (h >> np.uint64(27))
+    h = h * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    """
+    64-bit hashes of every SHINGLE_CHARS-long window of the normalized
+    text, computed as a polynomial rolling hash over the whole byte array
+    at once (one vector operation per shingle position, not per shingle).
+    """
+    data = _SPACE_RE.sub(" ", text.casefold()).strip().encode("utf-8")
+    raw = np.frombuffer(data, dtype=np.uint8).astype(np.uint64)
+    count = len(raw) - SHINGLE_CHARS + 1
+    if count <= 0:
+        raw = np.pad(raw, (0, SHINGLE_CHARS - len(raw)))
+        count = 1
+
+    h = np.zeros(count, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for j in range(SHINGLE_CHARS):
+            h = h * np.uint64(1099511628211) + raw[j:j + count]
+        return _mix(h)
+
+
+def _densify(signature: np.ndarray, filled: np.ndarray) -> np.ndarray:
+    """
+    Fill empty bins from the next non-empty bin (circularly), shifted by
+    the distance, so short texts still get comparable signatures.
+    """
+    if filled.all() or not filled.any():
+        return signature
+    size = len(signature)
+    donors = np.flatnonzero(filled)
+    empty = np.flatnonzero(~filled)
+    pos = np.searchsorted(donors, empty) % len(donors)
+    distance = (donors[pos] - empty) % size
+    with np.errstate(over="ignore"):
+        signature[empty] = signature[donors[pos]] + _ROTATION * distance.astype(np.uint32)
+    return signature
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """
+    MinHash signature of `text` (MINHASH_SIZE uint32 values).
+
+    Uses one-permutation hashing: every shingle is hashed once, the low
+    bits choose one of MINHASH_SIZE bins and the minimum of the high 32
+    bits is kept per bin. That is one pass over the shingles instead of
+    MINHASH_SIZE passes: a few milliseconds for a typical solicitation,
+    ~30ms for 400k characters.
+    """
+    hashes = _shingle_hashes(text)
+    bins = (hashes % np.uint64(MINHASH_SIZE)).astype(np.intp)
+    values = (hashes >> np.uint64(32)).astype(np.uint32)
+
+    signature = np.full(MINHASH_SIZE, np.iinfo(np.uint32).max, dtype=np.uint32)
+    np.minimum.at(signature, bins, values)
+    filled = np.zeros(MINHASH_SIZE, dtype=bool)
+    filled[bins] = True
+    return _densify(signature, filled)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Estimated Jaccard similarity of the two documents' shingle sets.
+    """
+    return float(np.mean(a == b))
+
+
+def lsh_keys(signature: np.ndarray) -> List[str]:
+    """
+    One key per band; two documents sharing any key are candidates.
+    """
+    rows = len(signature) // LSH_BANDS
+    return [
+        f"{band}:{hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).hexdigest()}"
+        for band in range(LSH_BANDS)
+    ]
+
+
+class NearDuplicateIndex:
+    """
+    Persistent LSH index of document MinHash signatures.
+
+    One entry per document: {_id: document id, bands: lsh_keys(...),
+    signature, approved}. A lookup is a single indexed query on the band
+    keys (multikey index, see indexes.py); the few candidates it returns
+    are then checked against the real signature similarity.
+
+    Entries are written at upload time and only become match targets once
+    the document is approved, so drafts are never used as a seed.
+    """
+
+    def __init__(self, collection, threshold: float = NEAR_DUP_THRESHOLD):
+        self.collection = collection
+        self.threshold = threshold
+
+    def add(self, doc_id: str, signature: np.ndarray, approved: bool = False):
+        self.collection.replace_one(
+            {"_id": doc_id},
+            {
+                "_id": doc_id,
+                "bands": lsh_keys(signature),
+                "signature": Binary(signature.astype("<u4").tobytes()),
+                "approved": approved,
+                "created_at": datetime.utcnow(),
+            },
+            upsert=True,
+        )
+
+    def set_approved(self, doc_id: str, approved: bool = True):
+        self.collection.update_one({"_id": doc_id}, {"$set": {"approved": approved}})
+
+    def remove(self, doc_id: str):
+        self.collection.delete_one({"_id": doc_id})
+
+    def find(self, signature: np.ndarray) -> Optional[Dict[str, Any]]:
+        """
+        The most similar approved document at or above the threshold, as
+        {"id", "similarity"}, or None.
+        """
+        candidates = self.collection.find(
+            {"bands": {"$in": lsh_keys(signature)}, "approved": True},
+            {"signature": 1},
+        )
+
+        best: Optional[Dict[str, Any]] = None
+        for entry in candidates:
+            other = np.frombuffer(entry["signature"], dtype="<u4")
+            score = similarity(signature, other)
+            if score >= self.threshold and (best is None or score > best["similarity"]):
+                best = {"id": entry["_id"], "similarity": round(score, 3)}
+        return best
+
+
+near_duplicate_index = NearDuplicateIndex(db["minhash_lsh"])
@@ -0,0 +1,292 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, Optional, Tuple, Union
+
+import metrics
+from extract import (
+    PageBuffer,
+    count_pdf_pages,
+    extract_pdf_page_range,
+    extract_text_from_path,
+    preload,
+)
+
+# Number of parser processes (0 = parse in a thread of the API process)
+PARSER_WORKERS = int(os.getenv("PARSER_WORKERS", str(os.cpu_count() or 2)))
+# A worker process is replaced after this many documents (pypdf memory growth)
+PARSER_MAX_TASKS_PER_WORKER = int(os.getenv("PARSER_MAX_TASKS_PER_WORKER", "50"))
+# Hard limit for parsing a single document
+PARSER_TIMEOUT_SECONDS = float(os.getenv("PARSER_TIMEOUT_SECONDS", "120"))
+# Extra time a worker gets to stop a timed-out document on its own before
+# the pool is replaced (it is stuck outside Python code)
+PARSER_KILL_GRACE_SECONDS = float(os.getenv("PARSER_KILL_GRACE_SECONDS", "10"))
+# Documents allowed in the pool at once (running + waiting for a process)
+PARSER_MAX_PENDING = int(os.getenv("PARSER_MAX_PENDING", str(max(PARSER_WORKERS, 1) * 2)))
+# How long a caller waits for room in the pool before giving up
+PARSER_QUEUE_TIMEOUT_SECONDS = float(os.getenv("PARSER_QUEUE_TIMEOUT_SECONDS", "30"))
+# PDFs with at least this many pages are split into page ranges and parsed in parallel
+PDF_SHARD_MIN_PAGES = int(os.getenv("PDF_SHARD_MIN_PAGES", "40"))
+# Pages per shard
+PDF_SHARD_PAGES = int(os.getenv("PDF_SHARD_PAGES", "20"))
+
+
+class ParserBusyError(Exception):
+    pass
+
+
+class ParserTimeoutError(Exception):
+    pass
+
+
+class _DeadlinePassed(BaseException):
+    # Not an Exception: pypdf's `except Exception` recovery code must not
+    # swallow it (or turn it into a parse error)
+    pass
+
+
+def _call_with_deadline(deadline: float, fn, *args):
+    """
+    Run `fn(*args)` in a parser process, raising ParserTimeoutError from
+    inside it at `deadline` (time.time()). The process then takes its next
+    task; the other documents in the pool are not disturbed.
+    """
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise ParserTimeoutError("Deadline passed before parsing started")
+    if not hasattr(signal, "setitimer"):
+        # No interval timers (Windows): the pool's own timeout applies
+        return fn(*args)
+
+    def expire(signum, frame):
+        raise _DeadlinePassed()
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, remaining)
+    try:
+        return fn(*args)
+    except _DeadlinePassed:
+        raise ParserTimeoutError("Parsing deadline passed") from None
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class ParserPool:
+    """
+    Process pool for PDF/DOCX text extraction.
+
+    pypdf and python-docx are CPU-bound and hold the GIL, so they run in
+    separate processes instead of the API process. The pool:
+      - recycles each worker after `max_tasks_per_worker` documents,
+      - fails a document that exceeds `timeout` from inside the worker
+        parsing it (all shards of a sharded PDF share one deadline); the
+        pool is only replaced if that worker doesn't stop within
+        PARSER_KILL_GRACE_SECONDS,
+      - applies backpressure: at most `max_pending` documents are handed to
+        the pool; further callers wait up to `queue_timeout` and then get
+        ParserBusyError.
+    """
+
+    def __init__(self, workers: int = PARSER_WORKERS,
+                 max_tasks_per_worker: int = PARSER_MAX_TASKS_PER_WORKER,
+                 timeout: float = PARSER_TIMEOUT_SECONDS,
+                 max_pending: int = PARSER_MAX_PENDING,
+                 queue_timeout: float = PARSER_QUEUE_TIMEOUT_SECONDS):
+        self.workers = workers
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+
+        self.in_flight = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def start(self):
+        self._slots = asyncio.Semaphore(self.max_pending)
+        if self.workers > 0:
+            self._executor = self._new_executor()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # max_tasks_per_child is not supported with the "fork" start method.
+        # Every new (or recycled) worker imports the parsers as it starts.
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            max_tasks_per_child=self.max_tasks_per_worker,
+            initializer=preload,
+        )
+
+    def _restart(self):
+        """
+        Throw away the current pool, killing any stuck worker processes.
+        """
+        old = self._executor
+        self._executor = self._new_executor()
+        self.restarts += 1
+
+        processes = list((getattr(old, "_processes", None) or {}).values())
+        old.shutdown(wait=False, cancel_futures=True)
+        for p in processes:
+            if p.is_alive():
+                p.terminate()
+
+    async def warm(self):
+        """
+        Start every worker process now (processes are otherwise spawned
+        on demand, so the first documents would pay for interpreter
+        start-up and parser imports).
+        """
+        if self._slots is None:
+            self.start()
+        if self._executor is None:
+            await asyncio.to_thread(preload)
+            return
+        await asyncio.gather(*(
+            asyncio.wrap_future(self._executor.submit(preload))
+            for _ in range(self.workers)
+        ))
+
+    async def _acquire(self):
+        if self._slots is None:
+            self.start()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise ParserBusyError("Document parser is busy, try again later")
+
+    async def _run(self, fn, *args, deadline: Optional[float] = None):
+        if self._executor is None:
+            return await asyncio.to_thread(fn, *args)
+
+        timeout = self.timeout
+        if deadline is not None:
+            timeout = deadline - asyncio.get_running_loop().time()
+        error = ParserTimeoutError(f"Parsing took longer than {self.timeout:.0f} seconds")
+        executor = self._executor
+        # The worker enforces the deadline itself (wall clock: it runs in
+        # another process), so only the timed-out document fails
+        future = asyncio.wrap_future(
+            executor.submit(_call_with_deadline, time.time() + timeout, fn, *args)
+        )
+        try:
+            return await asyncio.wait_for(future, max(timeout, 0) + PARSER_KILL_GRACE_SECONDS)
+        except ParserTimeoutError:
+            self.timeouts += 1
+            raise error from None
+        except asyncio.TimeoutError:
+            # The worker is stuck where the alarm can't reach it (C code)
+            self.timeouts += 1
+            if executor is self._executor:
+                self._restart()
+            raise error
+        except BrokenProcessPool:
+            # A worker died (crash, OOM kill); replace the pool once
+            if executor is self._executor:
+                self._restart()
+            raise
+
+    async def submit(self, fn, *args, deadline: Optional[float] = None):
+        """
+        Run `fn(*args)` in the pool, with backpressure and the per-document
+        timeout applied: `timeout` from now, or until `deadline` (event loop
+        time) when the call is one part of a larger document. `fn` must be
+        a picklable, module-level function.
+        """
+        await self._acquire()
+        self.in_flight += 1
+        try:
+            try:
+                result = await self._run(fn, *args, deadline=deadline)
+            except BrokenProcessPool:
+                # The pool was replaced under us; retry once on the new one
+                result = await self._run(fn, *args, deadline=deadline)
+            self.completed += 1
+            return result
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    async def extract_text(self, path: str, filename: str) -> str:
+        """
+        Text of the spooled upload at `path`. Workers are sent the path,
+        not the file's bytes, and map the file themselves.
+        """
+        with metrics.stage("parse"):
+            if self.workers > 1 and filename.lower().endswith(".pdf"):
+                text = await self._extract_pdf_sharded(path)
+            else:
+                text = await self.submit(extract_text_from_path, path, filename)
+        metrics.PARSED_CHARACTERS.inc(len(text))
+        return text
+
+    async def _extract_pdf_sharded(self, path: str) -> str:
+        # One deadline for the whole document, however many shards it takes
+        deadline = asyncio.get_running_loop().time() + self.timeout
+        # Counting reads only the page tree; done here, so every shard can
+        # start at once instead of waiting on a pool round trip
+        page_count = await asyncio.to_thread(count_pdf_pages, path)
+        # Short documents aren't worth splitting: one call
+        shard_pages = PDF_SHARD_PAGES if page_count >= PDF_SHARD_MIN_PAGES else max(page_count, 1)
+        buffer = PageBuffer(page_count)
+        async for index, text in self.iter_pdf_pages(path, page_count, shard_pages, deadline):
+            buffer.add(index, text)
+        return buffer.text()
+
+    async def iter_pdf_pages(
+        self,
+        source: Union[bytes, str],
+        page_count: int,
+        shard_pages: int = PDF_SHARD_PAGES,
+        deadline: Optional[float] = None,
+    ) -> AsyncIterator[Tuple[int, str]]:
+        """
+        Yield (page_index, text) as page-range shards finish, in completion
+        order. At most one shard per worker is in flight, so memory stays
+        proportional to one batch of shards rather than the whole document.
+        Every shard shares `deadline`.
+        """
+        ranges = [
+            (first, min(first + shard_pages, page_count))
+            for first in range(0, page_count, shard_pages)
+        ]
+        max_in_flight = max(self.workers, 1)
+        pending = set()
+
+        try:
+            while ranges or pending:
+                while ranges and len(pending) < max_in_flight:
+                    first, stop = ranges.pop(0)
+                    task = asyncio.ensure_future(
+                        self.submit(extract_pdf_page_range, source, first, stop, deadline=deadline)
+                    )
+                    task.page_start = first
+                    pending.add(task)
+
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    for offset, text in enumerate(task.result()):
+                        yield task.page_start + offset, text
+        finally:
+            # Failed shard or consumer stopped early: drop the rest
+            for task in pending:
+                task.cancel()
+
+
+parser_pool = ParserPool()
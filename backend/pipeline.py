@@ -0,0 +1,219 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import metrics
+from cache import extraction_cache
+from gemini_client import (
+    EXTRACTION_MODE,
+    extract_delta_with_report,
+    extract_fields_with_report,
+    extract_sections_with_report,
+    split_document_sections,
+)
+from ingest import SpooledUpload
+from minhash import minhash_signature, near_duplicate_index
+from parser_pool import parser_pool
+from repository import documents
+from scheduler import PRIORITY_INTERACTIVE
+from search import search_index
+from sections import best_previous_version
+from stats import STATS_PROJECTION, dashboard_stats
+
+# Stages a document goes through, in order
+STAGES = ("parse", "extract", "persist")
+# Sections mode: how many candidate prior versions are compared, and the
+# fraction of sections they must share to count as the same solicitation
+PREVIOUS_VERSION_CANDIDATES = int(os.getenv("PREVIOUS_VERSION_CANDIDATES", "5"))
+PREVIOUS_VERSION_MIN_OVERLAP = float(os.getenv("PREVIOUS_VERSION_MIN_OVERLAP", "0.5"))
+# Near-duplicates of approved documents: "off", "flag" (mark the new
+# document with its match) or "auto" (flag, and run a delta extraction
+# seeded with the match's approved fields)
+NEAR_DUP_MODE = os.getenv("NEAR_DUP_MODE", "flag")
+
+
+async def _find_previous_version(sections: List[Dict[str, Any]],
+                                 previous_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    The prior version to reuse section fields from: `previous_id` when the
+    uploader named it, otherwise the recent document sharing the most
+    section hashes.
+    """
+    if previous_id:
+        return await documents.get(previous_id)
+
+    hashes = [s["hash"] for s in sections]
+    candidates = await documents.by_section_hashes(hashes, PREVIOUS_VERSION_CANDIDATES)
+    return best_previous_version(hashes, candidates, PREVIOUS_VERSION_MIN_OVERLAP)
+
+
+async def _extract(text: str, seed: Optional[Dict[str, Any]], previous_id: Optional[str],
+                   priority: int, field_callback) -> Tuple[Dict[str, Any], Dict[str, Any], Optional[list]]:
+    """
+    Run the model extraction that fits: a delta against a near-duplicate's
+    approved fields, per-section, or the regular one.
+    Returns (fields, report, sections or None).
+    """
+    if seed is not None:
+        fields, report = await asyncio.to_thread(
+            extract_delta_with_report, text, seed["fields"], priority, field_callback
+        )
+        report["seeded_from"] = seed["_id"]
+        return fields, report, None
+
+    if EXTRACTION_MODE == "sections":
+        parts = await asyncio.to_thread(split_document_sections, text)
+        previous = await _find_previous_version(parts, previous_id)
+        return await asyncio.to_thread(
+            extract_sections_with_report, parts, previous, priority, field_callback
+        )
+
+    fields, report = await asyncio.to_thread(
+        extract_fields_with_report, text, priority, field_callback
+    )
+    return fields, report, None
+
+
+async def finish_persist(doc_id: str):
+    """
+    Apply the persist steps that follow a document's insert (its
+    dashboard stats) unless they already were. Safe to call any number of
+    times, from any process; a retried job calls it when an earlier
+    attempt stored the document and then died.
+    """
+    doc = await documents.take_stats_pending(doc_id, STATS_PROJECTION)
+    if doc is not None:
+        await asyncio.to_thread(dashboard_stats.apply_change, None, doc)
+
+
+async def process_document(
+    upload: SpooledUpload,
+    filename: str,
+    on_stage: Optional[Callable[[str], None]] = None,
+    priority: int = PRIORITY_INTERACTIVE,
+    on_field: Optional[Callable[[str, Any], None]] = None,
+    previous_id: Optional[str] = None,
+    doc_id: Optional[str] = None,
+    index_search: bool = True,
+) -> Dict[str, Any]:
+    """
+    Run one spooled upload through parse -> extract -> persist. The
+    spool file is left in place; it belongs to the caller.
+
+    Parsing runs in the parser process pool, the Gemini call in a worker
+    thread and Mongo through the async repository, so the event loop stays
+    free. `on_stage` is called with
+    the stage name as each stage starts. `priority` is the model
+    scheduler lane. `on_field` is called on the event loop with
+    (key, value) as each extracted field becomes available, before the
+    document is persisted.
+
+    In sections mode, `previous_id` names the prior version of an amended
+    solicitation; only sections that differ from it are re-extracted.
+    Without it the prior version is looked up by section hashes.
+
+    Unless NEAR_DUP_MODE is "off", the parsed text's MinHash signature is
+    matched against approved documents and stored for future lookups,
+    on cache hits too (the cache keeps the signature with the fields).
+
+    `doc_id` fixes the new document's _id (a random one by default); a
+    retried queue job passes its own id, so a second run of the same job
+    fails on the insert instead of creating a duplicate, and finishes the
+    first run's persist with finish_persist().
+
+    `index_search=False` leaves the document out of this process's search
+    index: worker.py processes don't serve searches, the API indexes
+    their documents as their jobs finish.
+    """
+    def enter(stage: str):
+        if on_stage:
+            on_stage(stage)
+
+    loop = asyncio.get_running_loop()
+
+    # Extraction runs in a worker thread; hop back onto the loop
+    def _emit(key: str, value: Any):
+        loop.call_soon_threadsafe(on_field, key, value)
+
+    field_callback = _emit if on_field is not None else None
+
+    # Hashed while the upload was spooled; the file is not read again here
+    file_hash = upload.sha256
+    cache_key = extraction_cache.key_for(file_hash, previous_id)
+
+    # Duplicate uploads skip parsing and the model call entirely
+    with metrics.stage("cache_lookup"):
+        cached = await asyncio.to_thread(extraction_cache.get, cache_key)
+    sections = None
+    signature = near_duplicate = None
+    if cached is not None:
+        fields, report, sections = cached["fields"], cached["report"], cached["sections"]
+        if on_field is not None:
+            for key, value in fields.items():
+                on_field(key, value)
+        if NEAR_DUP_MODE != "off":
+            # The copy is a near-duplicate match target like any other upload
+            signature = cached["signature"]
+            if signature is None:
+                # Cached before signatures were: parsing still beats the model
+                enter("parse")
+                text = await parser_pool.extract_text(upload.path, filename)
+                signature = await asyncio.to_thread(minhash_signature, text)
+            with metrics.stage("near_duplicate"):
+                near_duplicate = await asyncio.to_thread(near_duplicate_index.find, signature)
+    else:
+        enter("parse")
+        text = await parser_pool.extract_text(upload.path, filename)
+
+        seed = None
+        if NEAR_DUP_MODE != "off":
+            with metrics.stage("near_duplicate"):
+                signature = await asyncio.to_thread(minhash_signature, text)
+                near_duplicate = await asyncio.to_thread(near_duplicate_index.find, signature)
+            if near_duplicate and NEAR_DUP_MODE == "auto":
+                seed = await documents.get(near_duplicate["id"])
+
+        enter("extract")
+        with metrics.stage("extract"):
+            fields, report, sections = await _extract(
+                text, seed, previous_id, priority, field_callback
+            )
+        # Results computed against another document (a near-duplicate seed or
+        # a prior version) depend on that document's current fields; only
+        # self-contained extractions are reused
+        if seed is None and not report.get("previous_id"):
+            await asyncio.to_thread(
+                extraction_cache.put, cache_key, fields, report, sections, signature
+            )
+
+    enter("persist")
+    doc_id = doc_id or str(uuid.uuid4())
+    doc = {
+        "_id": doc_id,
+        "filename": filename,
+        "file_hash": file_hash,
+        "fields": fields,
+        "extraction": report,
+        "status": "pending",
+        "created_at": datetime.utcnow()
+    }
+    if sections is not None:
+        doc["sections"] = sections
+    if report.get("previous_id") or previous_id:
+        doc["previous_version_id"] = report.get("previous_id") or previous_id
+    if near_duplicate:
+        doc["near_duplicate"] = near_duplicate
+    with metrics.stage("persist"):
+        # The insert is the commit point: what needs this run's state (the
+        # signature) is written before it, as an upsert, and what follows
+        # it can be redone from the stored document
+        if signature is not None:
+            await asyncio.to_thread(near_duplicate_index.add, doc_id, signature)
+        await documents.insert({**doc, "stats_pending": True})
+        await finish_persist(doc_id)
+        if index_search:
+            search_index.index_document(doc)
+
+    return {"id": doc_id, "fields": fields, "status": "pending"}
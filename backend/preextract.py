@@ -0,0 +1,256 @@
+"""
+Deterministic pre-extraction of pattern-shaped fields.
+
+Emails, phone numbers, NAICS / PSC codes, solicitation numbers, dates and
+dollar amounts are found with compiled regexes next to their usual labels
+("Solicitation Number:", "Proposals due", "Not to exceed", ...) and
+normalized (dates to YYYY-MM-DD, phones to (555) 555-5555, amounts to
+$1,500,000). gemini_client fills the confident ones directly and leaves
+them out of the model's template.
+
+Each hit comes with a confidence:
+  - 0.95: found next to its label, one distinct value
+  - 0.5:  several distinct candidates (e.g. original and amended due
+          dates), or an email only near a contact word, not after a
+          "Label:"; left to the model, which can read the context
+  - 0.3:  an email with no contact label at all (a vendor's, a help
+          desk's, ...); also left to the model
+"""
+import re
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Bump when patterns or normalizers change (part of the extractor fingerprint)
+PREEXTRACT_VERSION = 3
+
+LABELED = 0.95
+AMBIGUOUS = 0.5
+UNLABELED = 0.3
+
+Hit = Tuple[Any, float]
+
+# Label, then up to this many characters on the same line, then the value
+_GAP = r"[^\n]{0,40}?"
+
+_EMAIL = r"[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}"
+_PHONE = r"(?:\+?1[\s.-]?)?\(?\b\d{3}\)?[\s.-]?\d{3}[\s.-]\d{4}\b(?:\s*(?:x|ext\.?)\s*\d{1,6})?"
+_MONTH_NAMES = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?"
+_DATE = (
+    r"\d{4}-\d{1,2}-\d{1,2}"
+    r"|\d{1,2}/\d{1,2}/\d{2,4}"
+    rf"|{_MONTH_NAMES}\s+\d{{1,2}}(?:st|nd|rd|th)?,?\s+\d{{4}}"
+    rf"|\d{{1,2}}\s+{_MONTH_NAMES}\s+\d{{4}}"
+)
+_AMOUNT = r"\$\s?\d[\d,]*(?:\.\d+)?(?:\s*(?:million|billion|thousand|mm|[mbk])\b)?"
+
+_EMAIL_RE = re.compile(_EMAIL)
+_CONTACT_LABEL = r"(?:\be-?mail|\bcontact|contracting\s+officer|contract\s+specialist|point\s+of\s+contact|\bpoc\b)"
+# "Email: x@y.gov", "Contracting Officer - Jane Doe, x@y.gov": the label,
+# a separator, then the address on the same line
+_CONTACT_EMAIL_RE = re.compile(
+    rf"{_CONTACT_LABEL}[^\n:\-–—|]{{0,20}}?[:\-–—|]{_GAP}({_EMAIL})", re.I,
+)
+# Only near a contact word ("please contact x@y.gov", "email the CO at ...")
+_NEAR_CONTACT_EMAIL_RE = re.compile(rf"{_CONTACT_LABEL}{_GAP}({_EMAIL})", re.I)
+_PHONE_RE = re.compile(
+    rf"(?:phone|telephone|\btel\b\.?|\bph\b\.?){_GAP}({_PHONE})", re.I,
+)
+_NAICS_RE = re.compile(r"\bNAICS\b(?:\s+codes?)?" + _GAP + r"(\d{6}(?:\s*(?:,|/|;|and|or)\s*\d{6})*)", re.I)
+_PSC_RE = re.compile(
+    r"(?:\bPSC\b|product\s+(?:and\s+|&\s+)?service\s+codes?|commodity\s+codes?)"
+    + _GAP + r"\b([A-Z0-9]{4}(?:\s*(?:,|/|;|and|or)\s*[A-Z0-9]{4})*)\b",
+    re.I,
+)
+_SOLICITATION_RE = re.compile(
+    r"\b(?:solicitation|rfp|rfq|rfi|ifb|itb|bid)\s*(?:number|no\b\.?|#)\s*[:#.]?\s*"
+    r"((?=[A-Z0-9-]*\d)[A-Z0-9][A-Z0-9_./-]{3,40})",
+    re.I,
+)
+_DUE_DATE_RE = re.compile(
+    r"(?:(?:proposals?|responses?|offers?|bids?|quotes?|quotations?|submissions?|applications?)"
+    r"\s+(?:are\s+|must\s+be\s+)?(?:due|received\s+by)"
+    r"|(?<!questions\s)(?<!question\s)(?<!inquiries\s)\bdue\s+date"
+    r"|closing\s+date|response\s+date|submission\s+deadline"
+    r"|deadline\s+for\s+(?:proposals|submissions|offers|responses))"
+    + _GAP + rf"({_DATE})",
+    re.I,
+)
+_PUBLISH_DATE_RE = re.compile(
+    r"(?:issue\s+date|date\s+(?:of\s+)?issued?|issued\s+(?:on|date)|posted\s+(?:on|date)"
+    r"|publish(?:ed)?\s+(?:on|date)|release\s+date|posting\s+date)"
+    + _GAP + rf"({_DATE})",
+    re.I,
+)
+_CEILING_RE = re.compile(
+    r"(?:(?:contract\s+)?ceiling(?:\s+(?:value|amount|price))?|not[\s-]+to[\s-]+exceed|\bNTE\b"
+    r"|maximum\s+(?:contract\s+)?(?:value|amount)|total\s+contract\s+value)"
+    + _GAP + rf"({_AMOUNT})",
+    re.I,
+)
+_EXTENSION_RE = re.compile(r"\s*(?:x|ext\.?)\s*(\d+)$", re.I)
+_CODE_SPLIT_RE = re.compile(r"\s*(?:,|/|;|\band\b|\bor\b)\s*", re.I)
+_MONTHS = {m: i for i, m in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), 1)}
+_MULTIPLIERS = {"thousand": 1e3, "k": 1e3, "million": 1e6, "m": 1e6, "mm": 1e6,
+                "billion": 1e9, "b": 1e9}
+
+
+# ---------- normalizers ----------
+
+def normalize_date(text: str) -> Optional[str]:
+    """
+    "YYYY-MM-DD" for an ISO, US (M/D/YYYY) or written-out date; None if
+    it isn't a valid date.
+    """
+    text = text.strip().lower().replace(",", " ")
+    try:
+        if "-" in text:
+            year, month, day = (int(p) for p in text.split("-"))
+        elif "/" in text:
+            month, day, year = (int(p) for p in text.split("/"))
+            if year < 100:
+                year += 2000
+        else:
+            parts = text.replace(".", " ").split()
+            if parts[0].isdigit():
+                day, name, year = int(parts[0]), parts[1], int(parts[2])
+            else:
+                name, year = parts[0], int(parts[-1])
+                day = int(re.match(r"\d+", parts[1]).group())
+            month = _MONTHS[name[:3]]
+        return date(year, month, day).isoformat()
+    except (ValueError, KeyError, IndexError, AttributeError):
+        return None
+
+
+def normalize_phone(text: str) -> Optional[str]:
+    """
+    "(555) 555-5555", plus " x123" for an extension; None unless it is a
+    10-digit (NANP) number.
+    """
+    extension = _EXTENSION_RE.search(text)
+    digits = re.sub(r"\D", "", text[:extension.start()] if extension else text)
+    if len(digits) == 11 and digits[0] == "1":
+        digits = digits[1:]
+    if len(digits) != 10:
+        return None
+    phone = f"({digits[:3]}) {digits[3:6]}-{digits[6:]}"
+    return f"{phone} x{extension.group(1)}" if extension else phone
+
+
+def normalize_amount(text: str) -> Optional[str]:
+    """
+    "$1,500,000" for "$1.5 million", "$1,500,000.00", "$1.5M", ...
+    """
+    match = re.match(r"\$\s?([\d,]*\d(?:\.\d+)?)\s*([a-z]*)", text.strip().lower())
+    if not match:
+        return None
+    amount = float(match.group(1).replace(",", "")) * _MULTIPLIERS.get(match.group(2), 1)
+    cents = round(amount * 100) % 100
+    return f"${amount:,.2f}" if cents else f"${round(amount):,}"
+
+
+# ---------- extractors ----------
+
+def _pick(values: List[str], confidence: float) -> Optional[Hit]:
+    distinct = list(dict.fromkeys(v for v in values if v))
+    if not distinct:
+        return None
+    return distinct[0], confidence if len(distinct) == 1 else AMBIGUOUS
+
+
+def _labeled(pattern: "re.Pattern", normalize: Callable[[str], Optional[str]]) -> Callable[[str], Optional[Hit]]:
+    def extract(text: str) -> Optional[Hit]:
+        return _pick([normalize(m.group(1)) for m in pattern.finditer(text)], LABELED)
+    return extract
+
+
+def _codes(pattern: "re.Pattern", valid: Callable[[str], bool]) -> Callable[[str], Optional[Hit]]:
+    # Every labeled code counts: documents list several NAICS / PSC codes
+    def extract(text: str) -> Optional[Hit]:
+        codes: List[str] = []
+        for match in pattern.finditer(text):
+            codes += [c for c in _CODE_SPLIT_RE.split(match.group(1)) if valid(c)]
+        codes = list(dict.fromkeys(codes))
+        return (", ".join(codes), LABELED) if codes else None
+    return extract
+
+
+def _email(text: str) -> Optional[Hit]:
+    labeled = _pick([m.group(1).lower() for m in _CONTACT_EMAIL_RE.finditer(text)], LABELED)
+    if labeled is not None:
+        return labeled
+    near = _pick([m.group(1).lower() for m in _NEAR_CONTACT_EMAIL_RE.finditer(text)], AMBIGUOUS)
+    if near is not None:
+        return near
+    hit = _pick([m.group(0).lower() for m in _EMAIL_RE.finditer(text)], UNLABELED)
+    return (hit[0], UNLABELED) if hit is not None else None
+
+
+def _psc_code(code: str) -> bool:
+    # Case-insensitive matching also finds words like "code"; real codes
+    # are upper case and contain a digit
+    return len(code) == 4 and code == code.upper() and any(c.isdigit() for c in code)
+
+
+def _solicitation_number(text: str) -> Optional[str]:
+    return text.rstrip("./-_").upper() or None
+
+
+def _lines_with(text: str, lowered: Optional[str], keywords: Tuple[str, ...]) -> str:
+    """
+    The lines of `text` containing any of `keywords` (lower case), in
+    document order. Labels and values share a line, so the patterns only
+    need to run over these; finding them is a plain substring search.
+    """
+    if lowered is None:
+        return text
+    starts = set()
+    for keyword in keywords:
+        at = lowered.find(keyword)
+        while at != -1:
+            start = lowered.rfind("\n", 0, at) + 1
+            starts.add(start)
+            end = lowered.find("\n", at)
+            if end == -1:
+                break
+            at = lowered.find(keyword, end)
+    lines = []
+    for start in sorted(starts):
+        end = text.find("\n", start)
+        lines.append(text[start:] if end == -1 else text[start:end])
+    return "\n".join(lines)
+
+
+# field -> (keywords of its labels, extractor(candidate lines) -> (value, confidence) or None)
+EXTRACTORS: Dict[str, Tuple[Tuple[str, ...], Callable[[str], Optional[Hit]]]] = {
+    "solicitation_number": (("solicitation", "rfp", "rfq", "rfi", "ifb", "itb", "bid"),
+                            _labeled(_SOLICITATION_RE, _solicitation_number)),
+    "publish_date": (("issue", "posted", "publish", "release", "posting"),
+                     _labeled(_PUBLISH_DATE_RE, normalize_date)),
+    "due_date": (("due", "closing", "response date", "deadline", "received by"),
+                 _labeled(_DUE_DATE_RE, normalize_date)),
+    "naics_codes": (("naics",), _codes(_NAICS_RE, lambda c: c.isdigit() and len(c) == 6)),
+    "psc_commodity_codes": (("psc", "service code", "commodity code"), _codes(_PSC_RE, _psc_code)),
+    "contract_ceiling_value": (("ceiling", "exceed", "nte", "maximum", "total contract"),
+                               _labeled(_CEILING_RE, normalize_amount)),
+    "primary_contact_email": (("@",), _email),
+    "primary_contact_phone": (("phone", "tel", "ph"), _labeled(_PHONE_RE, normalize_phone)),
+}
+FIELDS = tuple(EXTRACTORS)
+
+
+def find_fields(text: str) -> Dict[str, Hit]:
+    """
+    {field: (value, confidence)} for every field of FIELDS found in `text`.
+    """
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        # A few characters change length when lower-cased; scan everything
+        lowered = None
+    hits = {}
+    for field, (keywords, extract) in EXTRACTORS.items():
+        hit = extract(_lines_with(text, lowered, keywords))
+        if hit is not None:
+            hits[field] = hit
+    return hits
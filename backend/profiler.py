@@ -0,0 +1,273 @@
+"""
+Opt-in sampling profiler for slow requests and extraction jobs.
+
+While at least one profiled unit of work (an HTTP request or a job) is in
+flight, a background thread samples the Python stacks of every thread
+each PROFILER_INTERVAL_MS. When nothing is profiled the thread is parked
+on an Event, so an idle server pays nothing; a disabled profiler
+(the default) is never started at all.
+
+Samples are process-wide: when units overlap, each gets the samples taken
+while it ran. Parsing happens in the parser process pool, which is not
+sampled; run with PARSER_WORKERS=0 to see pypdf / python-docx frames.
+
+The PROFILER_KEEP slowest profiles are kept in memory and can be
+downloaded as collapsed stacks (flamegraph.pl, speedscope) or as a
+speedscope JSON file from /admin/profiles.
+"""
+import heapq
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"
+# Units slower than this are kept (0 disables the threshold)
+PROFILER_SLOW_MS = float(os.getenv("PROFILER_SLOW_MS", "1000"))
+# Fraction of units that are kept whatever their duration
+PROFILER_SAMPLE_RATE = float(os.getenv("PROFILER_SAMPLE_RATE", "0"))
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+# How many of the slowest profiles are kept
+PROFILER_KEEP = int(os.getenv("PROFILER_KEEP", "20"))
+# Request paths that are never profiled (long-lived streams, the admin API)
+PROFILER_EXCLUDE_PATHS = tuple(
+    p for p in os.getenv("PROFILER_EXCLUDE_PATHS", "/admin/,/metrics,/jobs/").split(",") if p
+)
+
+# Leaf frames of threads that are only waiting; their samples are dropped
+_IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("periodic_executor.py", "_run"),
+}
+
+Stack = Tuple[str, ...]
+
+
+class Profile:
+    """
+    Samples collected for one unit of work.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name: str, keep: bool):
+        self.id = next(self._ids)
+        self.name = name
+        self.keep = keep
+        self.started_at = datetime.utcnow()
+        self.duration = 0.0
+        self.stacks: Counter = Counter()
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 1),
+            "samples": self.samples,
+        }
+
+    def collapsed(self) -> str:
+        """
+        Brendan Gregg's collapsed format: "root;...;leaf count" per line.
+        """
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def speedscope(self, interval_ms: float) -> Dict[str, Any]:
+        frames: Dict[str, int] = {}
+        samples, weights = [], []
+        for stack, count in self.stacks.items():
+            samples.append([frames.setdefault(name, len(frames)) for name in stack])
+            weights.append(count * interval_ms)
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "smartextract-profiler",
+            "shared": {"frames": [{"name": name} for name in frames]},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+
+class Profiler:
+    def __init__(self, enabled: bool = PROFILER_ENABLED, slow_ms: float = PROFILER_SLOW_MS,
+                 sample_rate: float = PROFILER_SAMPLE_RATE,
+                 interval_ms: float = PROFILER_INTERVAL_MS, keep: int = PROFILER_KEEP):
+        self.enabled = enabled
+        self.slow = slow_ms / 1000
+        self.sample_rate = sample_rate
+        self.interval_ms = interval_ms
+        self.keep = keep
+
+        self._lock = threading.Lock()
+        self._active: List[Profile] = []
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Min-heap of (duration, id, profile): the root is the first to drop
+        self._slowest: List[Tuple[float, int, Profile]] = []
+        # Formatting a frame is the expensive part; code objects are reused
+        self._names: Dict[Any, str] = {}
+
+    # ---------- sampling ----------
+
+    def _frame_name(self, code) -> str:
+        name = self._names.get(code)
+        if name is None:
+            name = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._names[code] = name
+        return name
+
+    def _sample(self) -> List[Stack]:
+        own = threading.get_ident()
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            leaf = frame.f_code
+            if (os.path.basename(leaf.co_filename), leaf.co_name) in _IDLE_LEAVES:
+                continue
+            names = []
+            while frame is not None:
+                names.append(self._frame_name(frame.f_code))
+                frame = frame.f_back
+            stacks.append(tuple(reversed(names)))
+        return stacks
+
+    def _run(self):
+        interval = self.interval_ms / 1000
+        while True:
+            self._wake.wait()
+            with self._lock:
+                active = list(self._active)
+                if not active:
+                    self._wake.clear()
+                    continue
+            stacks = self._sample()
+            # Under the lock: exports iterate `stacks` from request threads
+            with self._lock:
+                for profile in active:
+                    profile.stacks.update(stacks)
+            time.sleep(interval)
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+
+    # ---------- units of work ----------
+
+    def begin(self, name: str) -> Optional[Profile]:
+        """
+        Start profiling a unit of work; None when it is not a candidate.
+        With a latency threshold every unit is sampled (its duration is
+        not known up front) and only kept if it turns out slow.
+        """
+        if not self.enabled:
+            return None
+        kept_by_rate = random.random() < self.sample_rate
+        if not kept_by_rate and self.slow <= 0:
+            return None
+
+        profile = Profile(name, kept_by_rate)
+        with self._lock:
+            self._ensure_thread()
+            self._active.append(profile)
+        self._wake.set()
+        return profile
+
+    def end(self, profile: Optional[Profile], duration: float):
+        if profile is None:
+            return
+        profile.duration = duration
+        with self._lock:
+            self._active.remove(profile)
+            if not (profile.keep or (self.slow > 0 and duration >= self.slow)):
+                return
+            entry = (duration, profile.id, profile)
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, entry)
+            elif duration > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    @contextmanager
+    def profile(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        profile = self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(profile, time.perf_counter() - started)
+
+    # ---------- results ----------
+
+    def profiles(self) -> List[Dict[str, Any]]:
+        """
+        Kept profiles, slowest first.
+        """
+        with self._lock:
+            kept = sorted(self._slowest, key=lambda e: e[0], reverse=True)
+            return [profile.summary() for _, _, profile in kept]
+
+    def get(self, profile_id: int) -> Optional[Profile]:
+        with self._lock:
+            for _, _, profile in self._slowest:
+                if profile.id == profile_id:
+                    return profile
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._slowest.clear()
+
+    def export(self, profile: Profile, fmt: str) -> Tuple[str, str]:
+        """
+        (body, media type) of a profile in "collapsed" or "speedscope" format.
+        """
+        with self._lock:
+            if fmt == "speedscope":
+                return json.dumps(profile.speedscope(self.interval_ms)), "application/json"
+            return profile.collapsed(), "text/plain"
+
+
+class ProfilerMiddleware:
+    """
+    ASGI middleware profiling each request (see Profiler.begin).
+    """
+
+    def __init__(self, app, profiler: "Profiler"):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or path.startswith(PROFILER_EXCLUDE_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        with self.profiler.profile(f"{scope['method']} {path}"):
+            await self.app(scope, receive, send)
+
+
+profiler = Profiler()
@@ -0,0 +1,205 @@
+import asyncio
+import base64
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import pymongo
+
+import metrics
+from codec import CODEC_VERSION, decode_fields, encode_fields
+from database import MONGO_MAX_POOL_SIZE, MONGO_TIMEOUT_MS, documents_collection
+
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    """
+    Opaque pagination cursor pointing just past `doc`.
+    """
+    raw = json.dumps({"c": doc["created_at"].isoformat(), "i": str(doc["_id"])})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """
+    Inverse of encode_cursor; raises ValueError on a malformed cursor.
+    """
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(raw["c"]), raw["i"]
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def _projected_fields(projection: Optional[Dict[str, int]]) -> Optional[List[str]]:
+    # Extracted fields a projection asked for by name; None means all of them
+    if not projection:
+        return None
+    names = [k[len("fields."):] for k, v in projection.items() if k.startswith("fields.") and v]
+    return names or None
+
+
+class DocumentRepository:
+    """
+    Async data access for the documents collection.
+
+    pymongo is synchronous, so every operation runs on a dedicated thread
+    pool sized like the Mongo connection pool; round-trips overlap with
+    other requests instead of blocking the event loop. Each operation runs
+    under `pymongo.timeout`, so a slow database fails the call instead of
+    holding a thread forever.
+
+    The collection is injected, so the repository also works against
+    mongomock (`mongomock.MongoClient().db.documents`) in tests.
+    """
+
+    def __init__(self, collection, timeout_ms: int = MONGO_TIMEOUT_MS,
+                 max_workers: int = MONGO_MAX_POOL_SIZE):
+        self.collection = collection
+        self.timeout = timeout_ms / 1000
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="mongo"
+            )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _call(self, fn, *args, **kwargs):
+        with pymongo.timeout(self.timeout):
+            return fn(*args, **kwargs)
+
+    async def _run(self, fn, *args, **kwargs):
+        self.start()
+        loop = asyncio.get_running_loop()
+        with metrics.stage("db"):
+            return await loop.run_in_executor(
+                self._executor, functools.partial(self._call, fn, *args, **kwargs)
+            )
+
+    @staticmethod
+    def _out(doc: Optional[Dict[str, Any]],
+             projection: Optional[Dict[str, int]] = None) -> Optional[Dict[str, Any]]:
+        if doc is not None:
+            doc["_id"] = str(doc["_id"])
+            doc.pop("fields_codec", None)
+            doc.pop("stats_pending", None)
+            keys = _projected_fields(projection)
+            # Projected fields that were empty (so not stored) come back too
+            if "fields" in doc or keys is not None:
+                doc["fields"] = decode_fields(doc.get("fields") or {}, keys)
+        return doc
+
+    async def insert(self, doc: Dict[str, Any]) -> str:
+        # `doc` itself keeps the full fields; only the stored copy is encoded
+        stored = {**doc, "fields": encode_fields(doc["fields"]), "fields_codec": CODEC_VERSION}
+        await self._run(self.collection.insert_one, stored)
+        return doc["_id"]
+
+    async def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        return self._out(await self._run(self.collection.find_one, {"_id": doc_id}))
+
+    async def exists(self, doc_id: str) -> bool:
+        return await self._run(self.collection.find_one, {"_id": doc_id}, {"_id": 1}) is not None
+
+    async def latest(self) -> Optional[Dict[str, Any]]:
+        return self._out(await self._run(
+            self.collection.find_one, sort=[("created_at", -1)]
+        ))
+
+    async def page_by_status(
+        self,
+        status: str,
+        limit: int,
+        after: Optional[Tuple[datetime, str]] = None,
+        projection: Optional[Dict[str, int]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        One page of documents with `status`, newest first.
+
+        Keyset pagination on (created_at, _id): `after` is the position of
+        the last document of the previous page, so every page is an index
+        range scan no matter how deep the client pages.
+        """
+        query: Dict[str, Any] = {"status": status}
+        if after is not None:
+            created_at, last_id = after
+            query["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "_id": {"$lt": last_id}},
+            ]
+
+        def fetch():
+            cursor = self.collection.find(query, projection) \
+                .sort([("created_at", -1), ("_id", -1)]).limit(limit)
+            return list(cursor)
+
+        return [self._out(d, projection) for d in await self._run(fetch)]
+
+    async def by_section_hashes(self, hashes: List[str], limit: int) -> List[Dict[str, Any]]:
+        """
+        The newest `limit` documents sharing at least one section hash,
+        with only what incremental re-extraction needs.
+        """
+        projection = {"sections": 1, "fields.amendment_numbers_and_versions": 1}
+
+        def fetch():
+            cursor = self.collection.find(
+                {"sections.hash": {"$in": hashes}}, projection,
+            ).sort([("created_at", -1)]).limit(limit)
+            return list(cursor)
+
+        return [self._out(d, projection) for d in await self._run(fetch)]
+
+    async def _update(self, doc_id: str, update: Dict[str, Any],
+                      projection: Optional[Dict[str, int]]) -> Optional[Dict[str, Any]]:
+        # Atomically update and read back the document as it was before
+        return self._out(await self._run(
+            self.collection.find_one_and_update, {"_id": doc_id}, update,
+            projection=projection, return_document=pymongo.ReturnDocument.BEFORE,
+        ), projection)
+
+    async def take_stats_pending(self, doc_id: str,
+                                 projection: Optional[Dict[str, int]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Clear the `stats_pending` mark a document is inserted with. Returns
+        the document (limited to `projection`) if this call cleared it;
+        None if it was already cleared or there is no such document, so
+        only one caller ever applies its stats.
+        """
+        return self._out(await self._run(
+            self.collection.find_one_and_update,
+            {"_id": doc_id, "stats_pending": True}, {"$unset": {"stats_pending": ""}},
+            projection=projection, return_document=pymongo.ReturnDocument.BEFORE,
+        ), projection)
+
+    async def update_fields(self, doc_id: str, fields: Dict[str, Any],
+                            projection: Optional[Dict[str, int]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Replace the extracted fields. Returns the document as it was before
+        (limited to `projection`), or None if there is no such document.
+        """
+        update = {"$set": {"fields": encode_fields(fields), "fields_codec": CODEC_VERSION}}
+        return await self._update(doc_id, update, projection)
+
+    async def set_status(self, doc_id: str, status: str,
+                         projection: Optional[Dict[str, int]] = None,
+                         at: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """
+        Set the status; approving also records approved_at (`at`, default
+        now). Returns the document as it was before, like update_fields.
+        """
+        update: Dict[str, Any] = {"status": status}
+        if status == "approved":
+            update["approved_at"] = at or datetime.utcnow()
+        return await self._update(doc_id, {"$set": update}, projection)
+
+
+documents = DocumentRepository(documents_collection)
@@ -0,0 +1,79 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Very common words that carry no signal for field lookup
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or shall
+that the their this to was will with any all must may should not no
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-process Okapi BM25 index over a document's passages.
+
+    Postings are stored per term as NumPy arrays (passage ids, term
+    frequencies), so scoring a query is a handful of vectorized operations
+    per query term instead of a Python loop over passages. No external
+    service or vector DB is involved.
+    """
+
+    def __init__(self, passages: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.size = len(passages)
+
+        lengths = np.zeros(self.size, dtype=np.float32)
+        postings: Dict[str, List[List[int]]] = defaultdict(lambda: [[], []])
+        for i, passage in enumerate(passages):
+            counts = Counter(tokenize(passage))
+            lengths[i] = sum(counts.values())
+            for term, tf in counts.items():
+                postings[term][0].append(i)
+                postings[term][1].append(tf)
+
+        avg_length = float(lengths.mean()) if self.size else 0.0
+        # Per-passage length normalization, computed once
+        self._norm = self.k1 * (1 - self.b + self.b * lengths / max(avg_length, 1.0))
+
+        self._postings = {
+            term: (np.asarray(ids, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            for term, (ids, tfs) in postings.items()
+        }
+        self._idf = {
+            term: math.log(1 + (self.size - len(ids) + 0.5) / (len(ids) + 0.5))
+            for term, (ids, _) in self._postings.items()
+        }
+
+    def scores(self, query_terms: Iterable[str]) -> np.ndarray:
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(query_terms):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            ids, tfs = posting
+            scores[ids] += self._idf[term] * tfs * (self.k1 + 1) / (tfs + self._norm[ids])
+        return scores
+
+    def top_k(self, query: str, k: int) -> List[int]:
+        """
+        Ids of the `k` best passages for `query`, in document order.
+        Passages that match no query term are never returned.
+        """
+        scores = self.scores(tokenize(query))
+        k = min(k, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return []
+
+        best = np.argpartition(-scores, k - 1)[:k]
+        return sorted(int(i) for i in best)
@@ -0,0 +1,440 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from typing import Callable, Iterator, Optional
+
+from mapreduce import estimate_tokens
+
+# Priority lanes: lower value is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+# Provider quota (requests and tokens per minute)
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "300"))
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", "1000000"))
+# Adaptive concurrency bounds
+GEMINI_MIN_CONCURRENCY = int(os.getenv("GEMINI_MIN_CONCURRENCY", "1"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "32"))
+GEMINI_INITIAL_CONCURRENCY = int(os.getenv("GEMINI_INITIAL_CONCURRENCY", "4"))
+# Retries and timeouts
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "5"))
+GEMINI_BACKOFF_BASE_SECONDS = float(os.getenv("GEMINI_BACKOFF_BASE_SECONDS", "1"))
+GEMINI_BACKOFF_MAX_SECONDS = float(os.getenv("GEMINI_BACKOFF_MAX_SECONDS", "30"))
+GEMINI_CALL_TIMEOUT_SECONDS = float(os.getenv("GEMINI_CALL_TIMEOUT_SECONDS", "120"))
+# Expected response size, counted against the token budget up front
+GEMINI_EXPECTED_OUTPUT_TOKENS = int(os.getenv("GEMINI_EXPECTED_OUTPUT_TOKENS", "2000"))
+
+
+class ModelError(Exception):
+    pass
+
+
+class RateLimitError(ModelError):
+    """The provider rejected the call because of quota (HTTP 429)."""
+
+
+class TransientModelError(ModelError):
+    """Timeouts and 5xx errors: worth retrying."""
+
+
+class DeadlineExceeded(ModelError):
+    pass
+
+
+# =========================
+# Backends
+# =========================
+
+class ModelBackend:
+    """
+    Something that turns a prompt into response text.
+    Implementations raise RateLimitError / TransientModelError so the
+    scheduler can tell retryable failures apart.
+    """
+
+    name = "base"
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, timeout: float) -> Iterator[str]:
+        """
+        Yield the response text in chunks. Backends without streaming
+        support return the whole response as one chunk.
+        """
+        yield self.generate(prompt, timeout)
+
+    def warm(self):
+        """
+        Do any expensive one-time setup now rather than on the first call.
+        """
+
+
+class GeminiBackend(ModelBackend):
+    """
+    google.generativeai takes seconds to import, so it is only imported
+    (and configured) when the first call is made, or by warm().
+    """
+
+    name = "gemini"
+
+    def __init__(self, model_name: str, api_key: str):
+        self.model_name = model_name
+        self.api_key = api_key
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+
+                    genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def warm(self):
+        self.model
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        from google.api_core import exceptions as gexc
+
+        try:
+            response = self.model.generate_content(
+                prompt, request_options={"timeout": timeout}
+            )
+        except (gexc.ResourceExhausted, gexc.TooManyRequests) as e:
+            # Quota exhausted or plain HTTP 429: both mean "slow down"
+            raise RateLimitError(str(e)) from e
+        except (gexc.DeadlineExceeded, gexc.ServiceUnavailable,
+                gexc.InternalServerError) as e:
+            raise TransientModelError(str(e)) from e
+        return response.text
+
+    def stream(self, prompt: str, timeout: float) -> Iterator[str]:
+        from google.api_core import exceptions as gexc
+
+        try:
+            response = self.model.generate_content(
+                prompt, stream=True, request_options={"timeout": timeout}
+            )
+            for chunk in response:
+                yield chunk.text
+        except (gexc.ResourceExhausted, gexc.TooManyRequests) as e:
+            # Quota exhausted or plain HTTP 429: both mean "slow down"
+            raise RateLimitError(str(e)) from e
+        except (gexc.DeadlineExceeded, gexc.ServiceUnavailable,
+                gexc.InternalServerError) as e:
+            raise TransientModelError(str(e)) from e
+
+
+class FakeBackend(ModelBackend):
+    """
+    Offline stand-in for Gemini with configurable latency and failures.
+
+    `respond(prompt)` builds the response text; by default an empty JSON
+    object (every field then comes back as "").
+
+    `distribution` shapes the per-call latency around `latency_seconds`:
+    "normal" (+- `jitter_seconds`), "lognormal" (median `latency_seconds`,
+    `jitter_seconds` is sigma; the long tail real model calls have),
+    "exponential" (mean `latency_seconds`) or "fixed".
+    """
+
+    DISTRIBUTIONS = ("normal", "lognormal", "exponential", "fixed")
+
+    name = "fake"
+
+    def __init__(self, latency_seconds: float = 0.2, jitter_seconds: float = 0.1,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 respond: Optional[Callable[[str], str]] = None,
+                 seed: Optional[int] = None, distribution: str = "normal"):
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.distribution = distribution
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.respond = respond or (lambda prompt: "{}")
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _latency(self) -> float:
+        if self.distribution == "lognormal":
+            return self.latency_seconds * self._random.lognormvariate(0.0, self.jitter_seconds)
+        if self.distribution == "exponential":
+            return self._random.expovariate(1.0 / self.latency_seconds) if self.latency_seconds > 0 else 0.0
+        if self.distribution == "fixed":
+            return self.latency_seconds
+        return max(0.0, self._random.gauss(self.latency_seconds, self.jitter_seconds))
+
+    def _call(self, timeout: float) -> float:
+        """
+        Roll latency and failures for one call; returns the latency.
+        Failures happen up front, before any text is produced.
+        """
+        with self._lock:
+            self.calls += 1
+            latency = self._latency()
+            roll = self._random.random()
+
+        if latency > timeout:
+            time.sleep(timeout)
+            raise TransientModelError("fake model timed out")
+        if roll < self.rate_limit_rate:
+            raise RateLimitError("fake model: 429 quota exceeded")
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise TransientModelError("fake model: 503 unavailable")
+        return latency
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        time.sleep(self._call(timeout))
+        return self.respond(prompt)
+
+    def stream(self, prompt: str, timeout: float, chunks: int = 20) -> Iterator[str]:
+        # Same total latency as generate(), spread over the chunks
+        latency = self._call(timeout)
+        text = self.respond(prompt)
+        size = max(1, -(-len(text) // chunks))
+        for i in range(0, len(text), size):
+            time.sleep(latency / chunks)
+            yield text[i:i + size]
+
+
+# =========================
+# Scheduling primitives
+# =========================
+
+class TokenBucket:
+    """
+    Refills continuously at `per_minute / 60` units per second, up to
+    one minute's worth of burst.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.available = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Seconds until `amount` units are available (0 if they are now).
+        Requests larger than the capacity only wait for a full bucket.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+
+class AIMDLimiter:
+    """
+    Additive-increase / multiplicative-decrease concurrency limit:
+    +1 per window of successful calls, halved on every rate-limit error.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(min(max(initial, minimum), maximum))
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def on_rate_limited(self):
+        self.limit = max(self.minimum, self.limit / 2)
+
+
+class ModelScheduler:
+    """
+    Single gateway for all model calls.
+
+    - requests/min and tokens/min are enforced by token buckets,
+    - the number of concurrent calls follows an AIMD limit,
+    - waiting calls are served by priority lane, then arrival order,
+    - rate-limit and transient errors are retried with jittered
+      exponential backoff,
+    - every call has a deadline covering queueing, retries and the call.
+    """
+
+    def __init__(self, backend: ModelBackend,
+                 rpm: float = GEMINI_RPM, tpm: float = GEMINI_TPM,
+                 initial_concurrency: int = GEMINI_INITIAL_CONCURRENCY,
+                 min_concurrency: int = GEMINI_MIN_CONCURRENCY,
+                 max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+                 max_retries: int = GEMINI_MAX_RETRIES,
+                 backoff_base: float = GEMINI_BACKOFF_BASE_SECONDS,
+                 backoff_max: float = GEMINI_BACKOFF_MAX_SECONDS,
+                 call_timeout: float = GEMINI_CALL_TIMEOUT_SECONDS):
+        self.backend = backend
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.limiter = AIMDLimiter(initial_concurrency, min_concurrency, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.call_timeout = call_timeout
+
+        self.in_flight = 0
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.errors = 0
+
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._seq = itertools.count()
+        self._random = random.Random()
+
+    def _acquire(self, priority: int, cost: int, deadline: float):
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise DeadlineExceeded("Timed out waiting for a model slot")
+
+                    wait = remaining
+                    if self._waiting[0] == ticket and self.in_flight < int(self.limiter.limit):
+                        bucket_wait = max(self.requests.wait_time(1), self.tokens.wait_time(cost))
+                        if bucket_wait == 0:
+                            self.requests.consume(1)
+                            self.tokens.consume(cost)
+                            self.in_flight += 1
+                            self.calls += 1
+                            return
+                        wait = min(wait, bucket_wait)
+
+                    self._cond.wait(wait)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                # The next caller in line may be able to go now
+                self._cond.notify_all()
+
+    def _release(self, outcome: str):
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == "ok":
+                self.limiter.on_success()
+            elif outcome == "rate_limited":
+                self.rate_limited += 1
+                self.limiter.on_rate_limited()
+            elif outcome == "error":
+                self.errors += 1
+            self._cond.notify_all()
+
+    def _backoff(self, attempt: int, deadline: float):
+        # "Full jitter": uniform in [0, min(max, base * 2^attempt)]
+        delay = self._random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if time.monotonic() + delay >= deadline:
+            raise DeadlineExceeded("Model call deadline exceeded while retrying")
+        with self._cond:
+            self.retries += 1
+        time.sleep(delay)
+
+    def _deadline(self, deadline_seconds: Optional[float]) -> float:
+        return time.monotonic() + (deadline_seconds or self.call_timeout * (self.max_retries + 1))
+
+    def generate(self, prompt: str, priority: int = PRIORITY_INTERACTIVE,
+                 deadline_seconds: Optional[float] = None) -> str:
+        """
+        Send `prompt` to the backend and return the response text.
+        Raises DeadlineExceeded, or the last ModelError once retries run out.
+        """
+        deadline = self._deadline(deadline_seconds)
+        cost = estimate_tokens(prompt) + GEMINI_EXPECTED_OUTPUT_TOKENS
+
+        attempt = 0
+        while True:
+            self._acquire(priority, cost, deadline)
+            timeout = min(self.call_timeout, deadline - time.monotonic())
+            outcome = "error"
+            try:
+                text = self.backend.generate(prompt, timeout=max(timeout, 0.001))
+                outcome = "ok"
+                return text
+            except RateLimitError:
+                outcome = "rate_limited"
+                if attempt >= self.max_retries:
+                    raise
+            except TransientModelError:
+                if attempt >= self.max_retries:
+                    raise
+            finally:
+                self._release(outcome)
+
+            self._backoff(attempt, deadline)
+            attempt += 1
+
+    def stream(self, prompt: str, priority: int = PRIORITY_INTERACTIVE,
+               deadline_seconds: Optional[float] = None) -> Iterator[str]:
+        """
+        Like generate(), but yields the response text in chunks as the
+        backend produces them. Failures before the first chunk are retried
+        like in generate(); once text has been yielded, errors propagate.
+        """
+        deadline = self._deadline(deadline_seconds)
+        cost = estimate_tokens(prompt) + GEMINI_EXPECTED_OUTPUT_TOKENS
+
+        attempt = 0
+        while True:
+            self._acquire(priority, cost, deadline)
+            timeout = min(self.call_timeout, deadline - time.monotonic())
+            outcome = "error"
+            started = False
+            try:
+                for chunk in self.backend.stream(prompt, timeout=max(timeout, 0.001)):
+                    started = True
+                    yield chunk
+                outcome = "ok"
+                return
+            except GeneratorExit:
+                # The consumer stopped reading; not the model's fault
+                outcome = "aborted"
+                raise
+            except RateLimitError:
+                outcome = "rate_limited"
+                if started or attempt >= self.max_retries:
+                    raise
+            except TransientModelError:
+                if started or attempt >= self.max_retries:
+                    raise
+            finally:
+                self._release(outcome)
+
+            self._backoff(attempt, deadline)
+            attempt += 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                "backend": self.backend.name,
+                "in_flight": self.in_flight,
+                "waiting": len(self._waiting),
+                "concurrency_limit": round(self.limiter.limit, 2),
+                "calls": self.calls,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "errors": self.errors,
+            }
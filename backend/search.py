@@ -0,0 +1,242 @@
+import bisect
+import heapq
+import math
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from codec import decode_fields
+from retrieval import tokenize
+
+# Extracted fields that are searchable, with their ranking weight
+SEARCH_FIELDS: Dict[str, float] = {
+    "title": 3.0,
+    "solicitation_number": 3.0,
+    "solicitation_id": 2.0,
+    "agency": 2.0,
+    "naics_codes": 2.0,
+    "psc_commodity_codes": 2.0,
+    "category": 1.5,
+    "procurement_type": 1.5,
+    "reference_numbers": 1.5,
+    "primary_contact_name": 1.0,
+    "scope_text": 1.0,
+    "deliverables": 0.5,
+}
+# Fields that can be used as exact-match filters (?agency=...)
+FILTER_FIELDS = ("agency", "procurement_type", "category")
+# Prefix matching: shortest prefix that expands, and how many terms it may expand to
+MIN_PREFIX_LENGTH = 3
+MAX_PREFIX_EXPANSIONS = 20
+
+
+def _text(value: Any) -> str:
+    if isinstance(value, list):
+        return " ".join(str(v) for v in value)
+    return "" if value is None else str(value)
+
+
+def _norm(value: Any) -> str:
+    return " ".join(_text(value).split()).casefold()
+
+
+class SearchIndex:
+    """
+    In-memory inverted index over the searchable extracted fields.
+
+    postings: term -> {doc_id: weighted term frequency}. The vocabulary is
+    also kept sorted, so prefix queries are a bisect plus a short scan.
+    Each document's display/filter values are kept next to the index, so a
+    search never touches Mongo.
+
+    The index lives in the API process: it is rebuilt from Mongo at
+    startup and then updated incrementally on upload, edit and approve.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._vocabulary: List[str] = []
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._meta: Dict[str, Dict[str, Any]] = {}
+
+    def __len__(self):
+        return len(self._meta)
+
+    # ---------- updates ----------
+
+    def index_document(self, doc: Dict[str, Any]):
+        """
+        Add or replace a document (needs _id, filename, status, fields).
+        """
+        doc_id = str(doc["_id"])
+        fields = doc.get("fields") or {}
+
+        weights: Dict[str, float] = defaultdict(float)
+        for name, weight in SEARCH_FIELDS.items():
+            for term in tokenize(_text(fields.get(name))):
+                weights[term] += weight
+        for term in tokenize(doc.get("filename") or ""):
+            weights[term] += 1.0
+
+        meta = {
+            "_id": doc_id,
+            "filename": doc.get("filename"),
+            "status": doc.get("status"),
+            "title": _text(fields.get("title")),
+            "agency": _text(fields.get("agency")),
+            "due_date": _text(fields.get("due_date")),
+            "filters": {name: _norm(fields.get(name)) for name in FILTER_FIELDS},
+        }
+
+        with self._lock:
+            self._remove(doc_id)
+            for term, weight in weights.items():
+                posting = self._postings[term]
+                if not posting:
+                    bisect.insort(self._vocabulary, term)
+                posting[doc_id] = weight
+            self._doc_terms[doc_id] = list(weights)
+            self._meta[doc_id] = meta
+
+    def update_fields(self, doc_id: str, fields: Dict[str, Any]):
+        meta = self._meta.get(doc_id)
+        if meta is None:
+            return
+        self.index_document({
+            "_id": doc_id,
+            "filename": meta["filename"],
+            "status": meta["status"],
+            "fields": fields,
+        })
+
+    def set_status(self, doc_id: str, status: str):
+        with self._lock:
+            if doc_id in self._meta:
+                self._meta[doc_id]["status"] = status
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        for term in self._doc_terms.pop(doc_id, []):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(doc_id, None)
+            if not posting:
+                del self._postings[term]
+                i = bisect.bisect_left(self._vocabulary, term)
+                if i < len(self._vocabulary) and self._vocabulary[i] == term:
+                    del self._vocabulary[i]
+        self._meta.pop(doc_id, None)
+
+    def rebuild(self, docs: Iterable[Dict[str, Any]]):
+        with self._lock:
+            self._postings.clear()
+            self._vocabulary.clear()
+            self._doc_terms.clear()
+            self._meta.clear()
+        for doc in docs:
+            self.index_document(doc)
+
+    # ---------- queries ----------
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        terms = []
+        i = bisect.bisect_left(self._vocabulary, prefix)
+        while i < len(self._vocabulary) and len(terms) < MAX_PREFIX_EXPANSIONS:
+            term = self._vocabulary[i]
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+            i += 1
+        return terms
+
+    def search(self, query: str, status: Optional[str] = None,
+               filters: Optional[Dict[str, str]] = None,
+               prefix: bool = True, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Ranked search. Every query term must match (AND); with `prefix`,
+        the last term also matches longer words ("constr" -> "construction").
+        `filters` are exact (case-insensitive) matches on FILTER_FIELDS.
+        """
+        terms = tokenize(query)
+        wanted = {k: _norm(v) for k, v in (filters or {}).items() if v}
+
+        with self._lock:
+            total = max(len(self._meta), 1)
+            scores: Optional[Dict[str, float]] = None
+
+            for i, term in enumerate(terms):
+                expanded = [term]
+                if prefix and i == len(terms) - 1 and len(term) >= MIN_PREFIX_LENGTH:
+                    expanded = self._expand_prefix(term) or [term]
+
+                term_scores: Dict[str, float] = defaultdict(float)
+                for t in expanded:
+                    posting = self._postings.get(t, {})
+                    if not posting:
+                        continue
+                    idf = math.log(1 + total / len(posting))
+                    if scores is not None and len(scores) < len(posting):
+                        # AND with a smaller candidate set: probe instead of scan
+                        matches = ((d, posting[d]) for d in scores if d in posting)
+                    else:
+                        matches = posting.items()
+                    for doc_id, weight in matches:
+                        term_scores[doc_id] += idf * weight / (weight + 1.0)
+
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {d: s + term_scores[d] for d, s in scores.items() if d in term_scores}
+                if not scores:
+                    return []
+
+            if scores is None:
+                # No query text: filter-only listing
+                scores = {doc_id: 0.0 for doc_id in self._meta}
+
+            def keep(doc_id: str) -> bool:
+                meta = self._meta[doc_id]
+                if status and meta["status"] != status:
+                    return False
+                return all(meta["filters"].get(k) == v for k, v in wanted.items())
+
+            best = heapq.nsmallest(
+                limit,
+                ((-score, doc_id) for doc_id, score in scores.items() if keep(doc_id)),
+            )
+
+            results = []
+            for neg_score, doc_id in best:
+                meta = self._meta[doc_id]
+                results.append({
+                    "_id": doc_id,
+                    "filename": meta["filename"],
+                    "status": meta["status"],
+                    "title": meta["title"],
+                    "agency": meta["agency"],
+                    "due_date": meta["due_date"],
+                    "score": round(-neg_score, 4),
+                })
+
+            return results
+
+
+def rebuild_from(collection, index: Optional[SearchIndex] = None):
+    """
+    (Re)build the index from every document in `collection`.
+    """
+    index = index or search_index
+    projection = {"filename": 1, "status": 1}
+    projection.update({f"fields.{name}": 1 for name in set(SEARCH_FIELDS) | set(FILTER_FIELDS) | {"due_date"}})
+    index.rebuild(
+        {**doc, "fields": decode_fields(doc.get("fields") or {}, [])}
+        for doc in collection.find({}, projection)
+    )
+
+
+search_index = SearchIndex()
@@ -0,0 +1,93 @@
+import hashlib
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+from mapreduce import CHARS_PER_TOKEN, chunk_text, estimate_tokens
+
+# Lines that start a new section of a solicitation:
+#   "SECTION C - DESCRIPTION/SPECIFICATIONS", "Attachment 3 Wage Determination",
+#   "C.4 Deliverables", "3.2 Period of Performance", "STATEMENT OF WORK"
+_MARKER = re.compile(r"^(section|part|article|attachment|exhibit|appendix|amendment)\s+[a-z0-9]+\b", re.I)
+_NUMBERED = re.compile(r"^([A-Z]\.)?\d+(\.\d+)*\.?\s+[A-Z]")
+
+
+def _is_heading(line: str) -> bool:
+    line = line.strip()
+    if not 3 <= len(line) <= 90 or line.endswith((".", ",", ";", ":")):
+        return False
+    if _MARKER.match(line) or _NUMBERED.match(line):
+        return True
+    return line.isupper() and sum(c.isalpha() for c in line) >= 4
+
+
+def section_hash(text: str, salt: str = "") -> str:
+    """
+    Content hash of one section. Whitespace is normalized first, so
+    re-flowed or re-paginated text hashes the same. `salt` (the extractor
+    fingerprint) keeps hashes from different extraction setups apart.
+    """
+    normalized = " ".join(text.split())
+    return hashlib.sha256(f"{salt}\n{normalized}".encode("utf-8")).hexdigest()[:32]
+
+
+def split_sections(text: str, min_tokens: int, max_tokens: int,
+                   salt: str = "") -> List[Dict[str, Any]]:
+    """
+    Split document text into sections at heading lines.
+
+    Sections shorter than `min_tokens` are merged into the following ones
+    (a model call per two-line heading is not worth it); sections longer
+    than `max_tokens` are cut with chunk_text. Returns a list of
+    {"title", "text", "hash"} in document order.
+    """
+    raw: List[List[str]] = [[]]
+    for line in text.splitlines(keepends=True):
+        if _is_heading(line) and raw[-1]:
+            raw.append([])
+        raw[-1].append(line)
+
+    blocks: List[str] = []
+    pending: List[str] = []
+    # Characters in `pending`: its token estimate without joining it
+    pending_chars = 0
+    for lines in raw:
+        pending += lines
+        pending_chars += sum(map(len, lines))
+        if pending_chars // CHARS_PER_TOKEN + 1 >= min_tokens:
+            blocks.append("".join(pending))
+            pending, pending_chars = [], 0
+    current = "".join(pending)
+    if current.strip():
+        if blocks and estimate_tokens(current) < min_tokens:
+            blocks[-1] += current
+        else:
+            blocks.append(current)
+
+    sections = []
+    for block in blocks:
+        title = next((l.strip() for l in block.splitlines() if l.strip()), "")[:90]
+        pieces = chunk_text(block, max_tokens)
+        for i, piece in enumerate(pieces):
+            sections.append({
+                "title": title if len(pieces) == 1 else f"{title} (part {i + 1})",
+                "text": piece,
+                "hash": section_hash(piece, salt),
+            })
+
+    return sections
+
+
+def best_previous_version(hashes: List[str], candidates: Iterable[Dict[str, Any]],
+                          min_overlap: float) -> Optional[Dict[str, Any]]:
+    """
+    Pick the candidate document sharing the largest fraction of `hashes`
+    (at least `min_overlap`); newer candidates win ties.
+    """
+    wanted = set(hashes)
+    best, best_overlap = None, 0.0
+    for doc in candidates:
+        shared = wanted & {s["hash"] for s in doc.get("sections", [])}
+        overlap = len(shared) / max(len(wanted), 1)
+        if overlap > best_overlap:
+            best, best_overlap = doc, overlap
+    return best if best_overlap >= min_overlap else None
@@ -0,0 +1,222 @@
+"""
+Pre-aggregated statistics for the dashboard.
+
+A single document in the `stats` collection holds every counter /stats
+serves: documents by status, agency, procurement type and category,
+due dates by month, approvals by month and approval turnaround. Serving
+/stats is one find_one by _id, however many documents there are.
+
+The counters are kept up to date with one atomic $inc per upload, edit
+or approval (apply_change). Document writes and the stats update are
+separate operations. New documents are inserted marked `stats_pending`,
+and the upload that clears the mark applies their counters (see
+pipeline.finish_persist), so a retried job finishes what a crashed one
+left undone. Anything else a crash leaves off is recomputed from the
+documents collection with
+
+    python stats.py rebuild
+"""
+import re
+import sys
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import unquote
+
+from codec import decode_fields
+from database import db, documents_collection
+
+STATS_ID = "documents"
+# Fields whose values are counted one by one
+GROUPED_FIELDS = ("agency", "procurement_type", "category")
+# Longest value kept as a counter key; longer values are truncated
+MAX_KEY_CHARS = 120
+UNSPECIFIED = "unspecified"
+# Approval turnaround histogram: (bucket, upper bound in seconds)
+TURNAROUND_BUCKETS = (("1h", 3600), ("1d", 86400), ("1w", 7 * 86400), ("30d", 30 * 86400))
+# What apply_change needs to know about a document
+STATS_PROJECTION = {
+    "status": 1,
+    "created_at": 1,
+    "approved_at": 1,
+    "fields.due_date": 1,
+    **{f"fields.{field}": 1 for field in GROUPED_FIELDS},
+}
+
+_SPACE_RE = re.compile(r"\s+")
+_ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{1,2})-\d{1,2}\b")
+_US_DATE_RE = re.compile(r"\b(\d{1,2})/\d{1,2}/(\d{4})\b")
+_LONG_DATE_RE = re.compile(r"\b([A-Za-z]{3,9})\.?\s+\d{1,2}(?:st|nd|rd|th)?,?\s+(\d{4})\b")
+_MONTHS = {m: i for i, m in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), 1)}
+
+
+def _escape(key: str) -> str:
+    # Mongo field names can't contain "." or start with "$"; "%" is escaped
+    # first so that unquote() is an exact inverse
+    return key.replace("%", "%25").replace(".", "%2E").replace("$", "%24").replace("\x00", "")
+
+
+def _values(value: Any) -> List[str]:
+    """
+    Counter keys for a field value: one per list item, normalized.
+    """
+    items = value if isinstance(value, list) else [value]
+    keys = (_SPACE_RE.sub(" ", str(item or "")).strip()[:MAX_KEY_CHARS] for item in items)
+    return [k for k in dict.fromkeys(keys) if k] or [UNSPECIFIED]
+
+
+def due_month(value: Any) -> str:
+    """
+    "YYYY-MM" of a due date as the model writes it, or UNSPECIFIED.
+    """
+    if isinstance(value, list):
+        value = value[0] if value else ""
+    text = str(value or "")
+
+    iso, us, long = (r.search(text) for r in (_ISO_DATE_RE, _US_DATE_RE, _LONG_DATE_RE))
+    if iso:
+        year, month = int(iso.group(1)), int(iso.group(2))
+    elif us:
+        month, year = int(us.group(1)), int(us.group(2))
+    elif long:
+        month, year = _MONTHS.get(long.group(1)[:3].lower(), 0), int(long.group(2))
+    else:
+        return UNSPECIFIED
+
+    if not 1 <= month <= 12:
+        return UNSPECIFIED
+    return f"{year:04d}-{month:02d}"
+
+
+def _turnaround_bucket(seconds: float) -> str:
+    for name, bound in TURNAROUND_BUCKETS:
+        if seconds <= bound:
+            return name
+    return "more"
+
+
+def contributions(doc: Optional[Dict[str, Any]]) -> Counter:
+    """
+    Everything one document adds to the counters, as {dotted path: amount}.
+    """
+    counts: Counter = Counter()
+    if doc is None:
+        return counts
+    fields = doc.get("fields") or {}
+
+    counts["total"] += 1
+    counts[f"by_status.{_escape(doc.get('status') or UNSPECIFIED)}"] += 1
+    for field in GROUPED_FIELDS:
+        for value in _values(fields.get(field)):
+            counts[f"by_{field}.{_escape(value)}"] += 1
+    counts[f"due_month.{due_month(fields.get('due_date'))}"] += 1
+
+    approved_at, created_at = doc.get("approved_at"), doc.get("created_at")
+    if doc.get("status") == "approved" and approved_at is not None:
+        counts[f"approved_month.{approved_at:%Y-%m}"] += 1
+        if created_at is not None:
+            seconds = max((approved_at - created_at).total_seconds(), 0.0)
+            counts["turnaround.count"] += 1
+            counts["turnaround.total_seconds"] += seconds
+            counts[f"turnaround.buckets.{_turnaround_bucket(seconds)}"] += 1
+    return counts
+
+
+def _merge(into: Dict[str, Any], path: str, amount: float):
+    # "a.b.c" += amount, in a nested dict
+    *parents, leaf = path.split(".")
+    for part in parents:
+        into = into.setdefault(part, {})
+    into[leaf] = into.get(leaf, 0) + amount
+
+
+class DashboardStats:
+    """
+    The pre-aggregated stats document and its incremental updates.
+    """
+
+    def __init__(self, collection, source=documents_collection):
+        self.collection = collection
+        self.source = source
+
+    def apply_change(self, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]):
+        """
+        Move the counters from `before` to `after` (either may be None for
+        an insert / delete) in a single atomic update.
+        """
+        delta = contributions(after)
+        delta.subtract(contributions(before))
+        increments = {path: amount for path, amount in delta.items() if amount}
+        if not increments:
+            return
+        self.collection.update_one(
+            {"_id": STATS_ID},
+            {"$inc": increments, "$set": {"updated_at": datetime.utcnow()}},
+            upsert=True,
+        )
+
+    def rebuild(self) -> Dict[str, Any]:
+        """
+        Recompute every counter from the documents collection and replace
+        the stats document. Scans the whole collection; writes made while
+        it runs may be lost, so run it while uploads are paused.
+        """
+        stats: Dict[str, Any] = {}
+        # Every document is counted below; none is left to finish_persist
+        self.source.update_many({"stats_pending": True}, {"$unset": {"stats_pending": ""}})
+        for doc in self.source.find({}, STATS_PROJECTION):
+            doc["fields"] = decode_fields(doc.get("fields") or {}, [])
+            for path, amount in contributions(doc).items():
+                _merge(stats, path, amount)
+        stats.update({"_id": STATS_ID, "updated_at": datetime.utcnow(), "rebuilt_at": datetime.utcnow()})
+        self.collection.replace_one({"_id": STATS_ID}, stats, upsert=True)
+        return stats
+
+    def get(self, top: int = 20) -> Dict[str, Any]:
+        """
+        The counters as served by /stats. Grouped counts are sorted by
+        count and cut to the `top` largest (0 keeps all); their totals
+        are still over every document.
+        """
+        stats = self.collection.find_one({"_id": STATS_ID}) or {}
+
+        def group(name: str, limit: int = 0) -> Dict[str, int]:
+            items = sorted(((unquote(k), v) for k, v in (stats.get(name) or {}).items() if v),
+                           key=lambda item: (-item[1], item[0]))
+            return dict(items[:limit] if limit else items)
+
+        turnaround = stats.get("turnaround") or {}
+        count = turnaround.get("count", 0)
+        buckets = turnaround.get("buckets") or {}
+        return {
+            "total": stats.get("total", 0),
+            "by_status": group("by_status"),
+            **{f"by_{field}": group(f"by_{field}", top) for field in GROUPED_FIELDS},
+            "due_month": dict(sorted(group("due_month").items())),
+            "approved_month": dict(sorted(group("approved_month").items())),
+            "turnaround": {
+                "count": count,
+                "average_seconds": round(turnaround.get("total_seconds", 0) / count, 1) if count else None,
+                "buckets": {name: buckets.get(name, 0)
+                            for name in [b for b, _ in TURNAROUND_BUCKETS] + ["more"]},
+            },
+            "updated_at": stats.get("updated_at"),
+        }
+
+
+dashboard_stats = DashboardStats(db["stats"])
+
+
+def main(argv: Iterable[str]) -> int:
+    argv = list(argv)
+    if argv != ["rebuild"]:
+        print("usage: python stats.py rebuild")
+        return 2
+    stats = dashboard_stats.rebuild()
+    print(f"Rebuilt stats from {stats.get('total', 0)} documents")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,57 @@
+import io
+import itertools
+import os
+import sys
+
+import gridfs
+import mongomock
+import pytest
+
+# The backend modules are imported by name, like the app does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jobqueue import MongoJobQueue  # noqa: E402
+from repository import DocumentRepository  # noqa: E402
+
+
+class MemoryBucket:
+    """
+    The part of gridfs.GridFSBucket the job queue uses, in memory
+    (mongomock has no GridFS).
+    """
+
+    def __init__(self):
+        self.files = {}
+        self._ids = itertools.count()
+
+    def upload_from_stream(self, filename, source, metadata=None):
+        file_id = next(self._ids)
+        self.files[file_id] = source.read()
+        return file_id
+
+    def open_download_stream(self, file_id):
+        if file_id not in self.files:
+            raise gridfs.errors.NoFile(file_id)
+        return io.BytesIO(self.files[file_id])
+
+    def delete(self, file_id):
+        if self.files.pop(file_id, None) is None:
+            raise gridfs.errors.NoFile(file_id)
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+@pytest.fixture
+def repo(db):
+    repository = DocumentRepository(db["documents"], max_workers=2)
+    yield repository
+    repository.shutdown()
+
+
+@pytest.fixture
+def queue(db):
+    return MongoJobQueue(db["jobs"], MemoryBucket(), queue_size=3,
+                         lease_seconds=60, max_attempts=2)
@@ -0,0 +1,17 @@
+from bisect import bisect_right
+
+from extract import PageBuffer
+
+
+def test_page_buffer_assembles_pages_in_order_with_their_offsets():
+    buffer = PageBuffer(3)
+    # Shards finish in any order
+    buffer.add(2, "ccc")
+    buffer.add(0, "a")
+    buffer.add(1, "bb")
+
+    text = buffer.text()
+    offsets = buffer.offsets()
+    assert text == "a\nbb\nccc\n"
+    assert offsets == [0, 2, 5]
+    assert [bisect_right(offsets, pos) - 1 for pos in range(len(text))] == [0, 0, 1, 1, 1, 2, 2, 2, 2]
@@ -0,0 +1,172 @@
+import asyncio
+import io
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobqueue
+from ingest import spool
+from jobs import QueueFullError
+
+
+def _submit(queue, data=b"%PDF-1.4 test", filename="a.pdf", previous_id=None):
+    upload = spool(io.BytesIO(data), None)
+    job = asyncio.run(queue.submit(upload, filename, previous_id))
+    assert not os.path.exists(upload.path)
+    return job
+
+
+def _expire_lease(queue, job):
+    queue.collection.update_one(
+        {"_id": job["_id"]},
+        {"$set": {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}},
+    )
+
+
+def test_submit_stores_the_upload_and_queues_a_job(queue):
+    job = _submit(queue, b"payload", previous_id="prev")
+
+    record = queue.get(job.id)
+    assert record.status == "queued"
+    assert record.doc["previous_id"] == "prev"
+    assert [e["event"] for e in record.events] == ["queued"]
+    assert queue.open_upload(record.doc).read() == b"payload"
+    assert queue.stats() == {"queued": 1, "running": 0, "dead": 0}
+
+
+def test_submit_rejects_a_full_queue(queue):
+    for _ in range(queue.queue_size):
+        _submit(queue)
+    with pytest.raises(QueueFullError):
+        _submit(queue)
+    assert len(queue.bucket.files) == queue.queue_size
+
+
+def test_claim_leases_the_oldest_job(queue):
+    first, second = _submit(queue), _submit(queue)
+
+    job = queue.claim("w1")
+    assert job["_id"] == first.id
+    assert job["status"] == "running"
+    assert job["worker_id"] == "w1"
+    assert job["attempts"] == 1
+    assert job["lease_expires_at"] > datetime.utcnow()
+    assert queue.claim("w2")["_id"] == second.id
+    assert queue.claim("w3") is None
+
+
+def test_heartbeat_only_renews_our_own_lease(queue):
+    _submit(queue)
+    job = queue.claim("w1")
+    _expire_lease(queue, job)
+
+    assert queue.heartbeat(job, "w1")
+    assert queue.collection.find_one({"_id": job["_id"]})["lease_expires_at"] > datetime.utcnow()
+    assert not queue.heartbeat(job, "w2")
+    assert queue.claim("w2") is None
+
+
+def test_expired_lease_is_taken_over(queue):
+    _submit(queue)
+    stale = queue.claim("w1")
+    _expire_lease(queue, stale)
+
+    job = queue.claim("w2")
+    assert job["_id"] == stale["_id"]
+    assert job["attempts"] == 2
+    # The first worker has lost the job
+    assert not queue.heartbeat(stale, "w1")
+    assert not queue.publish(stale, "w1", [jobqueue.progress_event("stage", "parse")])
+    assert not queue.complete(stale, "w1", stale["_id"])
+    assert queue.complete(job, "w2", job["_id"])
+
+
+def test_failed_job_is_retried_after_a_back_off_then_dead_lettered(queue):
+    _submit(queue)
+    job = queue.claim("w1")
+
+    assert queue.fail(job, "w1", "boom") == "queued"
+    record = queue.get(job["_id"])
+    assert record.doc["visible_at"] > datetime.utcnow()
+    assert record.events[-1]["event"] == "retrying"
+    # Not visible before its back-off has passed
+    assert queue.claim("w1") is None
+
+    queue.collection.update_one({"_id": job["_id"]}, {"$set": {"visible_at": datetime.utcnow()}})
+    job = queue.claim("w1")
+    assert job["attempts"] == 2
+    assert queue.fail(job, "w1", "boom again") == "dead"
+
+    record = queue.get(job["_id"])
+    assert record.finished
+    assert record.to_dict()["status"] == "failed"
+    assert record.to_dict()["dead_letter"]
+    assert record.doc["error"] == "boom again"
+    assert queue.bucket.files == {}
+
+
+def test_job_whose_lease_expires_on_every_attempt_is_dead_lettered(queue):
+    _submit(queue)
+    for _ in range(queue.max_attempts):
+        _expire_lease(queue, queue.claim("w1"))
+
+    assert queue.claim("w1") is None
+    assert queue.stats() == {"queued": 0, "running": 0, "dead": 1}
+
+
+def test_complete_is_idempotent(queue):
+    _submit(queue)
+    job = queue.claim("w1")
+    assert queue.publish(job, "w1", [jobqueue.progress_event("stage", "parse")], "parse")
+
+    assert queue.complete(job, "w1", job["_id"])
+    assert not queue.complete(job, "w1", job["_id"])
+    assert not queue.fail(job, "w1", "late failure")
+
+    record = queue.get(job["_id"])
+    assert record.status == "done"
+    assert record.doc["document_id"] == job["_id"]
+    assert [e["event"] for e in record.events] == ["queued", "stage", "done"]
+    assert queue.bucket.files == {}
+
+
+def test_finished_after_pages_through_jobs_finished_at_the_same_time(queue):
+    at = datetime(2026, 1, 1)
+    for i in range(5):
+        queue.collection.insert_one({"_id": f"j{i}", "status": "done", "document_id": f"d{i}",
+                                     "finished_at": at + timedelta(milliseconds=i // 2)})
+    queue.collection.insert_one({"_id": "dead", "status": "dead", "finished_at": at})
+
+    seen, after = [], (at - timedelta(seconds=1), "")
+    while True:
+        page = queue.finished_after(after, limit=2)
+        if not page:
+            break
+        seen += [job["_id"] for job in page]
+        after = (page[-1]["finished_at"], page[-1]["_id"])
+
+    assert seen == ["j0", "j1", "j2", "j3", "j4"]
+
+
+def test_publish_keeps_only_the_latest_event_per_field(queue):
+    _submit(queue)
+    job = queue.claim("w1")
+    for value in ("draft", "final"):
+        assert queue.publish(job, "w1", [
+            jobqueue.progress_event("stage", "extract"),
+            jobqueue.progress_event("field", "extract", key="title", value=value),
+            jobqueue.progress_event("field", "extract", key="agency", value=value),
+        ], "extract")
+    queue.complete(job, "w1", job["_id"])
+
+    doc = queue.collection.find_one({"_id": job["_id"]})
+    assert [e["event"] for e in doc["events"]] == ["queued", "stage", "stage", "done"]
+    assert {key: e["value"] for key, e in doc["field_events"].items()} == {"title": "final", "agency": "final"}
+
+    async def replay():
+        return [chunk async for chunk in queue.events(queue.get(job["_id"]))]
+
+    stream = asyncio.run(replay())
+    assert sum(chunk.startswith("event: field") for chunk in stream) == 2
+    assert stream[-1].startswith("event: done")
@@ -0,0 +1,24 @@
+import gemini_client
+from preextract import LABELED, find_fields
+
+
+def test_labeled_contact_email_is_filled():
+    hits = find_fields("Contracting Officer: Jane Doe, Jane.Doe@agency.gov")
+    assert hits["primary_contact_email"] == ("jane.doe@agency.gov", LABELED)
+
+
+def test_email_near_a_contact_word_is_left_to_the_model():
+    value, confidence = find_fields("Please contact jane@agency.gov with questions.")["primary_contact_email"]
+    assert value == "jane@agency.gov"
+    assert confidence < gemini_client.PREEXTRACT_MIN_CONFIDENCE
+
+
+def test_lone_unlabeled_email_is_not_auto_filled():
+    text = "Send your resume to jobs@vendor.com"
+    value, confidence = find_fields(text)["primary_contact_email"]
+    assert value == "jobs@vendor.com"
+    assert confidence < gemini_client.PREEXTRACT_MIN_CONFIDENCE
+
+    filled, report = gemini_client._preextract(text)
+    assert "primary_contact_email" not in filled
+    assert report["fields"]["primary_contact_email"] == "low_confidence"
@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from gemini_client import JSON_TEMPLATE
+from repository import decode_cursor, encode_cursor
+
+
+def _doc(doc_id, status="pending", created_at=None, **fields):
+    return {
+        "_id": doc_id,
+        "filename": f"{doc_id}.pdf",
+        "status": status,
+        "fields": fields,
+        "created_at": created_at or datetime(2026, 1, 1),
+    }
+
+
+def test_insert_and_get_round_trip(repo, db):
+    fields = {"title": "Bridge repair", "naics_codes": ["237310"], "agency": "", "options": {}}
+    asyncio.run(repo.insert(_doc("a", **fields)))
+
+    stored = db["documents"].find_one({"_id": "a"})
+    assert stored["fields"] != fields  # encoded at rest
+    doc = asyncio.run(repo.get("a"))
+    # Every template key comes back, empty ones included
+    assert doc["fields"] == {**{key: "" for key in JSON_TEMPLATE}, **fields}
+    assert "fields_codec" not in doc
+    assert asyncio.run(repo.get("missing")) is None
+
+
+def test_exists(repo):
+    asyncio.run(repo.insert(_doc("a")))
+    assert asyncio.run(repo.exists("a"))
+    assert not asyncio.run(repo.exists("b"))
+
+
+def test_update_fields_returns_the_previous_version(repo):
+    asyncio.run(repo.insert(_doc("a", title="Old")))
+
+    before = asyncio.run(repo.update_fields("a", {"title": "New"}, {"fields.title": 1}))
+    assert before["fields"] == {"title": "Old"}
+    assert asyncio.run(repo.get("a"))["fields"]["title"] == "New"
+    assert asyncio.run(repo.update_fields("missing", {"title": "New"})) is None
+
+
+def test_set_status_approved_records_approved_at(repo):
+    asyncio.run(repo.insert(_doc("a")))
+    at = datetime(2026, 2, 3, 4, 5, 6)
+
+    before = asyncio.run(repo.set_status("a", "approved", {"status": 1}, at))
+    assert before["status"] == "pending"
+    doc = asyncio.run(repo.get("a"))
+    assert doc["status"] == "approved"
+    assert doc["approved_at"] == at
+
+
+def test_page_by_status_walks_every_document_once(repo):
+    start = datetime(2026, 1, 1)
+    # Pairs share a created_at, so pages must break ties on _id
+    for i in range(7):
+        asyncio.run(repo.insert(_doc(f"d{i}", "approved", start + timedelta(seconds=i // 2))))
+    asyncio.run(repo.insert(_doc("pending", "pending", start)))
+
+    seen, after = [], None
+    while True:
+        page = asyncio.run(repo.page_by_status("approved", 3, after, {"filename": 1, "created_at": 1}))
+        seen += [d["_id"] for d in page]
+        if len(page) < 3:
+            break
+        after = decode_cursor(encode_cursor(page[-1]))
+
+    assert seen == ["d6", "d5", "d4", "d3", "d2", "d1", "d0"]
+
+
+def test_decode_cursor_rejects_garbage():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_stats_pending_is_taken_once(repo):
+    asyncio.run(repo.insert({**_doc("a"), "stats_pending": True}))
+
+    assert asyncio.run(repo.get("a")).get("stats_pending") is None
+    taken = asyncio.run(repo.take_stats_pending("a", {"status": 1}))
+    assert taken["status"] == "pending"
+    assert asyncio.run(repo.take_stats_pending("a")) is None
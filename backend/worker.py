@@ -0,0 +1,216 @@
+"""
+Extraction worker for the Mongo job queue (JOB_BACKEND=mongo, see
+jobqueue.py).
+
+Claims jobs and runs them through the same parse -> extract -> persist
+pipeline as the in-process queue. Run as many as needed, on any host that
+reaches Mongo and the model API; extraction capacity then scales
+independently of the API processes:
+
+    python worker.py [--concurrency 4] [--id NAME]
+
+SIGTERM / Ctrl-C stop claiming and let running jobs finish. A worker
+that is killed outright keeps its leases until they expire, then its jobs
+are retried by the other workers.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import sys
+from typing import Any, Dict, List, Optional, Set
+
+from pymongo.errors import DuplicateKeyError
+
+import database
+from ingest import SpooledUpload, spool
+from jobqueue import JOB_POLL_SECONDS, MongoJobQueue, get_job_queue, progress_event
+from jobs import JOB_CONCURRENCY
+from parser_pool import parser_pool
+from pipeline import finish_persist, process_document
+from profiler import profiler
+from repository import documents
+
+# Progress events are written to the job document in batches, this often
+JOB_EVENT_FLUSH_SECONDS = float(os.getenv("JOB_EVENT_FLUSH_SECONDS", "0.25"))
+
+
+class JobProgress:
+    """
+    Progress events of one running job, buffered on the event loop and
+    written to its job document in batches.
+    """
+
+    def __init__(self, queue: MongoJobQueue, job: Dict[str, Any], worker_id: str):
+        self.queue = queue
+        self.job = job
+        self.worker_id = worker_id
+        self.stage: Optional[str] = None
+        self.pending: List[Dict[str, Any]] = [progress_event("started")]
+
+    def set_stage(self, stage: str):
+        self.stage = stage
+        self.pending.append(progress_event("stage", stage))
+
+    def set_field(self, key: str, value: Any):
+        self.pending.append(progress_event("field", self.stage, key=key, value=value))
+
+    async def flush(self) -> bool:
+        """
+        Write pending events; False when the job is no longer ours.
+        """
+        if not self.pending:
+            return True
+        events, self.pending = self.pending, []
+        return await asyncio.to_thread(
+            self.queue.publish, self.job, self.worker_id, events, self.stage
+        )
+
+
+class Worker:
+    def __init__(self, queue: Optional[MongoJobQueue] = None,
+                 concurrency: int = JOB_CONCURRENCY, worker_id: Optional[str] = None):
+        self.queue = queue or get_job_queue()
+        self.concurrency = concurrency
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self._stopping: Optional[asyncio.Event] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def run(self):
+        """
+        Claim and process jobs, at most `concurrency` at a time, until stop().
+        """
+        self._stopping = asyncio.Event()
+        slots = asyncio.Semaphore(self.concurrency)
+        while not self._stopping.is_set():
+            await slots.acquire()
+            job = None
+            if not self._stopping.is_set():
+                job = await asyncio.to_thread(self.queue.claim, self.worker_id)
+            if job is None:
+                slots.release()
+                # Nothing to do: wait a little, or until stop()
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self._process(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _process(self, job: Dict[str, Any]):
+        """
+        Run a claimed job, flushing its events and renewing its lease
+        meanwhile, then record the outcome. If the lease is lost (we were
+        too slow to renew it and another worker took over), the run is
+        abandoned without recording anything.
+        """
+        loop = asyncio.get_running_loop()
+        progress = JobProgress(self.queue, job, self.worker_id)
+        run = asyncio.create_task(self._run(job, progress))
+        heartbeat_every = self.queue.lease.total_seconds() / 3
+        last_heartbeat = loop.time()
+        try:
+            while not run.done():
+                await asyncio.wait({run}, timeout=JOB_EVENT_FLUSH_SECONDS)
+                owned = await progress.flush()
+                if owned and loop.time() - last_heartbeat >= heartbeat_every:
+                    owned = await asyncio.to_thread(self.queue.heartbeat, job, self.worker_id)
+                    last_heartbeat = loop.time()
+                if not owned:
+                    print(f"[{self.worker_id}] lost the lease on job {job['_id']}", flush=True)
+                    return
+        finally:
+            if not run.done():
+                run.cancel()
+
+        await progress.flush()
+        try:
+            document_id = run.result()
+        except Exception as e:
+            status = await asyncio.to_thread(self.queue.fail, job, self.worker_id, str(e))
+            print(f"[{self.worker_id}] job {job['_id']} failed ({status or 'lease lost'}): {e}",
+                  flush=True)
+        else:
+            await asyncio.to_thread(self.queue.complete, job, self.worker_id, document_id)
+
+    def _download(self, job: Dict[str, Any]) -> SpooledUpload:
+        stream = self.queue.open_upload(job)
+        try:
+            upload = spool(stream, max_bytes=None)
+        finally:
+            stream.close()
+        if upload.sha256 != job["sha256"]:
+            upload.remove()
+            raise RuntimeError("Stored upload does not match its hash")
+        return upload
+
+    async def _run(self, job: Dict[str, Any], progress: JobProgress) -> str:
+        job_id = job["_id"]
+        # An earlier attempt stored the document but died before finishing
+        # its persist or marking the job done
+        if await documents.exists(job_id):
+            await finish_persist(job_id)
+            return job_id
+
+        upload = await asyncio.to_thread(self._download, job)
+        try:
+            with profiler.profile(f"job {job['filename']}"):
+                result = await process_document(
+                    upload, job["filename"],
+                    on_stage=progress.set_stage, on_field=progress.set_field,
+                    previous_id=job.get("previous_id"), doc_id=job_id,
+                    index_search=False,
+                )
+        except DuplicateKeyError:
+            # A concurrent attempt of the same job stored it first
+            if await documents.exists(job_id):
+                await finish_persist(job_id)
+                return job_id
+            raise
+        finally:
+            upload.remove()
+        return result["id"]
+
+
+async def _serve(worker: Worker):
+    await asyncio.to_thread(database.connect)
+    documents.start()
+    parser_pool.start()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    print(f"[{worker.worker_id}] processing up to {worker.concurrency} jobs at a time", flush=True)
+    try:
+        await worker.run()
+    finally:
+        parser_pool.shutdown()
+        documents.shutdown()
+        database.close()
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python worker.py",
+                                     description="Process extraction jobs from the Mongo queue")
+    parser.add_argument("--concurrency", type=int, default=JOB_CONCURRENCY,
+                        help="jobs processed at the same time")
+    parser.add_argument("--id", help="worker name shown in job leases (default: host-pid)")
+    args = parser.parse_args(argv)
+
+    asyncio.run(_serve(Worker(concurrency=args.concurrency, worker_id=args.id)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))